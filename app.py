@@ -6,27 +6,45 @@ import base64
 import logging
 from datetime import datetime
 import asyncio
-import requests
+import hmac
+import time
+import random
+import httpx
 import websockets
-from io import BytesIO
+from urllib.parse import quote
+from collections import OrderedDict, deque
+from typing import NamedTuple
+import hashlib
+import contextlib
 from fastapi import Depends, Header, HTTPException
 
 
 from fastapi import FastAPI, WebSocket, Request, BackgroundTasks
-from fastapi.responses import JSONResponse, Response, StreamingResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 import openai
 from twilio.rest import Client
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 
+from media_relay import (
+    json_loads, twilio_media_payload, openai_audio_delta,
+    append_frame, str_field,
+    UplinkBatcher, Playout,
+)
+from callstate import CallStateBackend, backend_from_url
+import metrics
+import logpipe
+import greetings
+import ttscache
+import outbox
+import textnorm
+import polish
+import destindex
+from transcript import TranscriptBuilder
 
 
-import re
-from difflib import get_close_matches
 
-def _norm(text: str) -> str:
-    """lower-case, strip spaces, remove punctuation → for fuzzy compare"""
-    return re.sub(r"[^\w]", "", text or "").lower()
 
 
 
@@ -57,27 +75,14 @@ def normalise_voice(raw: str | None, default: str = "shimmer") -> str:
 
 
 # -------------------------------------------------------------------
-# GLOBAL LOGGING: dump EVERYTHING at DEBUG level
+# GLOBAL LOGGING: LOG_LEVEL / LOG_FORMAT / LOG_SAMPLE, written off-thread
 # -------------------------------------------------------------------
-logging.basicConfig(
-    level=logging.DEBUG,                 # was INFO
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    force=True                           # overrides any previous config
-)
-
+logpipe.setup()
 
 
 # ── Trim the binary-payload spam coming from websockets.client ─────────────
 noisy_logger = logging.getLogger("websockets.client")
-
-class _WsNoiseFilter(logging.Filter):
-    """Drop DEBUG lines that only show huge base-64 audio payloads."""
-    def filter(self, record: logging.LogRecord) -> bool:
-        msg = record.getMessage()
-        # keep PING/PONG and anything that isn’t the raw audio buffer
-        return '"input_audio_buffer.append"' not in msg
-
-noisy_logger.addFilter(_WsNoiseFilter())
+noisy_logger.addFilter(logpipe.WsFrameFilter())     # drops audio frames without formatting them
 # you can still re-enable full trace by changing to DEBUG at deploy time
 noisy_logger.setLevel(logging.INFO)          # INFO keeps connect/handshake lines
 
@@ -91,18 +96,158 @@ noisy_logger.setLevel(logging.INFO)          # INFO keeps connect/handshake line
 
 
 # ---------- CONCURRENCY-SAFE STATE ----------
-from typing import Dict, Any
+CALL_CONTEXT_TTL = int(os.getenv("CALL_CONTEXT_TTL", 120))   # s a context may wait for its media stream
+CALL_LIVE_TTL    = int(os.getenv("CALL_LIVE_TTL", 4 * 3600)) # s an attached call is kept in shared state
+REDIRECT_TTL     = int(os.getenv("REDIRECT_TTL", 3600))      # s a "call already redirected" claim lives
 
-# callSid  →  {prompt, streamSid, hostname, flags…}
-contexts: Dict[str, Any] = {}
+# "" = in-process (one worker);  redis://host:6379/0 or unix:///run/kal.sock
+# lets /incoming-call and /media-stream land on different workers / dynos
+CALL_STATE_URL = os.getenv("CALL_STATE_URL", "")
+call_state: CallStateBackend = backend_from_url(CALL_STATE_URL)
 
 
+async def _shared(op, *args, default=None):
+    """Run a call_state operation; a backend outage degrades to process-local state."""
+    try:
+        return await op(*args)
+    except Exception as exc:
+        logging.warning("[CALLSTATE] %s failed: %r", op.__name__, exc)
+        return default
 
 
+class CallRegistry:
+    """
+    callSid  →  {prompt, voice, hostname, phone, stream_sid …}
+
+    Explicit lifecycle instead of a dict that only ever grows:
+        create()   – /incoming-call
+        attach()   – media-stream `start` (creates the entry if this
+                     process never saw the webhook)
+        finalise() – media-stream teardown; the entry is gone
+    Contexts that never get a stream (caller hung up during <Play>) are
+    dropped by expire() after `ttl`.  A phone → {callSid} index makes
+    "any live call for this owner" an O(1) lookup.
+
+    With a shared `backend` the async variants carry the entry between
+    workers:  publish() after create(), adopt() instead of attach() (pulls
+    the entry another worker created), release() instead of finalise().
+    """
 
+    def __init__(self, ttl: float, backend: CallStateBackend):
+        self.ttl = ttl
+        self.backend = backend
+        self._by_sid: dict[str, dict]       = {}
+        self._by_phone: dict[str, set[str]] = {}
+        self._pending: OrderedDict          = OrderedDict()   # un-attached sid → created_at
+        self.created_total   = 0
+        self.finalised_total = 0
+        self.expired_total   = 0
+
+    def create(self, call_sid: str, **ctx) -> dict:
+        entry = self._by_sid.get(call_sid)
+        if entry is None:
+            entry = self._by_sid[call_sid] = {"call_sid": call_sid}
+            self.created_total += 1
+        self._index(call_sid, entry, ctx.get("phone"))
+        entry.update(ctx)
+        self._pending[call_sid] = time.monotonic()
+        return entry
+
+    def attach(self, call_sid: str, **ctx) -> dict:
+        entry = self._by_sid.get(call_sid) or self.create(call_sid)
+        self._index(call_sid, entry, ctx.get("phone"))
+        entry.update(ctx)
+        self._pending.pop(call_sid, None)
+        return entry
+
+    def get(self, call_sid: str | None) -> dict | None:
+        return self._by_sid.get(call_sid) if call_sid else None
+
+    def for_phone(self, phone: str | None) -> list[dict]:
+        return [self._by_sid[sid] for sid in self._by_phone.get(phone, ())] if phone else []
+
+    def finalise(self, call_sid: str | None) -> dict | None:
+        entry = self._by_sid.pop(call_sid, None) if call_sid else None
+        if entry is None:
+            return None
+        self._pending.pop(call_sid, None)
+        self._unindex(call_sid, entry.get("phone"))
+        self.finalised_total += 1
+        return entry
+
+    # ── shared-state variants ───────────────────────────────────────
+    async def publish(self, call_sid: str) -> None:
+        entry = self._by_sid.get(call_sid)
+        if entry is None or not self.backend.shared:
+            return
+        ttl = self.ttl if call_sid in self._pending else CALL_LIVE_TTL
+        await _shared(self.backend.set, f"call:{call_sid}", entry, ttl)
+
+    async def adopt(self, call_sid: str, **ctx) -> dict:
+        if call_sid not in self._by_sid and self.backend.shared:
+            remote = await _shared(self.backend.get, f"call:{call_sid}")
+            if remote:
+                remote.pop("call_sid", None)
+                self.create(call_sid, **remote)
+        entry = self.attach(call_sid, **ctx)
+        await self.publish(call_sid)
+        return entry
+
+    async def release(self, call_sid: str | None) -> dict | None:
+        entry = self.finalise(call_sid)
+        if call_sid and self.backend.shared:
+            await _shared(self.backend.delete, f"call:{call_sid}")
+        return entry
+
+    async def claim_redirect(self, call_sid: str) -> bool:
+        """True for exactly one caller per call across every worker (fails open)."""
+        return await _shared(
+            self.backend.set_if_absent, f"redirect:{call_sid}", {"at": time.time()}, REDIRECT_TTL,
+            default=True,
+        )
 
+    async def unclaim_redirect(self, call_sid: str) -> None:
+        await _shared(self.backend.delete, f"redirect:{call_sid}")
+
+    def expire(self) -> int:
+        """Drop contexts that waited longer than `ttl` for a media stream."""
+        cutoff, n = time.monotonic() - self.ttl, 0
+        while self._pending:
+            sid, created = next(iter(self._pending.items()))
+            if created > cutoff:
+                break
+            self._pending.popitem(last=False)
+            entry = self._by_sid.pop(sid, None)
+            if entry is not None:
+                self._unindex(sid, entry.get("phone"))
+                n += 1
+        self.expired_total += n
+        return n
+
+    def _index(self, call_sid: str, entry: dict, phone: str | None) -> None:
+        if phone and phone != entry.get("phone"):
+            self._unindex(call_sid, entry.get("phone"))
+            self._by_phone.setdefault(phone, set()).add(call_sid)
+
+    def _unindex(self, call_sid: str, phone: str | None) -> None:
+        sids = self._by_phone.get(phone)
+        if sids is not None:
+            sids.discard(call_sid)
+            if not sids:
+                del self._by_phone[phone]
+
+    def stats(self) -> dict:
+        return {
+            "live":      len(self._by_sid),             # attached + pending
+            "pending":   len(self._pending),            # still waiting for /media-stream
+            "attached":  len(self._by_sid) - len(self._pending),
+            "created":   self.created_total,
+            "finalised": self.finalised_total,
+            "expired":   self.expired_total,
+        }
 
 
+calls = CallRegistry(CALL_CONTEXT_TTL, call_state)
 
 
 
@@ -114,119 +259,18 @@ contexts: Dict[str, Any] = {}
 
 
 
-# ======================================================================
-#  ULTRA-POLISH TRANSCRIPT REBUILDER
-#  Goal: perfect USER / AI turns, no stutters, no duplicates, sentences
-#        end with punctuation, and “It seems like It seems like” is gone.
-# ======================================================================
-import re, unicodedata, itertools, string, difflib
 
-_END     = set(".!?。！？")                     # sentence stops
-_PUNCT   = str.maketrans("", "", string.punctuation + "。、「」、．，！？」’“”’")
-_RE_SPC  = re.compile(r"\s+")
-_STUTTER = re.compile(r'\b(\w{1,4})( \1\b)+', flags=re.I)          # he he he
 
-def _norm(txt: str) -> str:
-    folded = unicodedata.normalize("NFKD", txt).encode("ascii","ignore").decode()
-    folded = folded.translate(_PUNCT).lower()
-    return _RE_SPC.sub(" ", folded).strip()
 
-def _collapse_stutter(txt: str) -> str:
-    """
-    Remove single-word or 2–3-word stutters inside one sentence:
-       'It seems like it seems like' → 'It seems like'AAAAAAAAAA
-    """
-    # step once for 1-word loops (‘the the’)
-    txt = _STUTTER.sub(r'\1', txt)
-
-    # step again for 2–3-word loops
-    seq_pat = re.compile(r'\b((?:\w+\s+){1,3}\w+)(?:\s+\1\b)+', flags=re.I)
-    return seq_pat.sub(r'\1', txt)
-
-def _merge(lines):
-    """join consecutive chunks from same speaker & stitch until sentence end"""
-    out, buf, cur_spk = [], "", None
-    for seg in lines:
-        spk, piece = seg["speaker"], seg["text"].strip()
-        if not piece:
-            continue
-        if spk != cur_spk:
-            if buf:
-                out.append({"speaker": cur_spk, "text": buf.strip()})
-            cur_spk, buf = spk, piece
-        else:
-            buf += " " + piece
-        if buf and buf[-1] in _END:
-            out.append({"speaker": cur_spk, "text": buf.strip()})
-            buf = ""
-    if buf:
-        out.append({"speaker": cur_spk, "text": buf.strip()})
-    return out
 
-def _dedupe(lines, thresh=0.90):
-    """drop near-duplicate utterances, keep the longer copy"""
-    buckets, cleaned = {"user":[], "ai":[]}, []
-    for seg in lines:
-        cand  = seg["text"]
-        canon = _norm(cand)
-        bucket = buckets[seg["speaker"]]
-        dupe = next((old for old in bucket
-                     if difflib.SequenceMatcher(None, canon, _norm(old["text"])).ratio()>=thresh),
-                    None)
-        if dupe:
-            if len(cand) > len(dupe["text"]):
-                dupe["text"] = cand
-        else:
-            bucket.append(seg)
-            cleaned.append(seg)
-    # ---------------------------------------------------------------
-    # 4) sanity-check the ends:
-    #    • if the very first fragment came from the AI, it was
-    #      almost certainly the answer to the *preceding* question
-    #      (the caller spoke first, it was transcribed a hair later).
-    #      In that case we drop that opening AI line so the dialog
-    #      always starts with the USER.
-    #    • if the very last fragment is from the USER (the caller
-    #      hung up before the AI could reply), drop that dangling
-    #      question so we don’t finish on an unanswered line.
-    # ---------------------------------------------------------------
-    if len(cleaned) >= 2 and cleaned[0]["speaker"] == "ai" and cleaned[1]["speaker"] == "user":
-        # rotate left: move the leading AI answer *after* its question
-        cleaned = cleaned[1:] + cleaned[:1]
-
-    # after rotation, if we *still* start with AI, it's a stray fragment
-    if cleaned and cleaned[0]["speaker"] == "ai":
-        cleaned.pop(0)
-
-    # drop trailing dangling USER with no AI reply
-    if cleaned and cleaned[-1]["speaker"] == "user":
-        cleaned.pop()
-
-    return cleaned
-
-
-
-
-def _enforce_turns(lines):
-    """guarantee perfect alternation; if AA or UU repeat, keep latest only"""
-    out=[]
-    for seg in lines:
-        seg["text"]=_collapse_stutter(seg["text"])
-        if out and out[-1]["speaker"]==seg["speaker"]:
-            out[-1]["text"]=seg["text"]          # overwrite previous
-        else:
-            out.append(seg)
-    return out
 
-def _polish_transcript(raw: list[dict]) -> list[dict]:
-    """
-    Master pipeline:
-      1) merge -> 2) dedupe -> 3) enforce alternation & de-stutter
-    """
-    step1 = _merge(raw)
-    step2 = _dedupe(step1)
-    final = _enforce_turns(step2)
-    return final
+
+
+
+# ======================================================================
+#  ULTRA-POLISH TRANSCRIPT REBUILDER  →  polish.py
+#  (runs in POLISH_POOL worker processes, see the CALL LOGS section)
+# ======================================================================
 
 
 
@@ -290,13 +334,107 @@ ALLOWED_VOICES = {"alloy", "shimmer", "echo", "coral", "sage", "ash"}
 TEMPERATURE = 0.9
 
 
+# Uplink batching (Twilio → OpenAI): ≤ 20 ms turns it off
+UPLINK_BATCH_MS       = int(os.getenv("UPLINK_BATCH_MS", 80))
+UPLINK_MAX_LATENCY_MS = int(os.getenv("UPLINK_MAX_LATENCY_MS", 100))
+UPLINK_SPEECH_LEVEL   = int(os.getenv("UPLINK_SPEECH_LEVEL", 6))     # µ-law peak that counts as speech
+
+# Downlink playout: audio kept buffered on Twilio's side ahead of real time
+PLAYOUT_LEAD_MS       = int(os.getenv("PLAYOUT_LEAD_MS", 200))
+
+
+
+
+
+# ======================================================================
+#  ASYNC TWILIO REST LAYER  –  nothing Twilio-bound may block the loop
+# ======================================================================
+# per-operation ceilings (seconds); a slow Twilio answer fails one request,
+# it never stalls the live calls sharing this process
+TWILIO_TIMEOUTS = {
+    "redirect":  float(os.getenv("TWILIO_TIMEOUT_REDIRECT", 5)),
+    "search":    float(os.getenv("TWILIO_TIMEOUT_SEARCH", 15)),
+    "provision": float(os.getenv("TWILIO_TIMEOUT_PROVISION", 20)),
+}
+
+
+class _AsyncTwilio:
+    """
+    Async façade over twilio-python's *_async API with one pooled aiohttp
+    session (AsyncTwilioHttpClient) for the whole process.  The session
+    needs a running loop, so it is opened on first use / app startup and
+    closed at shutdown.
+    """
+
+    def __init__(self, account_sid: str, auth_token: str):
+        self._sid, self._token = account_sid, auth_token
+        self._client: Client | None = None
+
+    @property
+    def client(self) -> Client:
+        if self._client is None:
+            http = AsyncTwilioHttpClient(pool_connections=True, timeout=max(TWILIO_TIMEOUTS.values()))
+            self._client = Client(self._sid, self._token, http_client=http)
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.http_client.close()
+            self._client = None
+
+    async def _call(self, kind: str, aw):
+        """await a Twilio request under its TWILIO_TIMEOUTS budget, timing it for /metrics"""
+        started, ok = time.perf_counter(), False
+        try:
+            result = await asyncio.wait_for(aw, TWILIO_TIMEOUTS[kind])
+            ok = True
+            return result
+        finally:
+            metrics.rest_observe("twilio", started, ok)
+
+    async def redirect_call(self, call_sid: str, url: str):
+        return await self._call(
+            "redirect",
+            self.client.calls(call_sid).update_async(url=url, method="GET"),
+        )
 
+    async def local_numbers(self, **filters) -> list[str]:
+        pages = self.client.available_phone_numbers("US").local.list_async(**filters)
+        return [pn.phone_number for pn in await self._call("search", pages)]
+
+    async def toll_free_numbers(self, **filters) -> list[str]:
+        pages = self.client.available_phone_numbers("US").toll_free.list_async(**filters)
+        return [pn.phone_number for pn in await self._call("search", pages)]
+
+    async def incoming_numbers(self) -> list[str]:
+        return [pn.phone_number for pn in
+                await self._call("search", self.client.incoming_phone_numbers.list_async())]
+
+    async def buy_number(self, phone_number: str, voice_url: str):
+        return await self._call(
+            "provision",
+            self.client.incoming_phone_numbers.create_async(
+                phone_number=phone_number,
+                voice_url=voice_url,
+                voice_method="POST",
+            ),
+        )
 
 
 # Initialize Twilio client and FastAPI app
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+twilio_async = _AsyncTwilio(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 app = FastAPI()
 
+
+@app.on_event("startup")
+async def _open_twilio_session():
+    twilio_async.client            # aiohttp session must be born inside the loop
+
+
+@app.on_event("shutdown")
+async def _close_twilio_session():
+    await twilio_async.close()
+
 from fastapi.middleware.cors import CORSMiddleware
 
 app.add_middleware(
@@ -315,32 +453,294 @@ app.add_middleware(
 
 
 
+# ======================================================================
+#  SHARED ASYNC HTTP CLIENT  –  every WordPress / OpenAI REST call
+# ======================================================================
+HTTP_MAX_CONNECTIONS  = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE    = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 60))   # s
+HTTP_CONNECT_TIMEOUT  = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))     # s
+HTTP_RETRIES          = int(os.getenv("HTTP_RETRIES", 2))
+HTTP_BACKOFF_BASE     = float(os.getenv("HTTP_BACKOFF_BASE", 0.25))     # s, doubled per attempt
+
+try:                                    # HTTP/2 needs the optional `h2` package
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# worth another try: the server is shedding load or a proxy hiccuped
+_RETRY_STATUS = {429, 502, 503, 504}
+# the request never left this box – safe to retry even a POST that creates something
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_http: httpx.AsyncClient | None = None
+
+
+def http_client() -> httpx.AsyncClient:
+    """
+    Process-wide client: keep-alive pool per origin (app.kalimba.world,
+    api.openai.com …), HTTP/2 when available.  Opened at startup; created
+    lazily too so helpers also work outside the app.
+    """
+    global _http
+    if _http is None or _http.is_closed:
+        _http = httpx.AsyncClient(
+            http2=_HTTP2,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(10, connect=HTTP_CONNECT_TIMEOUT),
+        )
+    return _http
+
+
+def _timeout(seconds) -> httpx.Timeout:
+    """per-call read/write budget; the connect cap stays HTTP_CONNECT_TIMEOUT"""
+    if isinstance(seconds, httpx.Timeout):
+        return seconds
+    return httpx.Timeout(seconds, connect=HTTP_CONNECT_TIMEOUT)
+
+
+async def http_request(method: str, url: str, *, timeout: float = 10,
+                       retries: int = HTTP_RETRIES, idempotent: bool = True,
+                       **kwargs) -> httpx.Response:
+    """
+    client.request() with retries and full-jitter exponential backoff.
+    Non-idempotent calls (idempotent=False) are only retried when the
+    request provably never reached the server.
+    """
+    started, ok = time.perf_counter(), False
+    try:
+        resp = await _request_with_retries(method, url, timeout=timeout, retries=retries,
+                                           idempotent=idempotent, **kwargs)
+        ok = resp.status_code < 500
+        return resp
+    finally:
+        metrics.rest_observe(_rest_service(url), started, ok)
+
+
+@contextlib.asynccontextmanager
+async def http_stream(method: str, url: str, *, timeout: float = 10,
+                      retries: int = HTTP_RETRIES, **kwargs):
+    """
+    Streaming sibling of http_request(): yields the response as soon as
+    the headers are in and leaves the body to `resp.aiter_bytes()`.
+    Only retried while the request provably never left this box, since a
+    half-consumed body can't be replayed.
+    """
+    started, ok = time.perf_counter(), False
+    client = http_client()
+    try:
+        for attempt in range(retries + 1):
+            try:
+                resp = await client.send(client.build_request(method, url, timeout=_timeout(timeout), **kwargs),
+                                         stream=True)
+                break
+            except _NOT_SENT as exc:
+                if attempt == retries:
+                    raise
+                logging.warning("[HTTP] %s %s attempt %s failed: %r", method, url, attempt + 1, exc)
+            await asyncio.sleep(random.uniform(0, HTTP_BACKOFF_BASE * 2 ** attempt))
+        try:
+            yield resp
+            ok = resp.status_code < 500
+        finally:
+            await resp.aclose()
+    finally:
+        metrics.rest_observe(_rest_service(url), started, ok)
+
+
+def _rest_service(url: str) -> str:
+    if url.startswith(WORDPRESS_SITE_URL):
+        return "wordpress"
+    if "openai.com" in url:
+        return "openai"
+    return "other"
+
+
+async def _request_with_retries(method, url, *, timeout, retries, idempotent, **kwargs):
+    retryable = (httpx.TransportError,) if idempotent else _NOT_SENT
+    for attempt in range(retries + 1):
+        last = attempt == retries
+        try:
+            resp = await http_client().request(method, url, timeout=_timeout(timeout), **kwargs)
+        except retryable as exc:
+            if last:
+                raise
+            logging.warning("[HTTP] %s %s attempt %s failed: %r", method, url, attempt + 1, exc)
+        else:
+            if last or not (idempotent and resp.status_code in _RETRY_STATUS):
+                return resp
+            logging.warning("[HTTP] %s %s attempt %s → %s", method, url, attempt + 1, resp.status_code)
+        await asyncio.sleep(random.uniform(0, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+@app.on_event("startup")
+async def _open_http_client():
+    http_client()
+
+
+async def _close_http_client():
+    if _http is not None:
+        await _http.aclose()
+
+
+class Greeting(NamedTuple):
+    data: bytes
+    etag: str                      # strong validator: sha256 of the bytes
+    media_type: str = "audio/mpeg"
+    ulaw_key: str = ""             # precomputed µ-law rendition in ULAW_GREETINGS, if any
+
+
+def _greeting(data: bytes, media_type: str = "audio/mpeg") -> Greeting:
+    return Greeting(data, '"' + hashlib.sha256(data).hexdigest()[:32] + '"', media_type)
+
+
+# Twilio supports raw 8-kHz μ-law when Content-Type is audio/ulaw
+SILENCE_ULAW = _greeting(b"\xFF" * 8000, "audio/ulaw")    # 8000 samples ≈ 1 s
+GREETING_CHUNK = 16 * 1024
+
+
+# "play": <Play> the MP3 before <Connect>;  "stream": send pre-transcoded µ-law
+# frames over the media socket while the Realtime session connects
+GREETING_MODE  = os.getenv("GREETING_MODE", "play")
+GREETING_ITEM  = "greeting"                 # Playout item id; never truncated on OpenAI's side
+
+# precomputed renditions: <dir>/<sha256>.{mp3,ulaw} + per-phone manifests
+GREETING_STORE = greetings.ContentStore(os.getenv("GREETING_STORE_DIR", "/tmp/kal-greetings"))
+ULAW_GREETINGS = greetings.UlawStore(
+    max_bytes=int(os.getenv("GREETING_ULAW_BYTES", 32 * 1024 * 1024)),
+    directory=GREETING_STORE.directory,
+)
+
+
+async def _fetch_greeting_source(phone: str) -> tuple[bytes, str] | None:
+    """The greeting as uploaded to WordPress; None when the owner has none."""
+    wp_resp = await http_request(
+        "GET",
+        f"{WORDPRESS_SITE_URL}/wp-json/ai-reception/v1/get-initial-audio",
+        params={"phone": phone},
+        headers={"Content-Type": "application/json"},
+    )
+    if wp_resp.status_code != 200:
+        return None
+    b64 = wp_resp.json().get("audio", "")
+    return (base64.b64decode(b64), "audio/mpeg") if b64 else None
+
+
+async def _fetch_greeting(phone: str) -> Greeting | None:
+    """
+    Precomputed (normalised) greeting from GREETING_STORE; until the
+    pipeline has run for `phone`, the WordPress original – and a job is
+    queued so the next fetch is precomputed.
+    """
+    m = await asyncio.to_thread(GREETING_STORE.manifest, phone)
+    if m:
+        data = await asyncio.to_thread(GREETING_STORE.read, m["mp3"], "mp3")
+        if data is not None:
+            return Greeting(data, f'"{m["mp3"][:32]}"', m["mp3_type"], m["ulaw"] or "")
+    source = await _fetch_greeting_source(phone)
+    if source is None:
+        return None
+    GREETING_JOBS.enqueue(phone, hashlib.sha256(source[0]).hexdigest())
+    return _greeting(*source)
+
+
+def _greeting_precomputed(phone: str, manifest: dict | None) -> None:
+    """GreetingJobs callback: next lookup reads the new rendition; µ-law goes to memory now."""
+    _GREETING_CACHE.pop(("greeting", phone))
+    if manifest and manifest["ulaw"]:
+        asyncio.ensure_future(ULAW_GREETINGS.load(manifest["ulaw"]))
+
+
+async def _claim_greeting_render(phone: str, digest: str) -> bool:
+    """One worker per dyno renders a given source; the rest wait for its manifest."""
+    return await _shared(
+        call_state.set_if_absent, f"greeting-render:{phone}:{digest}", {"at": time.time()}, 300,
+        default=True,
+    )
+
+
+GREETING_JOBS = greetings.GreetingJobs(
+    GREETING_STORE, _fetch_greeting_source,
+    on_done=_greeting_precomputed,
+    claim=_claim_greeting_render if call_state.shared else None,
+    workers=int(os.getenv("GREETING_JOB_WORKERS", 2)),
+)
+
+
+@app.on_event("startup")
+async def _start_greeting_jobs():
+    GREETING_JOBS.start()
+
+
+@app.on_event("shutdown")
+async def _stop_greeting_jobs():
+    await GREETING_JOBS.close()
+
+
+def _byte_range(header: str | None, size: int) -> tuple[int, int] | None | bool:
+    """
+    (start, end) inclusive for a single `bytes=` range, None to send the
+    whole body (no / multi-range header), False when unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:                                          # suffix range: last N bytes
+            start, end = max(0, size - int(last)), size - 1
+    except ValueError:
+        return None
+    return (start, end) if start <= end and start < size else False
+
+
+def audio_response(request: Request, audio: Greeting, cache_control: str = "no-cache") -> Response:
+    """
+    Serve cached audio with ETag / If-None-Match revalidation, single
+    Range requests and chunked streaming out of one shared buffer.
+    """
+    headers = {"ETag": audio.etag, "Accept-Ranges": "bytes", "Cache-Control": cache_control}
+    inm = request.headers.get("if-none-match")
+    if inm and (inm.strip() == "*" or audio.etag in (t.strip() for t in inm.split(","))):
+        return Response(status_code=304, headers=headers)
+
+    size = len(audio.data)
+    rng = _byte_range(request.headers.get("range"), size)
+    if rng is False:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    start, end = rng or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if rng:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    view = memoryview(audio.data)
+
+    async def chunks():
+        for pos in range(start, end + 1, GREETING_CHUNK):
+            yield view[pos:min(pos + GREETING_CHUNK, end + 1)]
+
+    return StreamingResponse(chunks(), status_code=206 if rng else 200,
+                             media_type=audio.media_type, headers=headers)
+
+
 @app.get("/initial-audio/{phone_number}")
-async def serve_initial_audio(phone_number: str):
+async def serve_initial_audio(phone_number: str, request: Request):
     """
     Return the user-saved greeting as audio/mpeg.
     If none exists, return 1-s of μ-law silence so Twilio does not disconnect.
     """
-    # ── 1. Try WordPress for a saved greeting ────────────────────────────────
-    try:
-        wp_resp = requests.get(
-            f"{WORDPRESS_SITE_URL}/wp-json/ai-reception/v1/get-initial-audio",
-            params={"phone": phone_number},
-            headers={"Content-Type": "application/json"},
-            timeout=10,
-        )
-        if wp_resp.status_code == 200:
-            b64 = wp_resp.json().get("audio", "")
-            if b64:
-                audio_bytes = base64.b64decode(b64)
-                return Response(content=audio_bytes, media_type="audio/mpeg")
-    except Exception as e:
-        logging.warning(f"WP greeting lookup failed: {e}")
+    # ── 1. Saved greeting (account cache → WordPress) ───────────────────────
+    greeting = await _cached("greeting", phone_number, _fetch_greeting, default=None)
 
-    # ── 2. Fallback: 1-second μ-law silence (0xFF) ───────────────────────────
-    # Twilio supports raw 8-kHz μ-law when Content-Type is audio/ulaw
-    silence_bytes = b"\xFF" * 8000          # 8000 samples ≈ 1 s
-    return Response(content=silence_bytes, media_type="audio/ulaw")
+    # ── 2. Fallback: 1-second μ-law silence (0xFF), allocated once ──────────
+    return audio_response(request, greeting or SILENCE_ULAW)
 
 
 
@@ -349,62 +749,255 @@ async def serve_initial_audio(phone_number: str):
 
 
 
-def get_user_prompt_by_phone(phone: str) -> str:
-    logging.debug(f"[WP:get_prompt] phone={phone}")
-    try:
-        endpoint = f"{WORDPRESS_SITE_URL}/wp-json/ai-reception/v1/user-from-phone"
-        resp = requests.post(
-            endpoint,
-            json={"phone": phone},
-            timeout=10
-        )
+# ======================================================================
+#  ACCOUNT PROFILE CACHE  –  prompt + voice + destinations + greeting
+# ======================================================================
+DEFAULT_PROMPT = "Default prompt: You are an AI receptionist. Answer calls professionally."
 
-        resp.raise_for_status()
-        data = resp.json()
-        logging.debug(f"[WP:get_prompt] HTTP {resp.status_code}")
-        logging.debug(f"[WP:get_prompt] BODY {data!r}")
-        return data.get("prompt", "")
-    except Exception as e:
-        logging.exception(f"[WP:get_prompt] EXCEPTION {e}")
-    return ""
+PROFILE_CACHE_MAX   = int(os.getenv("PROFILE_CACHE_MAX", 5000))     # entries
+PROFILE_CACHE_TTL   = int(os.getenv("PROFILE_CACHE_TTL", 300))      # s fresh
+PROFILE_CACHE_STALE = int(os.getenv("PROFILE_CACHE_STALE", 3600))   # s serve-stale window
+CACHE_INVALIDATE_TOKEN = os.getenv("CACHE_INVALIDATE_TOKEN", "")
+# with a shared CALL_STATE_URL the local copy is only a short L1 in front of
+# the shared one, so an invalidation on one worker reaches the others quickly
+PROFILE_L1_TTL      = int(os.getenv("PROFILE_L1_TTL", 15))          # s
+GREETING_CACHE_BYTES = int(os.getenv("GREETING_CACHE_BYTES", 64 * 1024 * 1024))
 
 
-def get_user_voice_by_phone(phone: str) -> str:
-    logging.debug(f"[WP:get_voice] phone={phone}")
-    try:
-        endpoint = f"{WORDPRESS_SITE_URL}/wp-json/ai-reception/v1/user-from-phone"
-        resp = requests.post(
-            endpoint,
-            json={"phone": phone},
-            timeout=10
-        )
+class _TTLCache:
+    """
+    Bounded LRU with a TTL and a stale-while-revalidate window.
 
-        resp.raise_for_status()
-        data = resp.json()
-        logging.debug(f"[WP:get_voice] HTTP {resp.status_code}")
-        logging.debug(f"[WP:get_voice] BODY {data!r}")
+    get() answers (value, fresh) – `fresh` is False once the entry is older
+    than `ttl` but still younger than `ttl + stale`; after that it is gone.
+    Plain dict ops + OrderedDict.move_to_end, so a hit is O(1).
 
-        # pull the raw label from WP
-        raw = data.get("voice")
-        # normalise → map custom labels & enforce allowed list
-        voice = normalise_voice(raw, default=DEFAULT_VOICE)
-        logging.debug(f"[WP:get_voice] normalised voice = {voice}")
-        return voice
+    With `max_bytes` the LRU also evicts until the summed `sizeof(value)`
+    fits the budget; a single value larger than the budget isn't kept.
+    """
 
-    except Exception as e:
-        logging.exception(f"[WP:get_voice] EXCEPTION {e}")
-    # in case of any error, fallback
-    return DEFAULT_VOICE
+    def __init__(self, max_entries: int, ttl: float, stale: float = 0.0,
+                 *, max_bytes: int = 0, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl   = ttl
+        self.stale = stale
+        self.max_bytes = max_bytes
+        self.sizeof    = sizeof or (lambda _v: 0)
+        self.bytes     = 0
+        self._data: OrderedDict = OrderedDict()     # key → (stored_at, value)
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        age = time.monotonic() - item[0]
+        if age > self.ttl + self.stale:
+            self.pop(key)
+            return None
+        self._data.move_to_end(key)
+        return item[1], age <= self.ttl
+
+    def put(self, key, value, age: float = 0.0) -> None:
+        size = self.sizeof(value)
+        self.pop(key)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        self._data[key] = (time.monotonic() - age, value)
+        self.bytes += size
+        while len(self._data) > self.max_entries or (self.max_bytes and self.bytes > self.max_bytes):
+            _, (_, old) = self._data.popitem(last=False)
+            self.bytes -= self.sizeof(old)
+
+    def pop(self, key) -> None:
+        item = self._data.pop(key, None)
+        if item is not None:
+            self.bytes -= self.sizeof(item[1])
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# key = (kind, phone)  –  kind ∈ {"profile", "greeting"}
+_ACCOUNT_CACHE = _TTLCache(
+    PROFILE_CACHE_MAX,
+    min(PROFILE_CACHE_TTL, PROFILE_L1_TTL) if call_state.shared else PROFILE_CACHE_TTL,
+    PROFILE_CACHE_STALE,
+)
+# greetings are ~50-500 kB each, so they get their own byte budget
+_GREETING_CACHE = _TTLCache(
+    PROFILE_CACHE_MAX, PROFILE_CACHE_TTL, PROFILE_CACHE_STALE,
+    max_bytes=GREETING_CACHE_BYTES,
+    sizeof=lambda g: len(g.data) if g else 0,
+)
+_ACCOUNT_CACHES = {"profile": _ACCOUNT_CACHE, "greeting": _GREETING_CACHE}
+_SHARED_KINDS  = ("profile",)           # JSON-able; greetings are raw MP3 and stay per worker
+_FLUSH_KEY     = "acct:flushed"         # {"at": t} – shared entries older than t are void
+
+# key → Future of the WordPress lookup currently in flight for it
+_ACCOUNT_INFLIGHT: dict[tuple, asyncio.Future] = {}
+
+
+async def _coalesced(inflight: dict, key, factory):
+    """
+    Single-flight helper: every concurrent caller asking for `key` awaits
+    the same task.  The task is shielded so one impatient caller (e.g. a
+    Twilio webhook that times out) can't cancel it for everybody else.
+    """
+    fut = inflight.get(key)
+    if fut is None:
+        fut = asyncio.ensure_future(factory())
+        inflight[key] = fut
+        fut.add_done_callback(lambda _f: inflight.pop(key, None))
+    return await asyncio.shield(fut)
 
 
+async def _cached(kind: str, phone: str, fetch, default):
+    """
+    Serve (kind, phone) from cache.
 
+      • fresh hit   → return it
+      • stale hit   → return it, refresh in the background
+      • miss        → one coalesced fetch for all waiters
 
+    A refresh first looks at the copy other workers keep in call_state
+    (shared kinds only) and goes to WordPress when that is missing or old.
+    `fetch` raises on failure; a failed refresh keeps the stale copy,
+    a failed cold load returns `default` without caching it.
+    """
+    key = (kind, phone)
+    cache = _ACCOUNT_CACHES[kind]
+    shared_key = f"acct:{kind}:{phone}" if kind in _SHARED_KINDS and call_state.shared else None
+
+    async def refresh():
+        rec = None
+        if shared_key:
+            rec = await _shared(call_state.get, shared_key)
+            flushed = await _shared(call_state.get, _FLUSH_KEY) or {"at": 0}
+            if rec and rec["at"] > flushed["at"]:
+                age = time.time() - rec["at"]
+                if age <= PROFILE_CACHE_TTL:
+                    cache.put(key, rec["value"], age=max(0.0, age))
+                    return rec["value"]
+            else:
+                rec = None
+        try:
+            value = await fetch(phone)
+        except Exception as exc:
+            logging.error("[CACHE] %s refresh failed for %s: %r", kind, phone, exc)
+            hit = cache.get(key)
+            if hit:
+                return hit[0]
+            return rec["value"] if rec else default
+        cache.put(key, value)
+        if shared_key:
+            await _shared(call_state.set, shared_key, {"at": time.time(), "value": value},
+                          PROFILE_CACHE_TTL + PROFILE_CACHE_STALE)
+        return value
+
+    hit = cache.get(key)
+    if hit is not None:
+        value, fresh = hit
+        if not fresh and key not in _ACCOUNT_INFLIGHT:
+            asyncio.ensure_future(_coalesced(_ACCOUNT_INFLIGHT, key, refresh))
+        return value
+    return await _coalesced(_ACCOUNT_INFLIGHT, key, refresh)
+
+
+async def invalidate_account(phone: str | None = None) -> None:
+    """Drop every cached kind for `phone` (or everything when None), here and in call_state."""
+    if phone is None:
+        for cache in _ACCOUNT_CACHES.values():
+            cache.clear()
+        if call_state.shared:
+            await _shared(call_state.set, _FLUSH_KEY, {"at": time.time()})
+        return
+    for kind, cache in _ACCOUNT_CACHES.items():
+        cache.pop((kind, phone))
+    if call_state.shared:
+        await _shared(call_state.delete, *(f"acct:{kind}:{phone}" for kind in _SHARED_KINDS))
+
+
+async def _wp_user_from_phone(phone: str) -> dict:
+    """POST /user-from-phone (a read, so retries are safe)."""
+    endpoint = f"{WORDPRESS_SITE_URL}/wp-json/ai-reception/v1/user-from-phone"
+    resp = await http_request("POST", endpoint, json={"phone": phone})
+    resp.raise_for_status()
+    logging.debug("[WP:profile] HTTP %s", resp.status_code)
+    return resp.json() or {}
+
+
+async def _fetch_account_profile(phone: str) -> dict:
+    data, dests = await asyncio.gather(
+        _wp_user_from_phone(phone),
+        _fetch_destinations(phone),
+        return_exceptions=True,
+    )
+    if isinstance(data, BaseException):
+        raise data                                   # no prompt / voice: keep the stale copy
+    if isinstance(dests, BaseException):
+        logging.error("[DEST] %s: fetch failed, continuing without destinations: %r", phone, dests)
+        dests = []
+    logging.debug("[WP:profile] BODY %r", data)
+
+    if isinstance(data.get("destinations"), list):     # newer WP builds inline them
+        dests = data["destinations"]
+
+    return {
+        "prompt":       data.get("prompt", "") or "",
+        "voice":        normalise_voice(data.get("voice"), default=DEFAULT_VOICE),
+        "destinations": dests,
+    }
 
 
+async def load_account_profile(phone: str) -> dict:
+    """
+    Return {prompt, voice, destinations} for the account that owns `phone`.
 
+    Never blocks the event loop; cache hits cost a dict lookup, and
+    concurrent misses for the same number share one WordPress request.
+    """
+    return await _cached(
+        "profile", phone, _fetch_account_profile,
+        default={"prompt": "", "voice": DEFAULT_VOICE, "destinations": []},
+    )
 
 
+@app.post("/cache/invalidate")
+async def invalidate_cache(request: Request, x_cache_token: str = Header(None)):
+    """
+    Called by WordPress when an owner saves prompt / voice / greeting /
+    destinations:  POST { "phone": "+1…" }  or  { "phones": [...] }  or  { "all": true }
+    Header:        X-Cache-Token: <CACHE_INVALIDATE_TOKEN>
+    The profile is re-fetched right away so the next call is still a hit.
+    """
+    if not CACHE_INVALIDATE_TOKEN:
+        raise HTTPException(status_code=503, detail="Invalidation disabled")
+    if not hmac.compare_digest(x_cache_token or "", CACHE_INVALIDATE_TOKEN):
+        raise HTTPException(status_code=403, detail="Bad token")
 
+    try:
+        body = await request.json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Expected a JSON object")
+    if body.get("all"):
+        await invalidate_account(None)
+        return {"invalidated": "all"}
+
+    phones = body.get("phones") or ([body["phone"]] if body.get("phone") else [])
+    if not isinstance(phones, list) or not all(isinstance(p, str) and p for p in phones):
+        raise HTTPException(status_code=400, detail="Expected phone / phones as non-empty strings")
+    for phone in phones:
+        await invalidate_account(phone)
+        asyncio.ensure_future(load_account_profile(phone))
+        GREETING_JOBS.enqueue(phone)                # re-renders only if the greeting itself changed
+    logging.info("[CACHE] invalidated %s", phones)
+    return {"invalidated": phones}
 
 
 ############################
@@ -425,6 +1018,31 @@ def get_current_user():
 async def root():
     return JSONResponse({"status": "OK"})
 
+
+metrics.Gauge("relay_live_calls", "Calls attached to this worker", fn=lambda: calls.stats()["attached"])
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus text format: loop lag, call phases, frame relay, barge-in, REST latency"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.on_event("startup")
+async def _start_loop_lag_probe():
+    asyncio.ensure_future(metrics.watch_loop_lag())
+
+
+@app.get("/health")
+async def health():
+    """per-worker liveness + load; supervisor.py sums these across workers"""
+    return {
+        "status":     "ok",
+        "pid":        os.getpid(),
+        "worker":     int(os.getenv("RELAY_WORKER_INDEX", 0)),
+        "live_calls": calls.stats()["attached"],      # media stream up; pending contexts excluded
+    }
+
 @app.head("/incoming-call")
 async def head_incoming_call(request: Request):
     return Response(status_code=200)
@@ -449,34 +1067,54 @@ async def handle_incoming_call(request: Request, background_tasks: BackgroundTas
     call_sid  = form_data.get("CallSid", "")
     hostname  = request.url.hostname
 
-    logging.debug(f"[INCOMING] raw form_data = {dict(form_data)}")
+    logging.debug("[INCOMING] raw form_data = %s", dict(form_data))
 
-    prompt = get_user_prompt_by_phone(to_number) or \
-             "Default prompt: You are an AI receptionist. Answer calls professionally."
-    voice  = get_user_voice_by_phone(to_number)
+    profile = await load_account_profile(to_number)
+    prompt  = profile["prompt"] or DEFAULT_PROMPT
+    voice   = profile["voice"]
 
-    logging.debug(f"[INCOMING] final prompt(≈{len(prompt)}ch) = {prompt[:120]!r}")
-    logging.debug(f"[INCOMING] final voice = {voice}")
+    logging.debug("[INCOMING] final prompt(≈%sch) = %r", len(prompt), prompt[:120])
+    logging.debug("[INCOMING] final voice = %s", voice)
 
-    contexts[call_sid] = {
-    "prompt"  : prompt,
-    "voice"   : voice,
-    "hostname": hostname,
-    "phone"   : to_number          # ← lets the WS know whose destinations to use
-    }
+    ctx = calls.create(
+        call_sid,
+        prompt   = prompt,
+        voice    = voice,
+        hostname = hostname,
+        phone    = to_number,          # ← lets the WS know whose destinations to use
+    )
+    await calls.publish(call_sid)      # the media stream may land on another worker
+
+    logging.debug("[INCOMING] calls[%s] => %s", call_sid, ctx)
 
-    logging.debug(f"[INCOMING] contexts[{call_sid}] => {contexts[call_sid]}")
+    # start the OpenAI handshake + session.update while <Play> runs
+    if REALTIME_PRECONNECT and call_sid:
+        park_realtime_session(call_sid, prompt=prompt, voice=voice, phone=to_number)
 
     greeting_url = f"https://{hostname}/initial-audio/{to_number}"
+    greeting_xml, greeting_key = f"<Play>{greeting_url}</Play>", ""
+    if GREETING_MODE == "stream":
+        greeting = await _cached("greeting", to_number, _fetch_greeting, default=None)
+        if greeting is None:
+            greeting_xml = ""                       # no greeting: straight to the stream
+        else:
+            key = greeting.ulaw_key or greeting.etag.strip('"')
+            if await ULAW_GREETINGS.load(key) is not None:
+                greeting_xml, greeting_key = "", key
+            elif not greeting.ulaw_key:             # not precomputed yet: <Play> this once
+                asyncio.ensure_future(ULAW_GREETINGS.prepare(key, greeting.data, greeting.media_type))
+    # the CallSid in the path lets supervisor.py route the stream to this worker
+    stream_path  = f"/media-stream/{call_sid}" if call_sid else "/media-stream"
     twiml = f"""<?xml version="1.0" encoding="UTF-8"?>
     <!-- DEBUG-VOICE: {voice} -->
     <Response>
-    <Play>{greeting_url}</Play>
+    {greeting_xml}
     <Connect>
-        <Stream url="wss://{hostname}/media-stream">
+        <Stream url="wss://{hostname}{stream_path}">
         <Parameter name="callSid"   value="{{CallSid}}"/>
         <Parameter name="acctPhone" value="{to_number}"/>
         <Parameter name="hostname"  value="{hostname}"/>   <!-- NEW -->
+        <Parameter name="greeting"  value="{greeting_key}"/>
         </Stream>
     </Connect>
     </Response>"""
@@ -490,6 +1128,7 @@ async def handle_incoming_call(request: Request, background_tasks: BackgroundTas
 
 
 @app.websocket("/media-stream")
+@app.websocket("/media-stream/{shard_key}")
 async def handle_media_stream(websocket: WebSocket):
     """
     Twilio pushes raw µ-law audio to this endpoint; we proxy it to the
@@ -501,13 +1140,17 @@ async def handle_media_stream(websocket: WebSocket):
     await websocket.accept()
 
     # ── Per-call state containers ───────────────────────────────
-    transcript: list[dict] = []      # accumulated USER / AI turns
+    transcript = TranscriptBuilder(clean=textnorm.collapse_stutter,      # USER / AI turns, per item
+                                   norm=textnorm.norm_transcript)
     call_ctx: dict         = {}      # prompt, voice, hostname, phone, call_sid …
     call_sid: str | None   = None    # defined early so inner coroutines can capture it
     keep_alive_task        = None    # will hold the ping task we start later
   # will hold the ping task we start later
     openai_ws              = None    # placeholder so nested coroutines can see it
     openai_task           = None   # will hold process_openai_responses()
+    uplink                = None   # UplinkBatcher for this call
+    playout_task          = None   # Playout.run() pacer
+    timer                 = None   # metrics.CallTimer, started on Twilio `start`
 
 
 
@@ -530,10 +1173,22 @@ async def handle_media_stream(websocket: WebSocket):
             # Twilio’s “start” event will give us the SID for this audio stream
             stream_sid: str | None = None
 
+            # caller audio → fewer, larger appends (None = one append per 20 ms frame)
+            uplink = UplinkBatcher(
+                batch_ms=UPLINK_BATCH_MS,
+                max_latency_ms=UPLINK_MAX_LATENCY_MS,
+                speech_level=UPLINK_SPEECH_LEVEL,
+            ) if UPLINK_BATCH_MS > 20 else None
+
+            # AI audio → paced playout with Twilio marks (drives barge-in)
+            playout = Playout(
+                websocket.send_text, lead_ms=PLAYOUT_LEAD_MS,
+                on_first_send=lambda: timer and timer.mark("first_media_send"),
+            )
+
             # Runtime flags
-            ai_is_speaking      = False
             last_audio_received = None
-            last_barge_in       = 0.0
+            response_active     = False     # OpenAI is generating a response
             redirect_triggered  = False
 
             # ------------------------------------------------------------------
@@ -581,7 +1236,7 @@ async def handle_media_stream(websocket: WebSocket):
 
                     quiet_for_a_while = (now - last_audio_received) > IDLE
 
-                    if quiet_for_a_while and not ai_is_speaking:
+                    if quiet_for_a_while and not playout.active:
                         logging.info("[WATCHDOG] idle timeout – closing sockets")
                         try:
                             await openai_ws.close(code=1000, reason="idle timeout")
@@ -595,117 +1250,122 @@ async def handle_media_stream(websocket: WebSocket):
 
             # ---------- Twilio → OpenAI pump ----------
             async def receive_from_twilio():
-                nonlocal stream_sid, call_sid, openai_ws, last_barge_in
+                nonlocal stream_sid, call_sid, openai_ws, playout_task, timer
 
 
                 async for raw in websocket.iter_text():
-                    pkt = json.loads(raw)
+                    received = time.perf_counter()
+                    # fast path: ~50 media frames/s – lift the payload without parsing
+                    payload = twilio_media_payload(raw)
+                    if payload is not None:
+                        event = "media"
+                    else:
+                        pkt   = json_loads(raw)
+                        event = pkt.get("event")
+                        if event == "media":
+                            payload = pkt["media"]["payload"]
 
                     # ─── START EVENT ─────────────────────────
-                    if pkt.get("event") == "start":
+                    if event == "start":
                         # 1) grab stream SID and custom parameters
-                        stream_sid = pkt["start"]["streamSid"]
+                        stream_sid   = pkt["start"]["streamSid"]
+                        timer        = metrics.CallTimer()
+                        metrics.CALLS_TOTAL.inc()
+                        playout.bind(stream_sid)
+                        if playout_task is None:
+                            playout_task = asyncio.create_task(playout.run())
                         custom     = pkt["start"].get("customParameters") or {}
 
+                        # greeting first: it plays while the Realtime session connects
+                        greeting_key = custom.get("greeting")
+                        if greeting_key:
+                            greeting_frames = await ULAW_GREETINGS.load(greeting_key)
+                            if greeting_frames is None:
+                                logging.warning("[GREETING] %s not on this worker", greeting_key)
+                            for frame in greeting_frames or ():
+                                playout.enqueue(GREETING_ITEM, frame)
+
                         call_sid = (
                             pkt["start"].get("callSid")      # only on the first event
                             or custom.get("callSid")
                             or custom.get("callsid")
                         )
+                        logpipe.bind_call(call_sid, stream_sid)   # tags this task + the pumps it starts
 
                         # 2) ensure prompt + voice are loaded
                         acct_phone = custom.get("acctPhone", "")
-                        entry      = contexts.get(call_sid, {})
-
-                        if acct_phone and not entry.get("prompt"):
-                            entry["prompt"] = get_user_prompt_by_phone(acct_phone) or \
+                        entry      = await calls.adopt(call_sid, stream_sid=stream_sid) if call_sid else {}
+                        if acct_phone and not entry.get("phone") and call_sid:
+                            calls.attach(call_sid, phone=acct_phone)
+
+                        if acct_phone and not (entry.get("prompt") and entry.get("voice")):
+                            profile = await load_account_profile(acct_phone)
+                            entry.setdefault("phone", acct_phone)
+                            entry["prompt"] = entry.get("prompt") or profile["prompt"] or \
                                             "Default prompt: You are an AI receptionist."
-                        if acct_phone and not entry.get("voice"):
-                            entry["voice"]  = get_user_voice_by_phone(acct_phone)
+                            entry["voice"]  = entry.get("voice") or profile["voice"]
 
                         call_ctx.update(entry)
                         call_ctx["call_sid"] = call_sid
+                        call_ctx.setdefault("phone", acct_phone)
+                        call_ctx["started_at"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
                         voice = call_ctx.get("voice", "alloy")  # fallback
 
 
-                        # 3) pick model based on voice
-                        model_name = (
-                            "gpt-4o-mini-realtime-preview-2024-12-17"
-                            if voice == "alloy"
-                            else "gpt-4o-realtime-preview-2024-12-17"
-                        )
-                        ws_url = (
-                            "wss://api.openai.com/v1/realtime"
-                            f"?model={model_name}"
-                            f"&voice={voice}"
-                        )
-
-                        # 4) OPEN the OpenAI realtime WebSocket
-                        openai_ws = await websockets.connect(
-                            ws_url,
-                            extra_headers={
-                                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                                "OpenAI-Beta":   "realtime=v1"
-                            }
-                        )
-
-                        # 5) send the session.update (prompt + destinations + voice)
-                        # 5) send the session.update (prompt + destinations + voice)
-                        await send_session_update(
-                            openai_ws,
-                            prompt=entry["prompt"],
-                            voice=voice,
-                            phone=entry.get("phone", "")
-                        )
+                        # 3) adopt the socket /incoming-call pre-connected for us;
+                        #    otherwise open + configure one now (prompt + destinations + voice)
+                        openai_ws = await adopt_realtime_session(call_sid)
+                        if openai_ws is None:
+                            openai_ws = await open_realtime_session(
+                                prompt=entry["prompt"],
+                                voice=voice,
+                                phone=entry.get("phone", "")
+                            )
+                        timer.mark("openai_connect")
 
-                        # 6) NOW that the OpenAI socket exists, start the downstream pump
+                        # 4) NOW that the OpenAI socket exists, start the downstream pump
                         nonlocal openai_task               # declared near the top of handle_media_stream
                         if openai_task is None:            # launch only once
                             openai_task = asyncio.create_task(process_openai_responses())
 
-                        # 7) give Twilio 300 ms of silence so it knows we’re alive
-                        asyncio.create_task(send_initial_voice())
+                        # 5) give Twilio 300 ms of silence so it knows we’re alive
+                        #    (a streamed greeting already does that)
+                        if not greeting_key:
+                            asyncio.create_task(send_initial_voice())
 
 
 
                     # ─── MEDIA EVENT ─────────────────────────
-                    elif pkt.get("event") == "media":
+                    elif event == "media":
                         if openai_ws is None:               # socket not ready yet
                             continue                        # ignore early packets
 
-                        # If the AI is mid-sentence, stop the TTS stream so callers can barge in
-                        if ai_is_speaking:
-                            logging.info("[INTERRUPT] caller spoke while AI talking – cancelling response")
-                            await send_stop_audio(openai_ws)
-                            ai_is_speaking = False
-                            last_barge_in = asyncio.get_event_loop().time()
-
-                        await openai_ws.send(json.dumps({
-                            "type":  "input_audio_buffer.append",
-                            "audio": pkt["media"]["payload"]
-                        }))
-
+                        if uplink is None:
+                            await openai_ws.send(append_frame(payload))
+                        else:
+                            frame = uplink.push(payload, asyncio.get_event_loop().time())
+                            if frame:
+                                await openai_ws.send(frame)
+                        metrics.UPLINK_FRAME.observe(time.perf_counter() - received)
 
+                    # ─── MARK EVENT (Twilio played up to here) ──
+                    elif event == "mark":
+                        playout.on_mark(pkt["mark"]["name"])
 
                     # ─── STOP EVENT ──────────────────────────
-                    elif pkt.get("event") == "stop":
-                        logging.info("[TWILIO] received stop – scheduling WP save and closing sockets")
-
-                        # **1) schedule your WordPress save immediately**
-                        if transcript:
-                            asyncio.create_task(
-                                #
-                                save_call_to_wp(
-                                    transcript=transcript,
-                                    prompt=call_ctx.get("prompt", ""),
-                                    call_sid=call_ctx.get("call_sid", ""),
-                                    started_at=datetime.utcnow().isoformat(timespec="seconds") + "Z",
-                                    phone=call_ctx.get("phone", "")
-                                )
-
-                            )
+                    elif event == "stop":
+                        logging.info("[TWILIO] received stop – closing sockets")
+
+                        # the caller's last few frames are still in the batcher
+                        tail = uplink.flush() if uplink is not None else None
+                        if tail and openai_ws is not None:
+                            try:
+                                await openai_ws.send(tail)
+                            except Exception:
+                                pass
 
-                        # **2) cleanly close both websockets** so this coroutine can return
+                        # cleanly close both websockets so this coroutine can return;
+                        # the transcript is queued once, in `finally`
                         try:
                             await openai_ws.close(code=1000, reason="twilio stop")
                         except Exception:
@@ -732,41 +1392,37 @@ async def handle_media_stream(websocket: WebSocket):
                 """
                 Dial either a saved destination by label, or a raw +E.164 number.
                 """
-                nonlocal redirect_triggered, ai_is_speaking, stream_sid, call_sid
+                nonlocal redirect_triggered, stream_sid, call_sid
 
                 if redirect_triggered or not call_sid:
                     return                         # already done or we don’t know the call yet
 
                 # choose what to pass to /redirecting-call
                 if label:
-                    qp = f"label={requests.utils.quote(label)}"
+                    qp = f"label={quote(label)}"
                 elif number:
-                    qp = f"to={requests.utils.quote(number)}"
+                    qp = f"to={quote(number)}"
                 else:
+                    return                         # nothing to dial – don't claim the redirect
+
+                if not await calls.claim_redirect(call_sid):
+                    logging.info("[REDIRECT] %s already redirected by another worker", call_sid)
+                    redirect_triggered = True
                     return
 
-                # first try the current turn's hostname,
-                # then fall back to the one we saved in contexts[call_sid]['hostname']
-                # ──────────────────────────────────────────────────────────────
-                # Find a hostname in *every* reasonable place before bailing
-                # ──────────────────────────────────────────────────────────────
                 # ──────────────────────────────────────────────────────────────
                 # Look for a hostname in *every* possible place*
-                # *including contexts that match either phone OR call-sid*
+                # *including live calls that match either phone OR call-sid*
                 # ──────────────────────────────────────────────────────────────
                 host = (
                     call_ctx.get("hostname")                                   # 1) <Parameter hostname="…">
-                    or (call_sid and contexts.get(call_sid, {}).get("hostname"))  # 2) contexts[callSid]
+                    or (calls.get(call_sid) or {}).get("hostname")             # 2) calls[callSid]
                 )
 
-                # 3) Search all live contexts – by phone *or* by Twilio call-sid
+                # 3) Any other live call for the same owner phone (O(1) index)
                 if not host:
-                    for ctx in contexts.values():
-                        same_phone = call_ctx.get("phone") and ctx.get("phone") == call_ctx["phone"]
-                        same_sid   = call_sid and ctx.get("call_sid") == call_sid
-                        if (same_phone or same_sid) and ctx.get("hostname"):
-                            host = ctx["hostname"]
-                            break
+                    host = next((ctx["hostname"] for ctx in calls.for_phone(call_ctx.get("phone"))
+                                 if ctx.get("hostname")), None)
 
                 # 4) Environment variable fallback
                 # 4) Environment-variable and hard-coded fallbacks
@@ -786,19 +1442,20 @@ async def handle_media_stream(websocket: WebSocket):
 
 
 
-                url = f"https://{host}/redirecting-call?{qp}&phone={requests.utils.quote(call_ctx['phone'])}"
+                url = f"https://{host}/redirecting-call?{qp}&phone={quote(call_ctx['phone'])}"
 
 
 
-                logging.info(f"[REDIRECT] updating live call → {url}")
+                logging.info("[REDIRECT] updating live call → %s", url)
 
                 try:
-                    twilio_client.calls(call_sid).update(url=url, method="GET")
+                    await twilio_async.redirect_call(call_sid, url)
                     redirect_triggered = True
-                    ai_is_speaking = False          # stop sending audio
+                    await playout.interrupt()        # stop sending audio
                     await send_stop_audio(openai_ws) # politely cancel TTS
                 except Exception as exc:
-                    logging.error(f"[REDIRECT] Call.update failed: {exc}")
+                    logging.error("[REDIRECT] Call.update failed: %s", exc)
+                    await calls.unclaim_redirect(call_sid)
 
 
 
@@ -823,15 +1480,49 @@ async def handle_media_stream(websocket: WebSocket):
             #  OpenAI ➜ Twilio pump  (GPT output + caller transcript)
             # --------------------------------------------------------------
             async def process_openai_responses():
-                nonlocal ai_is_speaking, last_audio_received, redirect_triggered, stream_sid, last_barge_in
+                nonlocal last_audio_received, response_active, redirect_triggered, stream_sid
+
+                def forward_audio(item_id: str | None, audio_payload: str):
+                    nonlocal last_audio_received
+                    # deltas of an item the caller barged in on are dropped here
+                    if playout.enqueue(item_id, audio_payload):
+                        last_audio_received = asyncio.get_event_loop().time()
+
+                async def barge_in():
+                    """Caller talked over the AI: clear Twilio, truncate at what was heard."""
+                    started = time.perf_counter()
+                    cut = await playout.interrupt()
+                    if response_active:                  # generating, audible or not yet
+                        await send_stop_audio(openai_ws)
+                    if cut is None:
+                        return
+                    item_id, audio_end_ms = cut
+                    logging.info("[INTERRUPT] caller barged in – truncating %s at %s ms", item_id, audio_end_ms)
+                    if item_id and item_id != GREETING_ITEM:
+                        await openai_ws.send(json.dumps({
+                            "type":          "conversation.item.truncate",
+                            "item_id":       item_id,
+                            "content_index": 0,
+                            "audio_end_ms":  audio_end_ms,
+                        }))
+                    metrics.BARGE_IN.observe(time.perf_counter() - started)
 
                 async for raw in openai_ws:
                     # stop everything once we’ve transferred the call
                     if redirect_triggered:
                         break
 
+                    # fast path: audio deltas are spliced straight into a Twilio frame
+                    received = time.perf_counter()
+                    delta = openai_audio_delta(raw)
+                    if delta:
+                        timer.mark("first_delta")
+                        forward_audio(str_field(raw, '"item_id":"'), delta)
+                        metrics.DOWNLINK_FRAME.observe(time.perf_counter() - received)
+                        continue
+
                     try:
-                        msg  = json.loads(raw)
+                        msg  = json_loads(raw)
                         kind = msg.get("type", "")
 
                         # ── 1) GPT calls redirect_call() ────────────────────
@@ -865,7 +1556,7 @@ async def handle_media_stream(websocket: WebSocket):
                                 # Not our tool – ignore
                                 pass
                             else:
-                                logging.debug(f"[REDIRECT] raw function_call payload → {msg}")
+                                logging.debug("[REDIRECT] raw function_call payload → %s", msg)
 
                                 # unified grab of arguments (handle JSON string & dict)
                                 try:
@@ -880,7 +1571,7 @@ async def handle_media_stream(websocket: WebSocket):
                                         tool = (msg.get("tool_calls") or [{}])[0]
                                         args = tool.get("arguments", {})
                                 except Exception as exc:
-                                    logging.error(f"[REDIRECT] could not parse arguments: {exc}")
+                                    logging.error("[REDIRECT] could not parse arguments: %s", exc)
                                     args = {}
 
                                 label  = args.get("label")
@@ -888,8 +1579,8 @@ async def handle_media_stream(websocket: WebSocket):
 
                                 # validate label for THIS caller before trying to redirect
                                 caller_phone = call_ctx.get("phone")
-                                if label and not number and not _find_dest(caller_phone, label):
-                                    logging.info(f"[REDIRECT] label '{label}' not found for {caller_phone}")
+                                if label and not number and not await _find_dest(caller_phone, label):
+                                    logging.info("[REDIRECT] label '%s' not found for %s", label, caller_phone)
                                     # ignore wrong label; do NOT break (let convo continue)
                                 else:
                                     await maybe_redirect(label=label, number=number)
@@ -903,67 +1594,64 @@ async def handle_media_stream(websocket: WebSocket):
 
 
                         # ── 2) Caller speech transcript (Whisper) ───────────
+                        #    filed under the item it belongs to; the final
+                        #    event's full text supersedes the deltas
                         elif "input_audio_transcript" in kind:
-                            text = (msg.get("delta") or msg.get("transcript") or "").strip()
-                            if text:
-                                transcript.append({"speaker": "user", "text": text})
-                                logging.info(f"[CALLER] {text}")
+                            if kind.endswith(".delta"):
+                                transcript.delta("user", msg.get("delta") or "", msg.get("item_id"))
+                            else:
+                                text = msg.get("transcript") or ""
+                                transcript.final("user", text, msg.get("item_id"))
+                                if text.strip():
+                                    logging.info("[CALLER] %s", text.strip())
 
                         # ── 3) AI-TTS transcript (for logs) ────────────────
                         elif "response.audio_transcript" in kind:
-                            text = (msg.get("delta") or msg.get("transcript") or "").strip()
-                            if text:
-                                transcript.append({"speaker": "ai", "text": text})
-                                logging.info(f"[AI-TTS] {text}")
+                            if kind.endswith(".delta"):
+                                text = msg.get("delta") or ""
+                                transcript.delta("ai", text, msg.get("item_id"))
+                                if text.strip():
+                                    logging.info("[AI-TTS] %s", text.strip())
+                            else:
+                                transcript.final("ai", msg.get("transcript") or "", msg.get("item_id"))
 
                         # ── 4) Assistant text deltas (visible) ─────────────
                         elif kind.startswith("response.text") or "content_part" in kind:
-                            text = (msg.get("delta") or msg.get("text") or "").strip()
-                            if text:
-                                transcript.append({"speaker": "ai", "text": text})
-                                logging.info(f"[AI-TEXT] {text}")
+                            part = msg.get("part") or {}
+                            if kind.endswith(".delta"):
+                                text = msg.get("delta") or ""
+                                transcript.delta("ai", text, msg.get("item_id"))
+                            else:
+                                text = msg.get("text") or part.get("transcript") or part.get("text") or ""
+                                transcript.final("ai", text, msg.get("item_id"))
+                            if text.strip():
+                                logging.info("[AI-TEXT] %s", text.strip())
 
                         # ── 5) Audio chunks to Twilio ──────────────────────
                         elif kind.startswith("response.audio"):
                             audio_payload = msg.get("delta") or msg.get("audio")
                             if audio_payload:
-                                now = asyncio.get_event_loop().time()
-
-                                # Drop any leftover frames that arrive right after a barge-in
-                                if last_barge_in and (now - last_barge_in) < 1.0:
-                                    logging.debug("[INTERRUPT] skipping stale TTS frame after barge-in")
-                                    continue
-
-                                last_audio_received = now
-                                ai_is_speaking = True
-                                await websocket.send_json({
-                                    "event":     "media",
-                                    "streamSid": stream_sid,
-                                    "media":     {"payload": audio_payload}
-                                })
-
-                        # ── 6) End-of-response markers ─────────────────────
-                        elif kind in {"response.completed", "response.canceled", "response.stopped"}:
-                            # OpenAI signals that the assistant finished speaking;
-                            # clear the speaking flag so new caller audio doesn’t get treated
-                            # as a late barge-in.
-                            ai_is_speaking = False
-                            last_audio_received = None
+                                forward_audio(msg.get("item_id"), audio_payload)
+
+                        # ── 6) Response lifecycle + barge-in ───────────────
+                        elif kind == "response.created":
+                            response_active = True
+                        elif kind in {"response.done", "response.completed", "response.canceled", "response.stopped"}:
+                            response_active = False
+                        elif kind == "input_audio_buffer.speech_started":
+                            await barge_in()
+                        elif kind == "input_audio_buffer.committed" and msg.get("item_id"):
+                            # the caller's item exists now, before the reply it triggers;
+                            # its transcription may still arrive after that reply
+                            transcript.reserve(msg["item_id"], "user")
 
                         # ── 7) Errors from the OpenAI stream ───────────────
                         elif kind == "error":
-                            logging.error(f"[OPENAI-ERR] {msg}")
+                            logging.error("[OPENAI-ERR] %s", msg)
 
 
                     except Exception as exc:
-                        logging.error(f"[OPENAI-PARSE] {exc}")
-
-                    # reset speaking flag if no audio for 10 s
-                    if last_audio_received and (
-                        asyncio.get_event_loop().time() - last_audio_received > 10
-                    ):
-                        ai_is_speaking = False
-                        last_audio_received = None
+                        logging.error("[OPENAI-PARSE] %s", exc)
 
 
 
@@ -979,56 +1667,64 @@ async def handle_media_stream(websocket: WebSocket):
             # run all tasks – any one finishing ends the call
             # run all concurrent jobs until ANY of them finishes
             # run our core tasks; include the AI-pump only after it exists
+            twilio_task = asyncio.create_task(receive_from_twilio())
             tasks = [
-                asyncio.create_task(receive_from_twilio()),
+                twilio_task,
                 asyncio.create_task(idle_watchdog()),
             ]
 
             # openai_task is created inside receive_from_twilio ⇢ “start” event
-            # wait for it as soon as it appears
+            # wait for it as soon as it appears; the call is over once Twilio's
+            # side is (stop / hang-up / watchdog close) – don't let the
+            # watchdog keep this handler and its state alive afterwards
             while True:
                 if openai_task is not None and openai_task not in tasks:
                     tasks.append(openai_task)
                 done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
-                # if any pending tasks remain (e.g. openai_task started later), keep waiting
-                if not pending:
+                if twilio_task in done or not pending:
                     break
                 tasks = list(pending)
+            for t in pending:
+                t.cancel()
 
 
 
 
 
     except Exception as e:
-        logging.error(f"[MEDIA] fatal: {e}")
+        logging.error("[MEDIA] fatal: %s", e)
 
 
 
 
     finally:
+        logpipe.bind_call(call_sid, stream_sid)   # the pumps bound it in their own tasks
         # ── stop the keep-alive, if running ─────────────────────────────
         if keep_alive_task:
             keep_alive_task.cancel()
+        if playout_task:
+            playout_task.cancel()
+        if openai_ws is not None:                # Twilio may drop without a `stop`
+            await _close_quietly(openai_ws)
 
-        # ── save the transcript to WordPress (only if we have anything) ─
+        if uplink is not None:
+            logging.info("[UPLINK] %s: %s", call_sid, uplink.stats())
+
+        # ── queue the transcript for WordPress (only if we have anything) ─
+        #    one local SQLite insert; the outbox flusher does the POST
         if transcript:
             try:
-                logging.debug("[MEDIA] FINALLY: about to save_call_to_wp()")
-                await asyncio.wait_for(
-                    save_call_to_wp(
-                        transcript=transcript,             # ← raw list, no extra formatting
-                        prompt=call_ctx.get("prompt", ""),
-                        call_sid=call_ctx.get("call_sid", ""),
-                        started_at=datetime.utcnow()
-                                           .isoformat(timespec="seconds") + "Z"
-                    ),
-                    timeout=20                            # give it max 20 s before Heroku kills us
+                await enqueue_call_log(
+                    turns=transcript.turns(),
+                    prompt=call_ctx.get("prompt", ""),
+                    call_sid=call_sid or "",
+                    stream_sid=stream_sid or "",
+                    started_at=call_ctx.get("started_at")
+                               or datetime.utcnow().isoformat(timespec="seconds") + "Z",
+                    phone=call_ctx.get("phone", ""),
                 )
-                logging.info("[MEDIA] FINALLY: WP save completed")
-            except asyncio.TimeoutError:
-                logging.error("[MEDIA] FINALLY: WP save TIMED-OUT (20 s)")
             except Exception as exc:
-                logging.error(f"[MEDIA] FINALLY: WP save raised {exc!r}")
+                logging.error("[MEDIA] FINALLY: could not queue call log: %r", exc)
         else:
             logging.warning("[MEDIA] FINALLY: transcript empty – skipping WP save")
 
@@ -1038,6 +1734,8 @@ async def handle_media_stream(websocket: WebSocket):
         except Exception:
             pass
 
+        await calls.release(call_sid)
+
         logging.info("[MEDIA] WebSocket closed")
 
 
@@ -1063,52 +1761,43 @@ async def handle_media_stream(websocket: WebSocket):
 import time
 from xml.sax.saxutils import escape as _xml_escape
 
-# --- simple in-memory cache (refresh every 5 min) --------------------
-# ------------ per-user destination cache ----------------------------
-# key   = account phone number  (e.g. "+15551234567")
-# value = list[dict]            (destinations for that account)
-_DEST_CACHE: dict[str, list] = {}
-_DEST_TIME : dict[str, float] = {}
-_DEST_TTL  = 300   # seconds
-# --------------------------------------------------------------------
-
-def _fetch_destinations(phone: str) -> list[dict]:
+async def _fetch_destinations(phone: str) -> list[dict]:
     """
     Ask WordPress for *this* account’s list:
       GET /destinations?phone=+1555…
     (WordPress handler returns only rows owned by that user.)
+    Runs as part of the account profile fetch.
     """
     url = f"{WORDPRESS_SITE_URL}/wp-json/ai-reception/v1/destinations-by-phone"
-    try:
-        r = requests.get(url, params={"phone": phone}, timeout=10)
-        r.raise_for_status()
-        data = r.json() or []
-        logging.debug(f"[DEST] {phone}: fetched {len(data)} rows")
-        return data
-    except Exception as exc:
-        logging.error(f"[DEST] fetch failed for {phone}: {exc}")
-        return []
-
-def _destinations(phone: str) -> list[dict]:
-    now = time.time()
-    if (phone not in _DEST_CACHE) or (now - _DEST_TIME.get(phone, 0) > _DEST_TTL):
-        _DEST_CACHE[phone] = _fetch_destinations(phone)
-        _DEST_TIME[phone]  = now
-    return _DEST_CACHE[phone]
-
-def _find_dest(phone: str, label: str) -> dict | None:
-    """case-insensitive match inside that user’s list"""
-    label_lc = label.strip().lower()
-    return next((d for d in _destinations(phone)
-                 if d.get("label", "").lower() == label_lc), None)
-
-
-
-
+    r = await http_request("GET", url, params={"phone": phone})
+    r.raise_for_status()
+    data = r.json() or []
+    logging.debug("[DEST] %s: fetched %s rows", phone, len(data))
+    return data
 
+async def _destinations(phone: str) -> list[dict]:
+    """this account’s destinations, straight from the account cache"""
+    return (await load_account_profile(phone))["destinations"]
 
+# phone → DestIndex of the destination list currently cached for it
+_DEST_INDEX = _TTLCache(PROFILE_CACHE_MAX, PROFILE_CACHE_TTL + PROFILE_CACHE_STALE)
 
+async def _dest_index(phone: str) -> destindex.DestIndex:
+    """
+    that account’s label index – rebuilt only when the profile cache
+    hands out a different destinations list (i.e. after a refresh)
+    """
+    dests = await _destinations(phone)
+    hit = _DEST_INDEX.get(phone)
+    if hit is not None and hit[0].dests is dests:
+        return hit[0]
+    index = destindex.DestIndex(dests)
+    _DEST_INDEX.put(phone, index)
+    return index
 
+async def _find_dest(phone: str, label: str) -> dict | None:
+    """that user’s destination for `label`: exact, else closest (same rule as /redirecting-call)"""
+    return (await _dest_index(phone)).resolve(label)
 
 
 
@@ -1207,21 +1896,13 @@ async def handle_redirecting_call(request: Request):
     elif raw_lbl:
         
         # ---------- tolerant destination lookup ----------
-        desired = _norm(raw_lbl)
-
         # 1) exact match (case- / space- / punctuation-insensitive)
-        dest = next((d for d in _destinations(phone)
-                    if _norm(d.get("label")) == desired), None)
-
         # 2) close-match fallback (handles small typos)
-        if not dest:
-            choices   = {_norm(d.get("label")): d for d in _destinations(phone)}
-            match_key = next(iter(get_close_matches(desired, choices.keys(), n=1, cutoff=0.7)), None)
-            dest      = choices.get(match_key)
+        dest = (await _dest_index(phone)).resolve(raw_lbl)
 
         # 3) still nothing → polite apology instead of 404 / crash
         if not dest:
-            logging.warning(f"[REDIRECT] label '{raw_lbl}' not found for {phone}")
+            logging.warning("[REDIRECT] label '%s' not found for %s", raw_lbl, phone)
             return Response(
                 content=(
                     "<?xml version='1.0' encoding='UTF-8'?>"
@@ -1269,7 +1950,6 @@ async def handle_redirecting_call(request: Request):
 from twilio.base.exceptions import TwilioRestException
 from twilio.base.page import Page
 from fastapi.responses import JSONResponse
-from functools import lru_cache
 
 def _collect_all(pages: Page) -> list:
     """Helper: iterate through a Twilio paging generator into one list."""
@@ -1278,26 +1958,30 @@ def _collect_all(pages: Page) -> list:
         out.append(n.phone_number)
     return out
 
-@lru_cache(maxsize=256)        # cache results for identical queries
-def _local_prefix(prefix6: str, full: str) -> list[str]:
+# prefix6 → every local number Twilio has "containing" it (max 1 000)
+_PREFIX_CACHE    = _TTLCache(max_entries=256, ttl=600)
+_PREFIX_INFLIGHT: dict[str, asyncio.Future] = {}
+
+async def _local_prefix(prefix6: str, full: str) -> list[str]:
     """
     Ask Twilio for every local number containing `prefix6`
     (max 1 000 – Twilio hard limit) then return only those
     whose national part starts with `full`.
     """
-    nums = []
+    async def fetch() -> list[str]:
+        nums = await twilio_async.local_numbers(contains=prefix6,
+                                                limit=1000,   # highest allowed
+                                                page_size=100)
+        _PREFIX_CACHE.put(prefix6, nums)
+        return nums
+
+    hit = _PREFIX_CACHE.get(prefix6)
     try:
-        pages = twilio_client.available_phone_numbers("US") \
-                             .local.list(contains=prefix6,
-                                          limit=1000,   # highest allowed
-                                          page_size=100)
-        for pn in pages:
-            nat = pn.phone_number.lstrip("+1")
-            if nat.startswith(full):
-                nums.append(pn.phone_number)
-    except TwilioRestException as e:
-        logging.warning(f"Local search error: {e.status} {e.msg}")
-    return nums
+        nums = hit[0] if hit else await _coalesced(_PREFIX_INFLIGHT, prefix6, fetch)
+    except (TwilioRestException, asyncio.TimeoutError) as e:
+        logging.warning("Local search error: %r", e)
+        return []
+    return [n for n in nums if n.lstrip("+1").startswith(full)]
 
 
 @app.post("/api/search-numbers")
@@ -1319,36 +2003,34 @@ async def search_numbers(request: Request, x_wp_nonce: str = Header(None)):
         # ---------- area-code (exactly 3) ----------
         if len(digits) == 3:
             try:
-                ac = twilio_client.available_phone_numbers("US") \
-                                   .local.list(area_code=int(digits), limit=1000)
-                numbers = [n.phone_number for n in ac]
-            except TwilioRestException as e:
-                logging.error(f"Area-code search error: {e.status} {e.msg}")
+                numbers = await twilio_async.local_numbers(area_code=int(digits), limit=1000)
+            except (TwilioRestException, asyncio.TimeoutError) as e:
+                logging.error("Area-code search error: %r", e)
                 numbers = []
             return JSONResponse({"numbers": numbers}, 200)
 
         # ---------- prefix (4-10) ----------
         prefix6 = digits[:6]
-        numbers = _local_prefix(prefix6, digits)
-
-        # optional: toll-free when ≤7 digits
-        if len(digits) <= 7:
+        # optional: toll-free when ≤7 digits – searched alongside the local one
+        async def toll_free() -> list[str]:
+            if len(digits) > 7:
+                return []
             try:
-                tf_pages = twilio_client.available_phone_numbers("US") \
-                                        .toll_free.list(contains=digits,
-                                                        limit=100,
-                                                        page_size=100)
-                for pn in tf_pages:
-                    nat = pn.phone_number.lstrip("+1")
-                    if nat.startswith(digits):
-                        numbers.append(pn.phone_number)
-            except TwilioRestException as e:
-                logging.info(f"Toll-free skipped: {e.status} {e.msg}")
+                tf = await twilio_async.toll_free_numbers(contains=digits,
+                                                          limit=100,
+                                                          page_size=100)
+            except (TwilioRestException, asyncio.TimeoutError) as e:
+                logging.info("Toll-free skipped: %r", e)
+                return []
+            return [n for n in tf if n.lstrip("+1").startswith(digits)]
+
+        local, tf = await asyncio.gather(_local_prefix(prefix6, digits), toll_free())
+        numbers = local + tf
 
         return JSONResponse({"numbers": numbers}, 200)
 
     except Exception as e:
-        logging.error(f"search_numbers fatal: {e}")
+        logging.error("search_numbers fatal: %s", e)
         return JSONResponse({"error": "Server error"}, 500)
 
 
@@ -1399,10 +2081,9 @@ async def provision_number(request: Request, x_wp_nonce: str = Header(None)):
             return JSONResponse({"error": "selected_number is required"}, status_code=400)
 
         # Purchase the number and set its incoming-call webhook
-        purchased_number = twilio_client.incoming_phone_numbers.create(
-            phone_number=selected_number,
+        purchased_number = await twilio_async.buy_number(
+            selected_number,
             voice_url="https://glacial-lake-09133-1b024ab03664.herokuapp.com/incoming-call",
-            voice_method="POST",
         )
 
         return JSONResponse(
@@ -1411,7 +2092,7 @@ async def provision_number(request: Request, x_wp_nonce: str = Header(None)):
         )
 
     except Exception as e:
-        logging.error(f"Error purchasing number from Twilio: {e}")
+        logging.error("Error purchasing number from Twilio: %s", e)
         return JSONResponse({"error": str(e)}, status_code=400)
 
 
@@ -1432,36 +2113,36 @@ async def get_script(current_user=Depends(get_current_user)):
     user_id = current_user.id
     file_path = os.path.join(SCRIPTS_DIR, f"user_{user_id}_app.py")
     phone_file_path = os.path.join(SCRIPTS_DIR, f"user_{user_id}_phone.txt")
-    logging.info(f"User {user_id} ({current_user.email}) is requesting their script from: {file_path}")
+    logging.info("User %s (%s) is requesting their script from: %s", user_id, current_user.email, file_path)
     os.makedirs(SCRIPTS_DIR, exist_ok=True)
     try:
         with open(file_path, "r") as f:
             code = f.read()
-        logging.info(f"Successfully loaded script for user {user_id}.")
+        logging.info("Successfully loaded script for user %s.", user_id)
     except FileNotFoundError as e:
-        logging.error(f"File not found: {file_path}. Exception: {e}")
+        logging.error("File not found: %s. Exception: %s", file_path, e)
         code = "# Default AI Receptionist Script\nprint('Hello from your AI receptionist!')\n"
         try:
             with open(file_path, "w") as f:
                 f.write(code)
-            logging.info(f"Default script created for user {user_id}.")
+            logging.info("Default script created for user %s.", user_id)
         except Exception as write_error:
-            logging.error(f"Failed to create default script file for user {user_id}: {write_error}")
+            logging.error("Failed to create default script file for user %s: %s", user_id, write_error)
             raise HTTPException(status_code=500, detail=str(write_error))
     except Exception as e:
-        logging.error(f"Error reading file for user {user_id}: {e}")
+        logging.error("Error reading file for user %s: %s", user_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
     # Load phone number
     try:
         with open(phone_file_path, "r") as pf:
             phone_number = pf.read().strip()
-        logging.info(f"Loaded phone number for user {user_id}: {phone_number}")
+        logging.info("Loaded phone number for user %s: %s", user_id, phone_number)
     except FileNotFoundError:
-        logging.warning(f"Phone number file not found for user {user_id}. Using default value.")
+        logging.warning("Phone number file not found for user %s. Using default value.", user_id)
         phone_number = "No number provisioned"
     except Exception as e:
-        logging.error(f"Error reading phone number file for user {user_id}: {e}")
+        logging.error("Error reading phone number file for user %s: %s", user_id, e)
         phone_number = "Error reading number"
 
     return {"user_id": user_id, "user_email": current_user.email, "phone_number": phone_number, "code": code}
@@ -1477,7 +2158,7 @@ async def save_script(payload: dict, current_user=Depends(get_current_user)):
         with open(file_path, "w") as f:
             f.write(code)
     except Exception as e:
-        logging.error(f"Error saving file for user {user_id}: {e}")
+        logging.error("Error saving file for user %s: %s", user_id, e)
         raise HTTPException(status_code=500, detail=f"Could not save file: {e}")
     return {"status": "success"}
 
@@ -1488,24 +2169,24 @@ async def save_script(payload: dict, current_user=Depends(get_current_user)):
 async def get_prompt(current_user=Depends(get_current_user)):
     user_id = current_user.id
     file_path = os.path.join(SCRIPTS_DIR, f"user_{user_id}_prompt.txt")
-    logging.info(f"User {user_id} ({current_user.email}) is requesting their prompt from: {file_path}")
+    logging.info("User %s (%s) is requesting their prompt from: %s", user_id, current_user.email, file_path)
     os.makedirs(SCRIPTS_DIR, exist_ok=True)
     try:
         with open(file_path, "r") as f:
             prompt = f.read()
-        logging.info(f"Successfully loaded prompt for user {user_id}.")
+        logging.info("Successfully loaded prompt for user %s.", user_id)
     except FileNotFoundError as e:
-        logging.error(f"Prompt file not found: {file_path}. Exception: {e}")
+        logging.error("Prompt file not found: %s. Exception: %s", file_path, e)
         prompt = "Default prompt: You are an AI receptionist. Answer calls professionally."
         try:
             with open(file_path, "w") as f:
                 f.write(prompt)
-            logging.info(f"Default prompt created for user {user_id}.")
+            logging.info("Default prompt created for user %s.", user_id)
         except Exception as write_error:
-            logging.error(f"Failed to create default prompt file for user {user_id}: {write_error}")
+            logging.error("Failed to create default prompt file for user %s: %s", user_id, write_error)
             raise HTTPException(status_code=500, detail=str(write_error))
     except Exception as e:
-        logging.error(f"Error reading prompt for user {user_id}: {e}")
+        logging.error("Error reading prompt for user %s: %s", user_id, e)
         raise HTTPException(status_code=500, detail=str(e))
     return {"user_id": user_id, "user_email": current_user.email, "prompt": prompt}
 
@@ -1519,9 +2200,9 @@ async def save_prompt(payload: dict, current_user=Depends(get_current_user)):
     try:
         with open(file_path, "w") as f:
             f.write(prompt)
-        logging.info(f"Prompt saved for user {user_id}.")
+        logging.info("Prompt saved for user %s.", user_id)
     except Exception as e:
-        logging.error(f"Error saving prompt for user {user_id}: {e}")
+        logging.error("Error saving prompt for user %s: %s", user_id, e)
         raise HTTPException(status_code=500, detail=f"Could not save prompt: {e}")
     return {"status": "success"}
 
@@ -1547,7 +2228,7 @@ async def send_session_update(
     frame, and return the dict.
     """
     # 1) Fetch destinations for this phone
-    dests = _destinations(phone) or []
+    dests = await _destinations(phone) or []
     dest_lines = [
         f"• **{d.get('label','(no label)')}** – {d.get('description', '(no description)')}"
         for d in dests
@@ -1567,7 +2248,7 @@ async def send_session_update(
         sys_parts.append("⚠️  No transfer destinations are configured – just answer questions.")
 
     instructions = "\n\n".join(sys_parts)
-    logging.debug(f"[SESSION] built instructions for {phone}:\n{instructions}")
+    logging.debug("[SESSION] built instructions for %s:\n%s", phone, instructions)
 
     # 3) Build the tools list ONLY if we actually have destinations
     tools = []
@@ -1613,26 +2294,428 @@ async def send_session_update(
 
 
 
+# ======================================================================
+#  REALTIME PRE-CONNECT  –  open + configure the OpenAI WS during <Play>
+# ======================================================================
+REALTIME_URL          = "wss://api.openai.com/v1/realtime"
+REALTIME_PRECONNECT   = os.getenv("REALTIME_PRECONNECT", "1") == "1"
+REALTIME_PARK_TIMEOUT = int(os.getenv("REALTIME_PARK_TIMEOUT", 60))   # s before an unclaimed socket is reaped
+
+
+def _realtime_model(voice: str) -> str:
+    """alloy runs on the mini model, every other voice on the full one"""
+    return (
+        "gpt-4o-mini-realtime-preview-2024-12-17"
+        if voice == "alloy"
+        else "gpt-4o-realtime-preview-2024-12-17"
+    )
+
+
+async def open_realtime_ws(voice: str):
+    """TLS + WS handshake to the Realtime API for `voice`'s model."""
+    started, ok = time.perf_counter(), False
+    try:
+        ws = await websockets.connect(
+            f"{REALTIME_URL}?model={_realtime_model(voice)}&voice={voice}",
+            extra_headers={
+                "Authorization": f"Bearer {OPENAI_API_KEY}",
+                "OpenAI-Beta":   "realtime=v1"
+            }
+        )
+        ok = True
+        return ws
+    finally:
+        metrics.rest_observe("openai_realtime", started, ok)
+
+
+# ----------------------------------------------------------------------
+#  Warm pool: idle, already-authenticated sockets per (model, voice)
+# ----------------------------------------------------------------------
+REALTIME_POOL_MIN      = int(os.getenv("REALTIME_POOL_MIN", 1))        # idle sockets kept per key
+REALTIME_POOL_MAX      = int(os.getenv("REALTIME_POOL_MAX", 6))        # idle + connecting, per key
+REALTIME_POOL_MAX_IDLE = int(os.getenv("REALTIME_POOL_MAX_IDLE", 240)) # s an idle socket may sit unused
+REALTIME_POOL_VOICES   = [v.strip() for v in os.getenv("REALTIME_POOL_VOICES", DEFAULT_VOICE).split(",") if v.strip()]
+
+
+class _RealtimePool:
+    """
+    Keeps a few handshaken Realtime sockets per (model, voice) so a call
+    only pays for its session.update.  Sockets are single-use: checkout()
+    hands one out and a replacement is dialled in the background.
+
+    The per-key target starts at `min_idle`, grows by one on every miss
+    (call spikes) up to `max_size`, and shrinks again whenever an idle
+    socket ages out unused.
+    """
+
+    def __init__(self, *, min_idle: int, max_size: int, max_idle_age: float):
+        self.min_idle     = min_idle
+        self.max_size     = max_size
+        self.max_idle_age = max_idle_age
+        self._idle: dict[tuple, deque]  = {}    # key → deque[(parked_at, ws)]
+        self._connecting: dict[tuple, int] = {}
+        self._target: dict[tuple, int]  = {}
+        self._fills: set[asyncio.Task] = set() # background connects, cancelled on close()
+        self._closed = False
+        self.hits   = 0
+        self.misses = 0
+        self._janitor: asyncio.Task | None = None
+
+    @staticmethod
+    def _key(voice: str) -> tuple:
+        return (_realtime_model(voice), voice)
+
+    async def checkout(self, voice: str):
+        key = self._key(voice)
+        idle = self._idle.setdefault(key, deque())
+        cutoff = time.monotonic() - self.max_idle_age
+        while idle:
+            parked_at, ws = idle.popleft()
+            if parked_at >= cutoff and not ws.closed:
+                self.hits += 1
+                self._replenish(key)
+                return ws
+            asyncio.ensure_future(_close_quietly(ws))
+
+        self.misses += 1
+        self._target[key] = min(self.max_size, self._target.get(key, self.min_idle) + 1)
+        self._replenish(key)
+        return await open_realtime_ws(voice)
+
+    def warm(self, voices) -> None:
+        for voice in voices:
+            self._replenish(self._key(voice))
+
+    def _replenish(self, key: tuple) -> None:
+        if self._closed:
+            return
+        target = min(self.max_size, self._target.setdefault(key, self.min_idle))
+        have   = len(self._idle.get(key, ())) + self._connecting.get(key, 0)
+        for _ in range(max(0, target - have)):
+            self._connecting[key] = self._connecting.get(key, 0) + 1
+            task = asyncio.ensure_future(self._fill_one(key))
+            self._fills.add(task)
+            task.add_done_callback(self._fills.discard)
+
+    async def _fill_one(self, key: tuple) -> None:
+        try:
+            ws = await open_realtime_ws(key[1])
+            if self._closed:
+                await _close_quietly(ws)
+                return
+            self._idle.setdefault(key, deque()).append((time.monotonic(), ws))
+        except Exception as exc:
+            logging.warning("[POOL] warm connect %s failed: %r", key, exc)
+        finally:
+            self._connecting[key] -= 1
+
+    async def _sweep(self) -> None:
+        """Retire sockets that sat idle too long (or died) and top keys back up."""
+        while True:
+            await asyncio.sleep(15)
+            cutoff = time.monotonic() - self.max_idle_age
+            for key, idle in self._idle.items():
+                keep = deque()
+                for parked_at, ws in idle:
+                    if parked_at >= cutoff and not ws.closed:
+                        keep.append((parked_at, ws))
+                        continue
+                    asyncio.ensure_future(_close_quietly(ws))
+                    if parked_at < cutoff:          # demand dropped – shrink toward min
+                        self._target[key] = max(self.min_idle, self._target.get(key, self.min_idle) - 1)
+                self._idle[key] = keep
+                self._replenish(key)
+
+    def start(self, voices) -> None:
+        if self._janitor is None:
+            self._janitor = asyncio.ensure_future(self._sweep())
+        self.warm(voices)
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._janitor:
+            self._janitor.cancel()
+            self._janitor = None
+        # a cancelled handshake closes its own socket; one that finished
+        # meanwhile sees _closed and closes it in _fill_one
+        fills = list(self._fills)
+        for task in fills:
+            task.cancel()
+        await asyncio.gather(*fills, return_exceptions=True)
+        for idle in self._idle.values():
+            while idle:
+                await _close_quietly(idle.popleft()[1])
+
+    def stats(self) -> dict:
+        return {
+            "hits":   self.hits,
+            "misses": self.misses,
+            "keys": {
+                f"{model}/{voice}": {
+                    "idle":       len(self._idle.get((model, voice), ())),
+                    "connecting": self._connecting.get((model, voice), 0),
+                    "target":     self._target.get((model, voice), self.min_idle),
+                }
+                for model, voice in set(self._idle) | set(self._target)
+            },
+        }
+
+
+REALTIME_POOL = _RealtimePool(
+    min_idle=REALTIME_POOL_MIN,
+    max_size=REALTIME_POOL_MAX,
+    max_idle_age=REALTIME_POOL_MAX_IDLE,
+)
+
+
+async def open_realtime_session(*, prompt: str, voice: str, phone: str):
+    """Connected *and* configured socket, ready for caller audio."""
+    ws = await REALTIME_POOL.checkout(voice)
+    try:
+        await send_session_update(ws, prompt=prompt, voice=voice, phone=phone)
+    except BaseException:                   # cancelled (reaped / shutdown) included
+        await _close_quietly(ws)
+        raise
+    return ws
+
+
+async def _close_quietly(ws) -> None:
+    try:
+        await ws.close(code=1000, reason="unused")
+    except Exception:
+        pass
+
+
+# CallSid → (parked_at, Task resolving to a configured socket)
+_PARKED: dict[str, tuple[float, asyncio.Task]] = {}
+
+
+def park_realtime_session(call_sid: str, *, prompt: str, voice: str, phone: str) -> None:
+    """Kick off open_realtime_session() in the background for this call."""
+    if call_sid in _PARKED:                 # Twilio retried the webhook
+        return
+    task = asyncio.ensure_future(open_realtime_session(prompt=prompt, voice=voice, phone=phone))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())   # mark exception retrieved
+    _PARKED[call_sid] = (time.monotonic(), task)
+    logging.debug("[PRECONNECT] parked realtime session for %s", call_sid)
+
+
+async def adopt_realtime_session(call_sid: str | None):
+    """
+    Hand the pre-connected socket for `call_sid` to the media stream.
+    None when nothing was parked, the connect failed or the socket died –
+    the caller then connects the slow way.
+    """
+    parked = _PARKED.pop(call_sid, None) if call_sid else None
+    if parked is None:
+        return None
+    try:
+        ws = await parked[1]
+    except Exception as exc:
+        logging.warning("[PRECONNECT] parked connect for %s failed: %r", call_sid, exc)
+        return None
+    if ws.closed:
+        return None
+    logging.debug("[PRECONNECT] adopted realtime session for %s", call_sid)
+    return ws
+
+
+async def _discard_parked(task: asyncio.Task) -> None:
+    if not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return
+    if not task.cancelled() and task.exception() is None:
+        await _close_quietly(task.result())
+
+
+async def _reap_parked_sessions():
+    """Close sockets whose call never reached /media-stream (caller hung up during <Play>)."""
+    while True:
+        await asyncio.sleep(5)
+        cutoff = time.monotonic() - REALTIME_PARK_TIMEOUT
+        for sid in [sid for sid, (ts, _) in _PARKED.items() if ts < cutoff]:
+            _, task = _PARKED.pop(sid)
+            logging.info("[PRECONNECT] reaping orphaned session for %s", sid)
+            await _discard_parked(task)
+
+
+@app.on_event("startup")
+async def _start_realtime_background():
+    asyncio.ensure_future(_reap_parked_sessions())
+    if REALTIME_POOL_MIN > 0:
+        REALTIME_POOL.start(REALTIME_POOL_VOICES)
+
+
+async def _expire_call_contexts():
+    while True:
+        await asyncio.sleep(30)
+        if n := calls.expire():
+            logging.info("[CALLS] expired %s contexts that never reached /media-stream", n)
+
+
+@app.on_event("startup")
+async def _start_call_expiry():
+    asyncio.ensure_future(_expire_call_contexts())
+
+
+@app.get("/debug-calls")
+async def debug_calls():
+    """live / pending gauges and lifetime totals of the call registry"""
+    return {**calls.stats(), "backend": type(call_state).__name__}
+
+
+@app.on_event("shutdown")
+async def _close_call_state():
+    await call_state.close()
+
+
+@app.on_event("shutdown")
+async def _close_realtime_pool():
+    await REALTIME_POOL.close()
+    while _PARKED:
+        await _discard_parked(_PARKED.popitem()[1][1])
+
+
+@app.get("/debug-pool")
+async def debug_pool():
+    """hit / miss counters and per-key sizes of the Realtime warm pool"""
+    return REALTIME_POOL.stats()
+
+
+
+
+
+
+
+
+
 async def send_stop_audio(openai_ws):
     try:
         stop_audio = {"type": "response.cancel"}
         await openai_ws.send(json.dumps(stop_audio))
         logging.debug("Sent stop audio command to OpenAI.")
     except Exception as e:
-        logging.error(f"Failed to send stop_audio command to OpenAI: {e}")
+        logging.error("Failed to send stop_audio command to OpenAI: %s", e)
+
+
+
+
+
+
+
+
+
+
 
 
 
 
+# ── /preview-tts: streamed from OpenAI, content-addressed disk cache behind ──
+TTS_MODEL       = os.getenv("TTS_MODEL", "tts-1")
+TTS_CACHE       = ttscache.DiskLRU(
+    os.getenv("TTS_CACHE_DIR", "/tmp/kal-tts"),
+    max_bytes=int(os.getenv("TTS_CACHE_BYTES", 256 * 1024 * 1024)),
+)
+TTS_STREAM_CACHE = os.getenv("TTS_STREAM_CACHE", "1") != "0"   # 0 = stream only, never store
+_TTS_INFLIGHT: dict[str, ttscache.Tee] = {}
 
 
+class TTSError(Exception):
+    pass
 
 
+async def _stream_tts(tee: ttscache.Tee, voice: str, text: str) -> None:
+    """
+    Producer for one preview miss: /v1/audio/speech body → tee, chunk by
+    chunk, and (TTS_STREAM_CACHE) into a temp file that is committed to
+    TTS_CACHE only once the body is complete.  Cancelled when the last
+    browser reading the tee goes away; the temp file is dropped then.
+    """
+    tmp = out = None
+    try:
+        async with http_stream(
+            "POST",
+            "https://api.openai.com/v1/audio/speech",
+            headers={
+                "Authorization": f"Bearer {OPENAI_API_KEY}",
+                "Content-Type":  "application/json"
+            },
+            json={
+                "model": TTS_MODEL,
+                "voice": voice,
+                "input": text
+            },
+            timeout=30
+        ) as resp:
+            # Error check
+            if resp.status_code != 200:
+                detail = (await resp.aread()).decode(errors="replace")
+                logging.error("TTS HTTP error %s: %s", resp.status_code, detail)
+                raise TTSError(f"TTS HTTP {resp.status_code}: {detail}")
+
+            # raw audio is streamed as it arrives; the JSON → base64 shape can only be read whole
+            ctype = resp.headers.get("Content-Type", "")
+            if ctype.startswith("audio/"):
+                body = resp.aiter_bytes()
+            else:
+                audio_b64 = json.loads(await resp.aread()).get("audio", "")
+                if not audio_b64:
+                    raise TTSError("No `audio` field in TTS JSON response")
+                ctype = "audio/mpeg"
+                body = _one_chunk(base64.b64decode(audio_b64))
+
+            if TTS_STREAM_CACHE:
+                tmp = TTS_CACHE.tmp_path(tee.key, ctype)
+                out = open(tmp, "wb")
+            tee.start(ctype)
+            async for chunk in body:
+                tee.feed(chunk)
+                if out is not None:
+                    out.write(chunk)                 # page-cache write of a few KiB
+        if out is not None:
+            out.close()
+            await asyncio.to_thread(TTS_CACHE.commit, tee.key, tmp, ctype)
+            tmp = None
+        tee.finish()
+    except asyncio.CancelledError:
+        tee.finish(TTSError("preview abandoned"))
+        raise
+    except TTSError as exc:
+        tee.finish(exc)
+    except Exception as exc:
+        logging.error("[TTS] preview stream failed: %r", exc)
+        tee.finish(TTSError(f"TTS stream failed: {exc!r}"))
+    finally:
+        if out is not None and not out.closed:
+            out.close()
+        if tmp is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp)
+
 
+async def _one_chunk(data: bytes):
+    yield data
 
 
+def _tts_release(tee: ttscache.Tee) -> None:
+    """A reader is gone; with nobody left, stop paying for the upstream stream."""
+    tee.readers -= 1
+    if tee.readers <= 0 and not tee.done and tee.task is not None:
+        if _TTS_INFLIGHT.get(tee.key) is tee:
+            del _TTS_INFLIGHT[tee.key]
+        tee.task.cancel()
 
 
+async def _tts_body(tee: ttscache.Tee):
+    try:
+        async for chunk in tee.read():
+            yield chunk
+    except TTSError as exc:                      # headers are out – all we can do is stop
+        logging.warning("[TTS] preview cut short: %s", exc)
+    finally:
+        _tts_release(tee)
+
 
 @app.post("/preview-tts")
 async def preview_tts(request: Request):
@@ -1645,98 +2728,181 @@ async def preview_tts(request: Request):
     if voice not in ALLOWED_VOICES:
         voice = DEFAULT_VOICE
 
-    resp = requests.post(
-        "https://api.openai.com/v1/audio/speech",
-        headers={
-            "Authorization": f"Bearer {OPENAI_API_KEY}",
-            "Content-Type":  "application/json"
-        },
-        json={
-            "model": "tts-1",
-            "voice": voice,
-            "input": text
-        },
-        timeout=30
-    )
-
-    # 3) Error check
-    if resp.status_code != 200:
-        logging.error(f"TTS HTTP error {resp.status_code}: {resp.text}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": f"TTS HTTP {resp.status_code}: {resp.text}"}
+    headers = {"Cache-Control": "private, max-age=86400"}
+    key = ttscache.DiskLRU.key(TTS_MODEL, voice, text)
+    hit = await TTS_CACHE.get(key)
+    if hit is not None:
+        path, ctype = hit
+        return FileResponse(path, media_type=ctype, headers=headers)
+
+    # identical concurrent previews read the same upstream stream
+    tee = _TTS_INFLIGHT.get(key)
+    if tee is None:
+        tee = _TTS_INFLIGHT[key] = ttscache.Tee(key)
+        tee.task = asyncio.ensure_future(_stream_tts(tee, voice, text))
+        tee.task.add_done_callback(
+            lambda _t: _TTS_INFLIGHT.pop(key) if _TTS_INFLIGHT.get(key) is tee else None
         )
+    tee.readers += 1
+    try:
+        ctype = await tee.head()
+    except BaseException as exc:                 # upstream error, or the browser left first
+        _tts_release(tee)
+        if isinstance(exc, TTSError):
+            return JSONResponse(status_code=500, content={"error": str(exc)})
+        raise
+    # the reader count taken above is handed to _tts_body, which releases it
+    return StreamingResponse(_tts_body(tee), media_type=ctype, headers=headers)
 
-    # 4) Return raw audio bytes if that's what we got
-    ctype = resp.headers.get("Content-Type", "")
-    if ctype.startswith("audio/"):
-        return StreamingResponse(BytesIO(resp.content), media_type=ctype)
 
-    # 5) Otherwise decode JSON->base64
-    data = resp.json()
-    audio_b64 = data.get("audio", "")
-    if not audio_b64:
-        return JSONResponse(
-            status_code=500,
-            content={"error": "No `audio` field in TTS JSON response"}
-        )
+@app.get("/debug-tts-cache")
+async def debug_tts_cache():
+    return TTS_CACHE.stats()
+
 
-    audio_bytes = base64.b64decode(audio_b64)
-    return StreamingResponse(BytesIO(audio_bytes), media_type="audio/mpeg")
 
 
+# ======================================================================
+#  CALL LOGS  –  durable outbox → batched WordPress POSTs
+# ======================================================================
+CALL_LOG_OUTBOX_PATH = os.getenv("CALL_LOG_OUTBOX", "/tmp/kal-call-log.db")
+CALL_LOG_BATCH       = min(25, int(os.getenv("CALL_LOG_BATCH", 10)))   # WP caps a batch at 25
+_WP_BATCH            = os.getenv("WP_BATCH", "1") != "0"               # off after a 404 too
+
+# polishing + JSON encoding of finished calls, off the audio event loop (0 = inline)
+POLISH_POOL = polish.PolishPool(
+    int(os.getenv("POLISH_WORKERS", 1)),
+    max_pending=int(os.getenv("POLISH_MAX_PENDING", 8)),
+    inline_below=int(os.getenv("POLISH_INLINE_LINES", 200)),   # smaller jobs aren't worth the IPC
+    timeout=float(os.getenv("POLISH_TIMEOUT", 60)),             # then inline; keeps the lease safe
+)
 
 
-async def save_call_to_wp(*, transcript, prompt, call_sid, started_at, phone):
-    """
-    POST the finished call into WordPress as a private `call_log` post.
-    """
-    # ── NEW: squash the word-by-word deltas ───────────────────────────
-    cleaned = _polish_transcript(transcript)
-    logging.debug(f"[WP-SAVE] after squash → {len(transcript)} lines")
+def _call_log_key(call_sid: str, stream_sid: str = "") -> str:
+    """Idempotency key: the outbox row id and the WP post slug."""
+    return f"call-{call_sid or stream_sid}".lower()
 
-    logging.debug(f"[WP-SAVE] ENTER save_call_to_wp: call_sid={call_sid!r}, prompt_len={len(prompt)}")
-    logging.debug(f"[WP-SAVE] transcript length = {len(transcript)}")
 
+async def enqueue_call_log(*, turns, prompt, call_sid, stream_sid="", started_at, phone) -> None:
+    key = _call_log_key(call_sid, stream_sid)
+    added = await CALL_LOG_OUTBOX.put(key, {
+        "turns":      turns,
+        "prompt":     prompt,
+        "call_sid":   call_sid,
+        "started_at": started_at,
+        "phone":      phone,
+    })
+    if added:
+        logging.info("[WP-SAVE] queued %s (%s turns)", key, len(turns))
+    else:
+        logging.warning("[WP-SAVE] %s already queued – ignoring duplicate", key)
+
+
+def _wp_auth_headers() -> dict | None:
     wp_user = os.environ.get("WP_API_USER")
     wp_pass = os.environ.get("WP_API_APP_PW")
     if not wp_user or not wp_pass:
-        logging.error("[WP-SAVE] missing WP_API_USER or WP_API_APP_PW – aborting")
-        return
-
-    endpoint = f"{WORDPRESS_SITE_URL}/wp-json/wp/v2/call_log"
+        return None
     auth_hdr = base64.b64encode(f"{wp_user}:{wp_pass}".encode()).decode()
-    headers  = {
+    return {
         "Authorization": f"Basic {auth_hdr}",
         "Content-Type" : "application/json"
     }
-    payload = {
-        "title":  f"Call {started_at}",
-        "status": "publish",                # ← was  "private"
-        "content": json.dumps(cleaned, ensure_ascii=False),
-        "meta": {
-            "prompt_used": prompt,
-            "call_sid":    call_sid,
-            "owner_phone": phone or ""
-        }
-    }
 
-    logging.debug(f"[WP-SAVE] payload = {payload!r}")
 
-    loop = asyncio.get_event_loop()
+async def _already_posted(key: str, headers: dict) -> bool:
+    """Did an earlier attempt reach WordPress after all (timeout after the insert)?"""
+    resp = await http_request("GET", f"{WORDPRESS_SITE_URL}/wp-json/wp/v2/call_log",
+                              params={"slug": key, "_fields": "id"}, headers=headers, timeout=10)
+    return resp.status_code == 200 and bool(resp.json())
+
+
+async def _post_call_logs(items: list[tuple[str, dict, int]]) -> list[bool]:
+    """Outbox sender: one WP batch request (or one POST each), True per delivered item."""
+    global _WP_BATCH
+    headers = _wp_auth_headers()
+    if headers is None:
+        logging.error("[WP-SAVE] missing WP_API_USER or WP_API_APP_PW – keeping %s call log(s) queued",
+                      len(items))
+        return [False] * len(items)
+
+    results = [False] * len(items)
+    todo, records = [], []
+    for i, (key, record, tries) in enumerate(items):
+        if tries and await _already_posted(key, headers):
+            logging.info("[WP-SAVE] %s was saved by an earlier attempt", key)
+            results[i] = True
+        else:
+            todo.append((i, key))
+            records.append((key, record))
+    if not todo:
+        return results
 
-    def do_post():
-        resp = requests.post(endpoint, headers=headers, json=payload, timeout=15)
-        logging.debug(f"[WP-SAVE] POST status = {resp.status_code}")
-        logging.debug(f"[WP-SAVE] POST body   = {resp.text[:300]} …")
-        resp.raise_for_status()
-        return resp
+    # polish (legacy raw records) + json.dumps of every post, in a worker process
+    lines  = sum(len(r.get("turns") or r.get("transcript") or ()) for _, r in records)
+    bodies = await POLISH_POOL.run(polish.encode_call_logs, records, size=lines)
+    todo   = [(i, key, body) for (i, key), body in zip(todo, bodies)]
 
-    try:
-        resp = await loop.run_in_executor(None, do_post)
-        logging.info(f"[WP-SAVE] SUCCESS: saved call_log ({len(transcript)} lines), HTTP {resp.status_code}")
-    except Exception as exc:
-        logging.error(f"[WP-SAVE] failed: {exc!r}")
+    endpoint = f"{WORDPRESS_SITE_URL}/wp-json/wp/v2/call_log"
+    if _WP_BATCH and len(todo) > 1:
+        # creates posts – only retried when it never reached WordPress
+        # the posts are already JSON: splice them into the batch envelope as bytes
+        envelope = b'{"validation":"normal","requests":[' + b",".join(
+            b'{"method":"POST","path":"/wp/v2/call_log","body":' + body + b"}" for _, _, body in todo
+        ) + b"]}"
+        resp = await http_request(
+            "POST", f"{WORDPRESS_SITE_URL}/wp-json/batch/v1", headers=headers, timeout=30,
+            idempotent=False, content=envelope,
+        )
+        if resp.status_code in (200, 207):
+            for (i, key, _), reply in zip(todo, resp.json().get("responses", [])):
+                results[i] = reply.get("status") in (200, 201)
+                if not results[i]:
+                    logging.error("[WP-SAVE] %s rejected in batch: %s %s", key,
+                                  reply.get("status"), str(reply.get("body"))[:300])
+            logging.info("[WP-SAVE] batch of %s: %s saved", len(todo), sum(results[i] for i, _, _ in todo))
+            return results
+        if resp.status_code == 404:
+            logging.warning("[WP-SAVE] no /batch/v1 on WordPress – posting one by one")
+            _WP_BATCH = False
+        else:
+            logging.error("[WP-SAVE] batch failed: HTTP %s %s", resp.status_code, resp.text[:300])
+            return results
+
+    for i, key, body in todo:
+        try:
+            resp = await http_request("POST", endpoint, headers=headers, content=body,
+                                      timeout=15, idempotent=False)
+            resp.raise_for_status()
+            results[i] = True
+            logging.info("[WP-SAVE] SUCCESS: saved %s, HTTP %s", key, resp.status_code)
+        except Exception as exc:
+            logging.error("[WP-SAVE] %s failed: %r", key, exc)
+    return results
+
+
+# a batch may fall back to one slug check + POST per row (~30 s worst case each);
+# the lease has to outlast that or another worker re-sends the tail of it
+CALL_LOG_OUTBOX = outbox.Outbox(CALL_LOG_OUTBOX_PATH, send=_post_call_logs, batch=CALL_LOG_BATCH,
+                                lease=max(120, 30 * CALL_LOG_BATCH))
+
+
+@app.on_event("startup")
+async def _start_call_log_outbox():
+    POLISH_POOL.start()                          # before the flusher's first batch
+    await CALL_LOG_OUTBOX.start()
+
+
+@app.on_event("shutdown")
+async def _close_call_log_outbox():
+    await CALL_LOG_OUTBOX.close()                # final flush still uses the pool
+    await POLISH_POOL.close()
+
+
+@app.get("/debug-call-logs")
+async def debug_call_logs():
+    """queued / retrying call logs, lifetime delivery counters, polish pool usage"""
+    return {**await CALL_LOG_OUTBOX.stats(), "polish": POLISH_POOL.stats()}
 
 
 
@@ -1745,7 +2911,7 @@ from fastapi import HTTPException
 
 @app.get("/debug-full-prompt/{phone}")
 async def debug_full_prompt(phone: str):
-    base = get_user_prompt_by_phone(phone)
+    base = (await load_account_profile(phone))["prompt"]
     if not base:
         raise HTTPException(404, "No base prompt for that number")
     full = (
@@ -1773,18 +2939,28 @@ async def debug_voice(phone: str):
     Return exactly whatever WordPress has saved for this number
     (so you can confirm FastAPI sees the right voice).
     """
-    voice = get_user_voice_by_phone(phone)
-    return {"voice": voice}
+    profile = await load_account_profile(phone)
+    return {"voice": profile["voice"]}
+
 
 
 
 
+# last shutdown hook (they run in registration order): the call-log
+# outbox's final flush and others still go through the pooled client
+app.on_event("shutdown")(_close_http_client)
+
 
 ############################
 # MAIN
 ############################
 if __name__ == "__main__":
     import uvicorn
+    import supervisor
     port = int(os.environ.get("PORT", 5050))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = supervisor.worker_count()
+    if workers > 1:
+        supervisor.run("app:app", host="0.0.0.0", port=port, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
 
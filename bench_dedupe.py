@@ -0,0 +1,134 @@
+"""
+Benchmark: transcript dedupe on synthetic 1-hour calls.
+
+    python bench_dedupe.py [--minutes 60] [--calls 3] [--seed 1]
+
+Each call is built the way the legacy media handler recorded it – word
+deltas of every utterance followed by its final transcript (often with a
+missed word or different punctuation), the AI repeating stock phrases –
+and squashed with polish._merge, which leaves every utterance twice in the
+list.  "before" is the old pairwise SequenceMatcher scan, "after" is
+dedupe.dedupe (MinHash/LSH candidates + the same ratio() check); the
+outputs are compared line by line.
+"""
+
+import argparse
+import copy
+import difflib
+import random
+import time
+
+import dedupe
+import textnorm
+from polish import _merge
+
+_norm = textnorm.norm_transcript.__wrapped__     # the old, uncached normaliser
+
+_WORDS = """
+hi hello yes no thanks thank you please sorry okay sure great perfect fine
+i we you they my our your their me us it this that these those there here
+would like need want can could should will may might do does did have has had
+book booking reserve reservation table appointment cancel change move confirm
+today tomorrow tonight morning afternoon evening monday tuesday wednesday
+thursday friday saturday sunday week next last at on in for with about from
+one two three four five six seven eight nine ten eleven twelve thirty fifteen
+people person guests adults kids children party name number phone email card
+parking address open close hours menu vegan gluten allergy window patio inside
+outside birthday anniversary dinner lunch breakfast brunch price cost deposit
+doctor dentist cleaning checkup haircut color trim massage room suite night
+late early around just only also maybe actually really still again already
+what when where who how long much many which time day date order pickup delivery
+""".split()
+
+_STOCK = [
+    "Is there anything else I can help you with today?",
+    "Let me check that for you.",
+    "Could you please spell your last name for me?",
+    "Perfect, I have that booked for you.",
+    "Sorry, I didn't catch that. Could you say it again?",
+]
+
+
+def _sentence(rnd: random.Random) -> str:
+    words = [rnd.choice(_WORDS) for _ in range(rnd.randint(4, 18))]
+    return words[0].capitalize() + " " + " ".join(words[1:]) + rnd.choice(".?!")
+
+
+def _heard_twice(rnd: random.Random, text: str) -> str:
+    """The final transcript vs the deltas: a dropped word, a comma, different case."""
+    words = text.split()
+    op = rnd.random()
+    if op < 0.3 and len(words) > 6:
+        words.pop(rnd.randrange(1, len(words) - 1))
+    elif op < 0.5:
+        i = rnd.randrange(len(words) - 1)
+        words[i] += ","
+    elif op < 0.6:
+        words = [w.lower() for w in words]
+    return " ".join(words)
+
+
+def synthetic_call(minutes: int, seed: int) -> list[dict]:
+    """Raw legacy transcript: deltas then final, one exchange every ~10 s."""
+    rnd, raw = random.Random(seed), []
+    for _ in range(minutes * 6):
+        for speaker in ("user", "ai"):
+            text = rnd.choice(_STOCK) if speaker == "ai" and rnd.random() < 0.15 else _sentence(rnd)
+            words = text.split()
+            raw.extend({"speaker": speaker, "text": w} for w in words)
+            raw.append({"speaker": speaker, "text": _heard_twice(rnd, text)})
+    return raw
+
+
+# ── before ──────────────────────────────────────────────────────────────
+def dedupe_before(lines, thresh=0.90):
+    buckets, cleaned = {"user": [], "ai": []}, []
+    for seg in lines:
+        cand  = seg["text"]
+        canon = _norm(cand)
+        bucket = buckets[seg["speaker"]]
+        dupe = next((old for old in bucket
+                     if difflib.SequenceMatcher(None, canon, _norm(old["text"])).ratio() >= thresh),
+                    None)
+        if dupe:
+            if len(cand) > len(dupe["text"]):
+                dupe["text"] = cand
+        else:
+            bucket.append(seg)
+            cleaned.append(seg)
+    return cleaned
+
+
+# ── after ───────────────────────────────────────────────────────────────
+def dedupe_after(lines, thresh=0.90):
+    return dedupe.dedupe(lines, thresh, norm=textnorm.norm_transcript)
+
+
+def _timed(fn, lines):
+    lines = copy.deepcopy(lines)                 # both versions mutate the kept segments
+    t0 = time.perf_counter()
+    out = fn(lines)
+    return out, time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--minutes", type=int, default=60)
+    ap.add_argument("--calls", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    print(f"{'call':<6}{'deltas':>8}{'merged':>8}{'kept':>7}{'before s':>11}{'after s':>10}"
+          f"{'speed-up':>10}{'differs':>9}")
+    for n in range(args.calls):
+        raw = synthetic_call(args.minutes, args.seed + n)
+        merged = _merge(raw)
+        before, tb = _timed(dedupe_before, merged)
+        after,  ta = _timed(dedupe_after, merged)
+        differs = sum(a != b for a, b in zip(before, after)) + abs(len(before) - len(after))
+        print(f"{n:<6}{len(raw):>8}{len(merged):>8}{len(after):>7}{tb:>11.2f}{ta:>10.3f}"
+              f"{tb / ta:>9.0f}×{differs:>9}")
+
+
+if __name__ == "__main__":
+    main()
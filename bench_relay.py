@@ -0,0 +1,126 @@
+"""
+Microbenchmark: frames per second per core through the media relay.
+
+    python bench_relay.py [--frames 200000]
+
+"before" is the old per-frame path (json.loads → new dict → json.dumps),
+"after" is media_relay's prefix check + payload splice.  Both directions
+use realistic 20 ms frames (160 bytes µ-law → 216 chars of base64).
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+
+import media_relay
+
+STREAM_SID = "MZ18ad3ab5a668481ce02b83e7395059f0"
+
+
+def _twilio_frame(seq: int) -> str:
+    payload = base64.b64encode(os.urandom(160)).decode()
+    return json.dumps({
+        "event": "media",
+        "sequenceNumber": str(seq),
+        "media": {"track": "inbound", "chunk": str(seq), "timestamp": str(seq * 20), "payload": payload},
+        "streamSid": STREAM_SID,
+    }, separators=(",", ":"))
+
+
+def _openai_frame(seq: int) -> str:
+    payload = base64.b64encode(os.urandom(160)).decode()
+    return json.dumps({
+        "type": "response.audio.delta",
+        "event_id": f"event_{seq:012d}",
+        "response_id": "resp_AbCdEf123456",
+        "item_id": "item_AbCdEf123456",
+        "output_index": 0,
+        "content_index": 0,
+        "delta": payload,
+    }, separators=(",", ":"))
+
+
+# ── before ──────────────────────────────────────────────────────────────
+def uplink_before(raw: str) -> str:
+    pkt = json.loads(raw)
+    if pkt.get("event") == "media":
+        return json.dumps({"type": "input_audio_buffer.append", "audio": pkt["media"]["payload"]})
+
+
+def downlink_before(raw: str) -> str:
+    msg = json.loads(raw)
+    if msg.get("type", "").startswith("response.audio"):
+        # starlette's send_json() == json.dumps(..., separators=(",", ":"))
+        return json.dumps({"event": "media", "streamSid": STREAM_SID,
+                           "media": {"payload": msg.get("delta")}}, separators=(",", ":"))
+
+
+# ── after ───────────────────────────────────────────────────────────────
+def uplink_after(raw: str) -> str:
+    payload = media_relay.twilio_media_payload(raw)
+    return media_relay.append_frame(payload)
+
+
+_PREFIX = media_relay.media_frame_prefix(STREAM_SID)
+
+
+def downlink_after(raw: str) -> str:
+    delta = media_relay.openai_audio_delta(raw)
+    return media_relay.media_frame(_PREFIX, delta)
+
+
+async def _check_barge_in() -> None:
+    """after a barge-in the cut item stays muted, later audio – id or not – plays"""
+    sent = []
+
+    async def send(text):
+        sent.append(text)
+
+    playout = media_relay.Playout(send)
+    playout.bind(STREAM_SID)
+    payload = base64.b64encode(os.urandom(160)).decode()
+    for item_id in ("item_A", None):
+        assert playout.enqueue(item_id, payload)
+        assert await playout.interrupt() == (item_id, 0)
+    assert not playout.enqueue("item_A", payload)
+    assert playout.enqueue(None, payload)
+    assert playout.enqueue("item_B", payload)
+
+
+def _rate(fn, frames) -> float:
+    t0 = time.perf_counter()
+    for raw in frames:
+        fn(raw)
+    return len(frames) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--frames", type=int, default=200_000)
+    args = ap.parse_args()
+
+    up   = [_twilio_frame(i) for i in range(args.frames)]
+    down = [_openai_frame(i) for i in range(args.frames)]
+
+    # sanity: both paths must emit equivalent JSON
+    assert json.loads(uplink_before(up[0])) == json.loads(uplink_after(up[0]))
+    assert json.loads(downlink_before(down[0])) == json.loads(downlink_after(down[0]))
+    asyncio.run(_check_barge_in())
+
+    print(f"orjson available: {media_relay._orjson is not None}")
+    print(f"{'direction':<22}{'before f/s':>14}{'after f/s':>14}{'speed-up':>10}")
+    for name, before, after, frames in (
+        ("Twilio → OpenAI", uplink_before, uplink_after, up),
+        ("OpenAI → Twilio", downlink_before, downlink_after, down),
+    ):
+        b = _rate(before, frames)
+        a = _rate(after, frames)
+        print(f"{name:<22}{b:>14,.0f}{a:>14,.0f}{a / b:>9.1f}×")
+    print("(one call ≈ 50 frames/s each way)")
+
+
+if __name__ == "__main__":
+    main()
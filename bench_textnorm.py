@@ -0,0 +1,160 @@
+"""
+Benchmark: transcript / label normalisation, old helpers vs textnorm.
+
+    python bench_textnorm.py --corpus calls.json [more.json …]
+    python bench_textnorm.py --wp 200              # latest call_log posts (WP_API_USER / WP_API_APP_PW)
+    python bench_textnorm.py                       # synthetic calls when no corpus is given
+
+A corpus file is a call_log export: a JSON list of posts (their
+`content` is the saved [{speaker, text}, …] list), a list of such lists,
+or one transcript per line (JSONL).  Each workload replays what the
+polishing pipeline does with the lines:
+
+  • norm       every line normalised `--repeat` times (dedupe candidates)
+  • stutter    collapse_stutter over every line (_enforce_turns)
+  • labels     the account's labels normalised on every redirect
+
+"before" are the app.py helpers as they were (NFKD + encode per call,
+stutter regex compiled per call); "after" are the cached textnorm ones,
+timed cold (empty cache) and warm.
+"""
+
+import argparse
+import base64
+import json
+import os
+import re
+import string
+import time
+import unicodedata
+
+import httpx
+
+import textnorm
+
+# ── before ──────────────────────────────────────────────────────────────
+_PUNCT   = str.maketrans("", "", string.punctuation + "。、「」、．，！？」’“”’")
+_RE_SPC  = re.compile(r"\s+")
+_STUTTER = re.compile(r'\b(\w{1,4})( \1\b)+', flags=re.I)
+
+
+def norm_before(txt: str) -> str:
+    folded = unicodedata.normalize("NFKD", txt).encode("ascii", "ignore").decode()
+    folded = folded.translate(_PUNCT).lower()
+    return _RE_SPC.sub(" ", folded).strip()
+
+
+def stutter_before(txt: str) -> str:
+    txt = _STUTTER.sub(r'\1', txt)
+    seq_pat = re.compile(r'\b((?:\w+\s+){1,3}\w+)(?:\s+\1\b)+', flags=re.I)
+    return seq_pat.sub(r'\1', txt)
+
+
+def label_before(text: str) -> str:
+    return re.sub(r"[^\w]", "", text or "").lower()
+
+
+# ── corpus ──────────────────────────────────────────────────────────────
+def _transcripts(obj) -> list[list[dict]]:
+    if isinstance(obj, dict):                                # one WP post
+        content = obj.get("content")
+        if isinstance(content, dict):
+            content = content.get("raw") or content.get("rendered") or ""
+        try:
+            return _transcripts(json.loads(content))
+        except (TypeError, ValueError):
+            return []
+    if isinstance(obj, list) and obj and isinstance(obj[0], dict) and "text" in obj[0]:
+        return [obj]
+    if isinstance(obj, list):
+        return [t for item in obj for t in _transcripts(item)]
+    return []
+
+
+def load_corpus(paths: list[str]) -> list[list[dict]]:
+    calls = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            raw = f.read()
+        try:
+            calls.extend(_transcripts(json.loads(raw)))
+        except ValueError:                                   # JSONL
+            for line in filter(None, map(str.strip, raw.splitlines())):
+                calls.extend(_transcripts(json.loads(line)))
+    return calls
+
+
+def fetch_wp(n: int) -> list[list[dict]]:
+    from app import WORDPRESS_SITE_URL
+    auth = base64.b64encode(f"{os.environ['WP_API_USER']}:{os.environ['WP_API_APP_PW']}".encode()).decode()
+    posts, page = [], 1
+    while len(posts) < n:
+        resp = httpx.get(f"{WORDPRESS_SITE_URL}/wp-json/wp/v2/call_log",
+                         params={"per_page": min(100, n - len(posts)), "page": page, "context": "edit"},
+                         headers={"Authorization": f"Basic {auth}"}, timeout=30)
+        if resp.status_code != 200 or not resp.json():
+            break
+        posts.extend(resp.json())
+        page += 1
+    return _transcripts(posts)
+
+
+def synthetic(calls: int) -> list[list[dict]]:
+    from polish import _merge
+    from bench_dedupe import synthetic_call
+    return [_merge(synthetic_call(20, seed)) for seed in range(calls)]
+
+
+# ── workloads ───────────────────────────────────────────────────────────
+def _clear() -> None:
+    for fn in (textnorm.norm_transcript, textnorm.norm_label, textnorm.collapse_stutter):
+        fn.cache_clear()
+
+
+def _time(fn, items, repeat: int = 1) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for x in items:
+            fn(x)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--corpus", nargs="*", default=[])
+    ap.add_argument("--wp", type=int, default=0, help="fetch this many call_log posts")
+    ap.add_argument("--repeat", type=int, default=20, help="normalisations per line (dedupe re-reads)")
+    ap.add_argument("--redirects", type=int, default=2000)
+    args = ap.parse_args()
+
+    calls = load_corpus(args.corpus) if args.corpus else []
+    if args.wp:
+        calls += fetch_wp(args.wp)
+    source = "corpus"
+    if not calls:
+        calls, source = synthetic(5), "synthetic"
+    lines  = [seg["text"] for call in calls for seg in call if seg.get("text")]
+    labels = ["Front Desk", "front-desk", "Billing", "HR", "Sales & Support", "After Hours", "Dr. Müller",
+              "Reservations", "Kitchen", "Manager"]
+
+    # sanity: same results
+    assert all(norm_before(t) == textnorm.norm_transcript(t) for t in lines)
+    assert all(stutter_before(t) == textnorm.collapse_stutter(t) for t in lines)
+    assert all(label_before(t) == textnorm.norm_label(t) for t in labels)
+
+    print(f"{source}: {len(calls)} calls, {len(lines)} lines, {len(set(lines))} distinct")
+    print(f"{'workload':<12}{'before s':>10}{'cold s':>10}{'warm s':>10}{'speed-up':>10}")
+    for name, before, after, items, repeat in (
+        ("norm",    norm_before,    textnorm.norm_transcript,  lines,  args.repeat),
+        ("stutter", stutter_before, textnorm.collapse_stutter, lines,  1),
+        ("labels",  label_before,   textnorm.norm_label,       labels, args.redirects),
+    ):
+        b = _time(before, items, repeat)
+        _clear()
+        cold = _time(after, items, repeat)
+        warm = _time(after, items, repeat)
+        print(f"{name:<12}{b:>10.3f}{cold:>10.3f}{warm:>10.3f}{b / cold:>9.1f}×")
+
+
+if __name__ == "__main__":
+    main()
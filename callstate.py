@@ -0,0 +1,278 @@
+"""
+Shared call state for running app.py on N workers / N dynos.
+
+Everything that must survive the hop from the worker that answered
+/incoming-call to the one that gets /media-stream (call contexts,
+account profiles, "this call was already redirected") goes through a
+small key → JSON-dict interface:
+
+    state = backend_from_url(os.getenv("CALL_STATE_URL", ""))
+    await state.set("call:CA123", {...}, ttl=120)
+    await state.get("call:CA123")
+    await state.set_if_absent("redirect:CA123", {...}, ttl=3600)
+    await state.delete("call:CA123")
+
+Backends
+  • ""  / memory://           InMemoryBackend – single process, the default
+  • redis://[:pw@]host:port/db RespBackend over TCP  (Redis, KeyDB, Valkey …)
+  • unix:///path/to.sock       RespBackend over a local socket
+
+For local multi-worker runs and tests without a Redis install, this
+module also ships a tiny RESP stand-in server:
+
+    python callstate.py serve --port 6390        # or --unix /tmp/kal.sock
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from urllib.parse import unquote, urlparse
+
+
+class CallStateBackend:
+    """Interface; values are JSON-able dicts, ttl is in seconds (None = forever)."""
+
+    shared = False          # True when other processes see the same data
+
+    async def get(self, key: str) -> dict | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: dict, ttl: float | None = None) -> None:
+        raise NotImplementedError
+
+    async def set_if_absent(self, key: str, value: dict, ttl: float | None = None) -> bool:
+        """Atomic create; False when `key` already exists."""
+        raise NotImplementedError
+
+    async def delete(self, *keys: str) -> None:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+# ======================================================================
+#  In-memory
+# ======================================================================
+class InMemoryBackend(CallStateBackend):
+    """Process-local dict with lazy expiry; what a single worker uses."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float | None, str]] = {}    # key → (expires_at, raw)
+
+    def _live(self, key: str) -> str | None:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, raw = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return raw
+
+    def _store(self, key: str, raw: str, ttl: float | None) -> None:
+        self._data[key] = (time.monotonic() + ttl if ttl else None, raw)
+
+    async def get(self, key):
+        raw = self._live(key)
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key, value, ttl=None):
+        self._store(key, json.dumps(value), ttl)
+
+    async def set_if_absent(self, key, value, ttl=None):
+        if self._live(key) is not None:
+            return False
+        self._store(key, json.dumps(value), ttl)
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._data.pop(key, None)
+
+
+# ======================================================================
+#  RESP (Redis protocol) over TCP or a unix socket
+# ======================================================================
+class RespError(Exception):
+    pass
+
+
+def _encode(*args) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for a in args:
+        b = a if isinstance(a, bytes) else str(a).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(b), b))
+    return b"".join(out)
+
+
+async def _read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("call-state server closed the connection")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        raise RespError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        n = int(body)
+        return None if n < 0 else (await reader.readexactly(n + 2))[:-2]
+    if kind == b"*":
+        n = int(body)
+        return None if n < 0 else [await _read_reply(reader) for _ in range(n)]
+    raise RespError(f"bad reply {line!r}")
+
+
+class RespBackend(CallStateBackend):
+    """
+    Minimal Redis-protocol client: GET / SET [EX] [NX] / DEL on one
+    connection, commands serialised by a lock (a handful per call, so a
+    pool isn't worth it).  Reconnects on the next command after a drop.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, *, prefix: str = "kal:", timeout: float = 2.0):
+        u = urlparse(url)
+        self._unix     = u.path if u.scheme == "unix" else None
+        self._host     = u.hostname or "127.0.0.1"
+        self._port     = u.port or 6379
+        self._password = unquote(u.password) if u.password else None
+        self._db       = int(u.path.lstrip("/") or 0) if u.scheme != "unix" else 0
+        self.prefix    = prefix
+        self.timeout   = timeout
+        self._lock     = asyncio.Lock()
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    async def _connect(self) -> None:
+        if self._unix:
+            self._reader, self._writer = await asyncio.open_unix_connection(self._unix)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(self._host, self._port)
+        if self._password:
+            await self._roundtrip("AUTH", self._password)
+        if self._db:
+            await self._roundtrip("SELECT", self._db)
+
+    async def _roundtrip(self, *args):
+        self._writer.write(_encode(*args))
+        await self._writer.drain()
+        return await _read_reply(self._reader)
+
+    async def _cmd(self, *args):
+        async with self._lock:
+            try:
+                if self._writer is None or self._writer.is_closing():
+                    await asyncio.wait_for(self._connect(), self.timeout)
+                return await asyncio.wait_for(self._roundtrip(*args), self.timeout)
+            except BaseException:
+                # any interrupted roundtrip – cancellation included – may leave a
+                # reply unread; the next caller would get it, so drop the stream
+                self._drop()
+                raise
+
+    def _drop(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def get(self, key):
+        raw = await self._cmd("GET", self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key, value, ttl=None):
+        args = ["SET", self.prefix + key, json.dumps(value)]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        await self._cmd(*args)
+
+    async def set_if_absent(self, key, value, ttl=None):
+        args = ["SET", self.prefix + key, json.dumps(value), "NX"]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        return await self._cmd(*args) == "OK"
+
+    async def delete(self, *keys):
+        if keys:
+            await self._cmd("DEL", *(self.prefix + k for k in keys))
+
+    async def close(self):
+        async with self._lock:
+            self._drop()
+
+
+def backend_from_url(url: str) -> CallStateBackend:
+    if not url or url.startswith("memory:"):
+        return InMemoryBackend()
+    if url.startswith(("redis:", "unix:")):
+        return RespBackend(url)
+    raise ValueError(f"unsupported CALL_STATE_URL {url!r}")
+
+
+# ======================================================================
+#  Local stand-in server (GET / SET EX|PX|NX / DEL / PING)
+# ======================================================================
+async def _serve_client(store: InMemoryBackend, reader, writer) -> None:
+    try:
+        while True:
+            req = await _read_reply(reader)
+            cmd, args = req[0].upper(), req[1:]
+            if cmd == b"PING":
+                writer.write(b"+PONG\r\n")
+            elif cmd in (b"AUTH", b"SELECT"):
+                writer.write(b"+OK\r\n")
+            elif cmd == b"GET":
+                raw = store._live(args[0].decode())
+                writer.write(b"$-1\r\n" if raw is None else _encode(raw)[4:])
+            elif cmd == b"SET":
+                key, raw, opts = args[0].decode(), args[1].decode(), [a.upper() for a in args[2:]]
+                ttl = None
+                if b"EX" in opts:
+                    ttl = float(args[2 + opts.index(b"EX") + 1])
+                if b"PX" in opts:
+                    ttl = float(args[2 + opts.index(b"PX") + 1]) / 1000
+                if b"NX" in opts and store._live(key) is not None:
+                    writer.write(b"$-1\r\n")
+                else:
+                    store._store(key, raw, ttl)
+                    writer.write(b"+OK\r\n")
+            elif cmd == b"DEL":
+                n = sum(store._data.pop(k.decode(), None) is not None for k in args)
+                writer.write(b":%d\r\n" % n)
+            else:
+                writer.write(b"-ERR unknown command\r\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError, IndexError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(*, host: str = "127.0.0.1", port: int = 6390, unix: str | None = None):
+    store = InMemoryBackend()
+
+    def handler(r, w):
+        return _serve_client(store, r, w)
+
+    server = (await asyncio.start_unix_server(handler, unix) if unix
+              else await asyncio.start_server(handler, host, port))
+    logging.info("[CALLSTATE] stand-in listening on %s", unix or f'{host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="RESP stand-in for CALL_STATE_URL")
+    ap.add_argument("command", choices=["serve"])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6390)
+    ap.add_argument("--unix")
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(host=args.host, port=args.port, unix=args.unix))
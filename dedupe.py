@@ -0,0 +1,151 @@
+"""
+Near-duplicate lookup for transcript segments, without the all-pairs scan.
+
+`_dedupe` used to compare every segment with every earlier one of the
+same speaker through difflib.SequenceMatcher – O(n²) ratio() calls over
+a long call.  Here each kept segment is indexed by a MinHash signature of
+its character 4-shingles, cut into LSH bands; a new segment is only
+compared with the entries it shares a band with, and those candidates
+are verified with the same ratio() threshold as before:
+
+    idx  = NearDupIndex(threshold=0.90)
+    hit  = idx.find(canon)             # id of the first entry with ratio ≥ 0.90, or None
+    i    = idx.add(canon)
+    idx.update(i, longer_canon)        # entry now stands for the longer copy
+
+    dedupe(lines, 0.90, norm=textnorm.norm_transcript)    # drop-in for the old loop
+
+Signatures use one-permutation hashing (each shingle hashed once, binned
+by hash, min per bin) with rotation densification for empty bins, so a
+signature costs O(len(text)) rather than O(len(text) × hashes).  With
+32 bands × 2 rows, pairs that pass ratio ≥ 0.90 (shingle Jaccard ≳ 0.45
+in practice) become candidates with > 99.9 % probability, unrelated
+utterances rarely do.  Still probabilistic: bench_dedupe.py reports how
+often the result differs from the exhaustive scan.
+"""
+
+from collections import Counter
+from difflib import SequenceMatcher
+
+_MASK  = (1 << 61) - 1
+_ROTATE = 0x9E3779B97F4A7C15 & _MASK                   # offset per densification hop
+
+
+class NearDupIndex:
+    def __init__(self, threshold: float = 0.90, *, shingle: int = 4, bands: int = 32, rows: int = 2):
+        self.threshold = threshold
+        self.shingle   = shingle
+        self.bands     = bands
+        self.rows      = rows
+        self.bins      = bands * rows
+        self.compared  = 0                               # ratio() calls, for the benchmark
+        self._texts: list[str] = []
+        self._chars: list[Counter] = []                  # per entry, for the quick_ratio() bound
+        self._buckets: list[dict[tuple, list[int]]] = [{} for _ in range(bands)]
+
+    # ── signatures ───────────────────────────────────────────────────
+    def signature(self, text: str) -> list[int]:
+        k, bins = self.shingle, self.bins
+        mins: list[int | None] = [None] * bins
+        for i in range(max(1, len(text) - k + 1)):
+            h = hash(text[i:i + k]) & _MASK
+            b, v = h % bins, h // bins
+            if mins[b] is None or v < mins[b]:
+                mins[b] = v
+        if None in mins:
+            filled = [i for i, v in enumerate(mins) if v is not None]
+            if not filled:                               # empty text
+                return [0] * bins
+            # rotation densification: an empty bin takes the next filled one to its right
+            nxt = filled[0] + bins
+            for i in range(bins - 1, -1, -1):
+                if mins[i] is not None:
+                    nxt = i
+                else:
+                    src = nxt % bins
+                    mins[i] = (mins[src] + _ROTATE * (nxt - i)) & _MASK
+        return mins
+
+    def _bands(self, sig: list[int]):
+        r = self.rows
+        for j in range(self.bands):
+            yield j, tuple(sig[j * r:(j + 1) * r])
+
+    # ── index ────────────────────────────────────────────────────────
+    def add(self, text: str) -> int:
+        i = len(self._texts)
+        self._texts.append(text)
+        self._chars.append(Counter(text))
+        self._index(i, text)
+        return i
+
+    def update(self, i: int, text: str) -> None:
+        """Entry i now holds `text`; its old bands stay (candidates are verified anyway)."""
+        if text != self._texts[i]:
+            self._texts[i] = text
+            self._chars[i] = Counter(text)
+            self._index(i, text)
+
+    def _index(self, i: int, text: str) -> None:
+        for j, band in self._bands(self.signature(text)):
+            ids = self._buckets[j].setdefault(band, [])
+            if not ids or ids[-1] != i:
+                ids.append(i)
+
+    def text(self, i: int) -> str:
+        return self._texts[i]
+
+    def find(self, text: str) -> int | None:
+        """Lowest id whose text matches `text` with ratio ≥ threshold (the old scan's pick)."""
+        candidates: set[int] = set()
+        for j, band in self._bands(self.signature(text)):
+            ids = self._buckets[j].get(band)
+            if ids:
+                candidates.update(ids)
+        # ratio() = 2·matches / total; cheap upper bounds on `matches` first, like
+        # real_quick_ratio() (lengths) and quick_ratio() (shared characters)
+        need, chars = self.threshold * len(text), None
+        for i in sorted(candidates):
+            other = self._texts[i]
+            total = need + self.threshold * len(other)
+            if 2 * min(len(text), len(other)) < total:
+                continue
+            chars = chars or Counter(text)
+            if 2 * sum((chars & self._chars[i]).values()) < total:
+                continue
+            self.compared += 1
+            if SequenceMatcher(None, text, other).ratio() >= self.threshold:
+                return i
+        return None
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+
+def dedupe(lines: list[dict], threshold: float = 0.90, *, norm) -> list[dict]:
+    """
+    Drop near-duplicate segments per speaker, keep the first occurrence in
+    place and upgrade it to the longer copy – the semantics of the old
+    pairwise loop.  Segments are mutated in place, like before.
+    """
+    indexes: dict[str, NearDupIndex] = {}
+    owners:  dict[str, list[dict]]   = {}
+    cleaned = []
+    for seg in lines:
+        cand  = seg["text"]
+        canon = norm(cand)
+        idx   = indexes.get(seg["speaker"])
+        if idx is None:
+            idx = indexes[seg["speaker"]] = NearDupIndex(threshold)
+            owners[seg["speaker"]] = []
+        hit = idx.find(canon)
+        if hit is None:
+            idx.add(canon)
+            owners[seg["speaker"]].append(seg)
+            cleaned.append(seg)
+        else:
+            dupe = owners[seg["speaker"]][hit]
+            if len(cand) > len(dupe["text"]):
+                dupe["text"] = cand
+                idx.update(hit, canon)
+    return cleaned
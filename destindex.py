@@ -0,0 +1,88 @@
+"""
+Destination lookup by label for one account, built once per destination
+list instead of per redirect.
+
+    idx = DestIndex(profile["destinations"])    # when the list is (re)loaded
+    idx.resolve(" front-desk ")                  # exact, after norm_label
+    idx.resolve("frnt desk")                     # typo → closest label, ratio ≥ 0.7
+    idx.resolve("parking")                       # None
+
+Labels are normalised once (textnorm.norm_label) into an exact-match
+dict.  For typos the labels are also indexed by length, each with its
+character counts.  A miss bounds every label's ratio() from above – by
+length, then by shared characters, the bounds behind real_quick_ratio()
+and quick_ratio() – and computes real ratios best-bound first, stopping
+once no bound left can beat the best so far.  The pick is the one
+difflib.get_close_matches(n=1, cutoff=0.7) made over the whole list
+(highest ratio, ties to the larger label), and it is remembered: the
+tool call and the /redirecting-call it triggers ask for the same typo.
+Two labels that normalise alike keep the first row, as the old exact
+scan did.
+"""
+
+from collections import Counter
+from difflib import SequenceMatcher
+
+from textnorm import norm_label
+
+
+class DestIndex:
+    def __init__(self, dests: list[dict], *, cutoff: float = 0.7, memo: int = 256):
+        self.dests  = dests                             # the list this index was built from
+        self.cutoff = cutoff
+        self.memo   = memo
+        self._exact:  dict[str, dict] = {}              # norm_label → destination row
+        self._by_len: dict[int, list[tuple[str, Counter]]] = {}
+        self._fuzzy:  dict[str, str | None] = {}        # query → matched label, for repeats
+        for d in dests:
+            key = norm_label(d.get("label"))
+            if key and key not in self._exact:
+                self._exact[key] = d
+                self._by_len.setdefault(len(key), []).append((key, Counter(key)))
+
+    def find(self, label: str | None) -> dict | None:
+        """case- / space- / punctuation-insensitive exact match"""
+        return self._exact.get(norm_label(label))
+
+    def resolve(self, label: str | None) -> dict | None:
+        """exact match, else the closest label (handles small typos), else None"""
+        key = norm_label(label)
+        if not key:
+            return None
+        hit = self._exact.get(key)
+        if hit is not None:
+            return hit
+        if key not in self._fuzzy:
+            if len(self._fuzzy) >= self.memo:
+                self._fuzzy.clear()
+            self._fuzzy[key] = self._closest(key)
+        match = self._fuzzy[key]
+        return None if match is None else self._exact[match]
+
+    def _closest(self, key: str) -> str | None:
+        # ratio() = 2·matches / (len(a) + len(b)) – bound `matches` before computing it
+        n, chars, bounded = len(key), None, []
+        for size, entries in self._by_len.items():
+            total = n + size
+            if 2.0 * min(n, size) / total < self.cutoff:
+                continue
+            chars = chars or Counter(key)
+            for k, kc in entries:
+                bound = 2.0 * sum((chars & kc).values()) / total
+                if bound >= self.cutoff:
+                    bounded.append((bound, k))
+        bounded.sort(reverse=True)
+
+        sm, best = SequenceMatcher(), (self.cutoff, None)
+        sm.set_seq2(key)
+        for bound, k in bounded:
+            if bound < best[0]:
+                break                                   # nobody left can beat (or tie) the best
+            sm.set_seq1(k)
+            score = sm.ratio()
+            if score >= best[0] and (best[1] is None or (score, k) > best):
+                best = (score, k)
+        return best[1]
+
+    def __len__(self) -> int:
+        return len(self._exact)
@@ -982,3 +982,40 @@ add_action('wp_ajax_kal_regen_key', function(){
 	update_user_meta(get_current_user_id(),'ai_receptionist_api_key',$key);
 	wp_send_json(['key'=>$key]);
 });
+
+/** ────────────────────────────────────────────────────────────────────
+ * 7) Tell app.py to drop its cached profile when an owner saves settings
+ *    define('KAL_FASTAPI_URL', 'https://…herokuapp.com');
+ *    define('KAL_FASTAPI_CACHE_TOKEN', '…');   // = CACHE_INVALIDATE_TOKEN
+ * ─────────────────────────────────────────────────────────────────── */
+// the phone number itself changed: the old number's cached profile must go too,
+// and updated_user_meta only runs after the new value is written
+function kal_remember_old_phone($meta_id, $uid, $meta_key){
+	global $kal_old_phones;
+	if ( $meta_key !== 'ai_receptionist_phone' ) return;
+	$old = get_user_meta($uid, 'ai_receptionist_phone', true);
+	if ( $old ) $kal_old_phones[$uid] = $old;
+}
+function kal_notify_profile_cache($meta_id, $uid, $meta_key){
+	global $kal_old_phones;
+	if ( ! defined('KAL_FASTAPI_URL') || ! defined('KAL_FASTAPI_CACHE_TOKEN') ) return;
+	if ( strpos($meta_key, 'ai_receptionist_') !== 0 || $meta_key === 'ai_receptionist_api_key' ) return;
+	$phones = [];
+	if ( $meta_key === 'ai_receptionist_phone' && ! empty($kal_old_phones[$uid]) ) {
+		$phones[] = $kal_old_phones[$uid];
+		unset($kal_old_phones[$uid]);
+	}
+	$phone = get_user_meta($uid, 'ai_receptionist_phone', true);
+	if ( $phone ) $phones[] = $phone;
+	$phones = array_values(array_unique(array_map('strval', $phones)));
+	if ( ! $phones ) return;
+	wp_remote_post(rtrim(KAL_FASTAPI_URL, '/').'/cache/invalidate', [
+		'blocking' => false,
+		'timeout'  => 2,
+		'headers'  => ['Content-Type'=>'application/json','X-Cache-Token'=>KAL_FASTAPI_CACHE_TOKEN],
+		'body'     => wp_json_encode(['phones'=>$phones]),
+	]);
+}
+add_action('update_user_meta',  'kal_remember_old_phone',   10, 3);
+add_action('added_user_meta',   'kal_notify_profile_cache', 10, 3);
+add_action('updated_user_meta', 'kal_notify_profile_cache', 10, 3);
@@ -0,0 +1,466 @@
+"""
+Owner greetings as ready-to-send Twilio media payloads.
+
+With GREETING_MODE=stream the call no longer starts with <Play>: each
+greeting is transcoded once to 8 kHz mono µ-law, cut into base64 frames
+and kept here (memory LRU + optional directory), keyed by the content
+hash of the source audio.  handle_media_stream queues those frames into
+the Playout on Twilio `start` while the Realtime session is still
+connecting.
+
+    store = UlawStore(max_bytes=32 << 20, directory="/tmp/greetings")
+    frames = store.get(key)                       # list[str] | None, memory only – never blocks
+    frames = await store.load(key)                # memory, else <dir>/<key>.ulaw off the loop
+    frames = await store.prepare(key, data, "audio/mpeg")
+
+Transcoding: raw µ-law passes through, anything ffmpeg can read goes
+through ffmpeg when it is on PATH, PCM WAV falls back to the stdlib
+(wave + audioop).  Otherwise prepare() answers None and the caller keeps
+using <Play>.
+
+Precompute pipeline (GreetingJobs): when an owner saves, the greeting
+is fetched once, loudness-normalised and written as MP3 + µ-law blobs
+into a ContentStore (<dir>/<sha256>.<ext>, plus a per-phone manifest),
+so the call path only reads finished bytes.  Backfill every Twilio
+number with:
+
+    python greetings.py backfill [--phone +1…] [--concurrency 4] [--prune]
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import wave
+from collections import OrderedDict
+
+try:                                    # stdlib until 3.13; only needed without ffmpeg
+    import audioop as _audioop
+except ImportError:                     # pragma: no cover - depends on the runtime
+    _audioop = None
+
+FFMPEG = shutil.which(os.getenv("FFMPEG_BIN", "ffmpeg"))
+ULAW_RATE = 8000                        # bytes per second of 8 kHz µ-law
+LOUDNESS_LUFS = float(os.getenv("GREETING_LUFS", -16))     # ffmpeg loudnorm target
+RMS_DBFS      = float(os.getenv("GREETING_RMS_DBFS", -20)) # stdlib fallback target
+
+
+class TranscodeError(Exception):
+    pass
+
+
+# ======================================================================
+#  Transcoding
+# ======================================================================
+_ULAW_ARGS = ("-f", "mulaw", "-ar", str(ULAW_RATE), "-ac", "1")
+_MP3_ARGS  = ("-f", "mp3", "-codec:a", "libmp3lame", "-b:a", "64k", "-ac", "1")
+
+
+async def _ffmpeg(data: bytes, *out_args: str, loudnorm: bool = False, timeout: float = 30) -> bytes:
+    filters = ("-af", f"loudnorm=I={LOUDNESS_LUFS}:TP=-1.5:LRA=11") if loudnorm else ()
+    proc = await asyncio.create_subprocess_exec(
+        FFMPEG, "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0", *filters, *out_args, "pipe:1",
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(data), timeout)
+    except asyncio.TimeoutError:
+        raise TranscodeError("ffmpeg timed out")
+    finally:
+        if proc.returncode is None:             # timed out or cancelled: reap it, no zombie
+            proc.kill()
+            await proc.wait()
+    if proc.returncode != 0:
+        raise TranscodeError(f"ffmpeg exited {proc.returncode}: {err.decode(errors='replace')[:200]}")
+    return out
+
+
+def _wav_ulaw(data: bytes) -> bytes:
+    with wave.open(io.BytesIO(data)) as w:
+        width, channels, rate = w.getsampwidth(), w.getnchannels(), w.getframerate()
+        pcm = w.readframes(w.getnframes())
+    if channels == 2:
+        pcm = _audioop.tomono(pcm, width, 0.5, 0.5)
+    if rate != ULAW_RATE:
+        pcm, _ = _audioop.ratecv(pcm, width, 1, rate, ULAW_RATE, None)
+    return _audioop.lin2ulaw(pcm, width)
+
+
+async def to_ulaw(data: bytes, media_type: str) -> bytes:
+    """8 kHz mono µ-law bytes for `data`; raises TranscodeError when no path fits."""
+    if media_type in ("audio/ulaw", "audio/basic", "audio/x-mulaw"):
+        return data
+    if FFMPEG:
+        return await _ffmpeg(data, *_ULAW_ARGS)
+    if data[:4] == b"RIFF" and _audioop is not None:
+        try:
+            return await asyncio.to_thread(_wav_ulaw, data)
+        except (wave.Error, EOFError, _audioop.error) as exc:
+            raise TranscodeError(f"bad WAV: {exc}") from exc
+    raise TranscodeError(f"no transcoder for {media_type} (install ffmpeg)")
+
+
+def normalise_ulaw(ulaw: bytes) -> bytes:
+    """Scale µ-law audio to RMS_DBFS without letting peaks pass 90 % of full scale."""
+    if _audioop is None or not ulaw:
+        return ulaw
+    lin = _audioop.ulaw2lin(ulaw, 2)
+    rms, peak = _audioop.rms(lin, 2), _audioop.max(lin, 2)
+    if not rms:
+        return ulaw
+    gain = min(32767 * 10 ** (RMS_DBFS / 20) / rms, 0.9 * 32767 / peak)
+    return _audioop.lin2ulaw(_audioop.mul(lin, 2, gain), 2)
+
+
+async def variants(data: bytes, media_type: str) -> dict[str, tuple[bytes, str] | None]:
+    """
+    Loudness-normalised renditions: {"mp3": (bytes, type), "ulaw": (bytes, type) | None}.
+    ffmpeg does both with loudnorm.  Without it the source is kept as the
+    <Play> rendition, and a µ-law one exists only when the stdlib can
+    decode the source (WAV) – RMS-normalised in Python; MP3 uploads get
+    None and calls keep using <Play>.
+    """
+    if FFMPEG:
+        mp3, ulaw = await asyncio.gather(
+            _ffmpeg(data, *_MP3_ARGS, loudnorm=True),
+            _ffmpeg(data, *_ULAW_ARGS, loudnorm=True),
+        )
+        return {"mp3": (mp3, "audio/mpeg"), "ulaw": (ulaw, "audio/ulaw")}
+    try:
+        ulaw = await asyncio.to_thread(normalise_ulaw, await to_ulaw(data, media_type))
+    except TranscodeError as exc:
+        logging.info("[GREETING] no µ-law rendition: %s", exc)
+        return {"mp3": (data, media_type), "ulaw": None}
+    return {"mp3": (data, media_type), "ulaw": (ulaw, "audio/ulaw")}
+
+
+def frames(ulaw: bytes, frame_ms: int) -> list[str]:
+    """base64 payloads of `frame_ms` each (the last one may be shorter)."""
+    step = ULAW_RATE * frame_ms // 1000
+    return [base64.b64encode(ulaw[i:i + step]).decode() for i in range(0, len(ulaw), step)]
+
+
+# ======================================================================
+#  Store
+# ======================================================================
+class UlawStore:
+    """
+    key (content hash of the source audio) → list of base64 µ-law frames.
+
+    Memory is an LRU bounded by `max_bytes` of µ-law audio; `directory`
+    (optional) keeps the raw µ-law as <key>.ulaw so restarts and other
+    workers on the same dyno skip the transcode.  prepare() is
+    single-flight per key.
+    """
+
+    def __init__(self, *, max_bytes: int, directory: str | None = None, frame_ms: int = 100):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.frame_ms  = frame_ms
+        self.bytes     = 0
+        self._mem: OrderedDict = OrderedDict()          # key → (frames, ulaw_len)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._failed: set[str] = set()                  # keys no transcoder could handle
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.ulaw")
+
+    def _remember(self, key: str, ulaw: bytes) -> list[str]:
+        out = frames(ulaw, self.frame_ms)
+        if len(ulaw) <= self.max_bytes:
+            self._mem[key] = (out, len(ulaw))
+            self.bytes += len(ulaw)
+            while self.bytes > self.max_bytes:
+                _, (_, n) = self._mem.popitem(last=False)
+                self.bytes -= n
+        return out
+
+    def get(self, key: str) -> list[str] | None:
+        hit = self._mem.get(key)
+        if hit is not None:
+            self._mem.move_to_end(key)
+            return hit[0]
+        return None
+
+    async def load(self, key: str) -> list[str] | None:
+        """get(), falling back to the directory (read in a thread)."""
+        hit = self.get(key)
+        if hit is not None or not self.directory:
+            return hit
+        ulaw = await asyncio.to_thread(self._read, key)
+        return None if ulaw is None else self._remember(key, ulaw)
+
+    def _read(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def prepare(self, key: str, data: bytes, media_type: str) -> list[str] | None:
+        hit = await self.load(key)
+        if hit is not None or key in self._failed:
+            return hit
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = self._inflight[key] = asyncio.ensure_future(self._transcode(key, data, media_type))
+            fut.add_done_callback(lambda _f: self._inflight.pop(key, None))
+        return await asyncio.shield(fut)
+
+    def _write(self, key: str, ulaw: bytes) -> None:
+        _atomic_write(self._path(key), ulaw)
+
+    async def _transcode(self, key: str, data: bytes, media_type: str) -> list[str] | None:
+        try:
+            ulaw = await to_ulaw(data, media_type)
+        except TranscodeError as exc:
+            logging.warning("[GREETING] %s: %s", key, exc)
+            self._failed.add(key)
+            return None
+        if self.directory:
+            await asyncio.to_thread(self._write, key, ulaw)
+        logging.info("[GREETING] transcoded %s: %d bytes → %.1f s µ-law",
+                     key, len(data), len(ulaw) / ULAW_RATE)
+        return self._remember(key, ulaw)
+
+
+# ======================================================================
+#  Content-addressed store + per-phone manifests
+# ======================================================================
+class ContentStore:
+    """
+    <dir>/<sha256>.<ext>           immutable blobs (UlawStore reads the .ulaw ones)
+    <dir>/phones/<phone>.json      {"source", "mp3", "mp3_type", "ulaw" | None, "at"}
+
+    The directory is shared with UlawStore, whose own files are keyed by
+    a 32-char etag; prune() only ever touches full sha256 blob names.
+    """
+
+    _BLOB = re.compile(r"[0-9a-f]{64}\.(?:mp3|ulaw)")
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "phones"), exist_ok=True)
+
+    def path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.directory, f"{digest}.{ext}")
+
+    def _manifest_path(self, phone: str) -> str:
+        return os.path.join(self.directory, "phones", phone.replace("/", "_") + ".json")
+
+    def put(self, data: bytes, ext: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest, ext)
+        if not os.path.exists(path):
+            _atomic_write(path, data)
+        return digest
+
+    def read(self, digest: str, ext: str) -> bytes | None:
+        try:
+            with open(self.path(digest, ext), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def manifest(self, phone: str) -> dict | None:
+        try:
+            with open(self._manifest_path(phone)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def set_manifest(self, phone: str, manifest: dict) -> None:
+        _atomic_write(self._manifest_path(phone), json.dumps(manifest).encode())
+
+    def drop_manifest(self, phone: str) -> None:
+        try:
+            os.remove(self._manifest_path(phone))
+        except FileNotFoundError:
+            pass
+
+    def prune(self) -> int:
+        """Delete blobs no manifest points at; returns how many."""
+        live = set()
+        phones = os.path.join(self.directory, "phones")
+        for name in os.listdir(phones):
+            m = self.manifest(name[:-5]) or {}
+            live.update(f"{m.get(k)}.{k}" for k in ("mp3", "ulaw"))
+        n = 0
+        for name in os.listdir(self.directory):
+            if self._BLOB.fullmatch(name) and name not in live:
+                os.remove(os.path.join(self.directory, name))
+                n += 1
+        return n
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+# ======================================================================
+#  Job queue
+# ======================================================================
+class GreetingJobs:
+    """
+    Background precompute:  enqueue(phone) after an owner saves; `workers`
+    tasks fetch the source via `fetch(phone)` (→ (bytes, media_type) | None),
+    render variants(), store them and write the manifest, then call
+    `on_done(phone, manifest | None)` so the app can drop / warm its caches.
+    Pending phones are de-duplicated.
+
+    Only a changed source is rendered: a manifest whose "source" hash
+    matches is kept (prompt / voice saves re-check, they don't re-render).
+    With `claim(phone, digest)` (→ bool) one worker sharing the store
+    renders a new source and the others wait for its manifest.  A source
+    that failed to render isn't queued again until it changes.
+    """
+
+    def __init__(self, store: ContentStore, fetch, *, on_done=None, claim=None,
+                 workers: int = 2, claim_wait: float = 120.0):
+        self.store   = store
+        self.fetch   = fetch
+        self.on_done = on_done
+        self.claim   = claim
+        self.workers = workers
+        self.claim_wait = claim_wait
+        self._queue: asyncio.Queue | None = None
+        self._pending: set[str] = set()
+        self._failed: dict[str, str] = {}               # phone → source digest that failed
+        self._tasks: list[asyncio.Task] = []
+        self.done = self.failed = self.unchanged = 0
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def enqueue(self, phone: str, digest: str | None = None) -> None:
+        """Queue `phone`; with the source's `digest`, skipped when that source already failed."""
+        if self._queue is None or phone in self._pending:
+            return
+        if digest is not None and self._failed.get(phone) == digest:
+            return
+        self._pending.add(phone)
+        self._queue.put_nowait(phone)
+
+    async def _worker(self) -> None:
+        while True:
+            phone = await self._queue.get()
+            self._pending.discard(phone)
+            try:
+                await self.run(phone)
+            except Exception as exc:
+                self.failed += 1
+                logging.error("[GREETING] precompute failed for %s: %r", phone, exc)
+
+    async def run(self, phone: str) -> dict | None:
+        """Precompute `phone` now (also what the backfill CLI calls)."""
+        source = await self.fetch(phone)
+        current = await asyncio.to_thread(self.store.manifest, phone)
+        if source is None:
+            if current is None:
+                return None
+            await asyncio.to_thread(self.store.drop_manifest, phone)
+            manifest = None
+        else:
+            data, media_type = source
+            digest = hashlib.sha256(data).hexdigest()
+            if current and current.get("source") == digest and (current.get("ulaw") or not FFMPEG):
+                self.unchanged += 1
+                return current
+            if self.claim is not None and not await self.claim(phone, digest):
+                manifest = await self._wait_for(phone, digest)
+            else:
+                try:
+                    manifest = await self._render(phone, digest, data, media_type)
+                except Exception:
+                    self._failed[phone] = digest
+                    raise
+            self._failed.pop(phone, None)
+        self.done += 1
+        if self.on_done is not None:
+            self.on_done(phone, manifest)
+        return manifest
+
+    async def _render(self, phone: str, digest: str, data: bytes, media_type: str) -> dict:
+        rendered = await variants(data, media_type)
+        mp3, mp3_type = rendered["mp3"]
+        ulaw = rendered["ulaw"][0] if rendered["ulaw"] else None
+        manifest = {
+            "source":   digest,
+            "mp3":      await asyncio.to_thread(self.store.put, mp3, "mp3"),
+            "mp3_type": mp3_type,
+            "ulaw":     await asyncio.to_thread(self.store.put, ulaw, "ulaw") if ulaw else None,
+            "at":       time.time(),
+        }
+        await asyncio.to_thread(self.store.set_manifest, phone, manifest)
+        logging.info("[GREETING] precomputed %s: %s", phone,
+                     f"{len(ulaw) / ULAW_RATE:.1f} s" if ulaw else "no µ-law rendition")
+        return manifest
+
+    async def _wait_for(self, phone: str, digest: str) -> dict | None:
+        """Another worker renders `digest`: poll the shared manifest until it shows up."""
+        deadline = time.monotonic() + self.claim_wait
+        while time.monotonic() < deadline:
+            m = await asyncio.to_thread(self.store.manifest, phone)
+            if m and m.get("source") == digest:
+                return m
+            await asyncio.sleep(1.0)
+        logging.warning("[GREETING] %s: no manifest for %s after %.0f s", phone, digest[:12], self.claim_wait)
+        return None
+
+    def stats(self) -> dict:
+        return {"queued": len(self._pending), "done": self.done, "failed": self.failed,
+                "unchanged": self.unchanged}
+
+
+# ======================================================================
+#  CLI:  python greetings.py backfill
+# ======================================================================
+async def _backfill(args) -> None:
+    import app                          # WordPress fetch, Twilio client and the configured store
+
+    phones = args.phone or await app.twilio_async.incoming_numbers()
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def one(phone):
+        async with sem:
+            try:
+                m = await app.GREETING_JOBS.run(phone)
+                print(f"{phone}: {'ok ' + m['mp3'][:12] if m else 'no greeting'}")
+            except Exception as exc:
+                print(f"{phone}: FAILED {exc!r}")
+
+    try:
+        await asyncio.gather(*(one(p) for p in phones))
+        if args.prune:
+            print(f"pruned {app.GREETING_STORE.prune()} unreferenced blobs")
+    finally:
+        await app.twilio_async.close()
+        await app.http_client().aclose()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Precompute greeting audio for provisioned numbers")
+    ap.add_argument("command", choices=["backfill"])
+    ap.add_argument("--phone", action="append", help="only these numbers (default: every Twilio number)")
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--prune", action="store_true", help="delete blobs no manifest references")
+    asyncio.run(_backfill(ap.parse_args()))
@@ -0,0 +1,191 @@
+"""
+Logging for the media relay: level-gated, off-thread, structured.
+
+    import logpipe
+    logpipe.setup()                                  # once, at import of app.py
+    logpipe.bind_call(call_sid, stream_sid)          # in the task handling a call
+    logging.info("[REDIRECT] updating %s → %s", call_sid, url)
+
+• Call sites use %-style args, so nothing is formatted unless the level
+  is enabled (LOG_LEVEL, default INFO).
+• The calling thread only enqueues the record; formatting and the write
+  to stdout happen on a QueueListener thread (records whose args are
+  mutable – dicts, lists, objects – are formatted before they're queued).
+• LOG_FORMAT=json (default) writes one JSON object per line with the
+  call_sid / stream_sid bound via contextvars; LOG_FORMAT=text keeps the
+  classic "time [LEVEL] name: message" lines.
+• LOG_SAMPLE="AI-TTS=0.1,websockets=0" keeps that fraction of records per
+  category – the leading "[TAG]" of the message template, or the logger
+  name – for chatty, frame-level events.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+
+call_sid_var:   contextvars.ContextVar[str | None] = contextvars.ContextVar("call_sid", default=None)
+stream_sid_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("stream_sid", default=None)
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def bind_call(call_sid: str | None = None, stream_sid: str | None = None) -> None:
+    """Tag every record logged from this task (and tasks it starts later)."""
+    if call_sid is not None:
+        call_sid_var.set(call_sid)
+    if stream_sid is not None:
+        stream_sid_var.set(stream_sid)
+
+
+def category(record: logging.LogRecord) -> str:
+    """"[TAG] …" template prefix, else the logger name; never formats the message."""
+    msg = record.msg
+    if isinstance(msg, str) and msg.startswith("["):
+        end = msg.find("]", 1, 32)
+        if end > 0:
+            return msg[1:end]
+    return record.name
+
+
+def parse_sample_rates(spec: str) -> dict[str, float]:
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, rate = part.partition("=")
+        rates[name.strip()] = float(rate or 1)
+    return rates
+
+
+# ======================================================================
+#  Filters / formatter
+# ======================================================================
+class _ContextFilter(logging.Filter):
+    """
+    Attached to the QueueHandler, so it runs in the caller's thread and
+    task before the record is queued – the contextvars are the caller's.
+    """
+
+    def filter(self, record):
+        record.call_sid   = call_sid_var.get()
+        record.stream_sid = stream_sid_var.get()
+        return True
+
+
+class SampleFilter(logging.Filter):
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if not self.rates or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(category(record))
+        return rate is None or (rate > 0 and random.random() < rate)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        out = {
+            "ts":     self.formatTime(record),
+            "level":  record.levelname,
+            "logger": record.name,
+            "msg":    record.getMessage(),
+        }
+        if getattr(record, "call_sid", None):
+            out["call_sid"] = record.call_sid
+        if getattr(record, "stream_sid", None):
+            out["stream_sid"] = record.stream_sid
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler.prepare() formats the message in the caller's thread;
+    here only tracebacks are rendered up-front (they can't cross threads
+    safely) and `msg % args` is left to the listener – unless an arg is
+    mutable (a dict, a list, an object): the caller may change it before
+    the listener gets to it, so those records are formatted now.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if record.args and not _frozen(record.args):
+            record.msg  = record.getMessage()
+            record.args = None
+        return record
+
+
+_SCALARS = (str, bytes, int, float, bool, type(None))
+
+
+def _frozen(args) -> bool:
+    """args that read the same later, on the listener thread"""
+    if isinstance(args, _SCALARS):
+        return True
+    if isinstance(args, tuple):
+        return all(_frozen(a) for a in args)
+    return False
+
+
+class WsFrameFilter(logging.Filter):
+    """
+    Drop websockets' per-frame DEBUG lines for audio-carrying data frames
+    ("> %s" / "< %s" with a TEXT/BINARY Frame arg) by looking at the
+    template and the frame's opcode – the payload is never stringified.
+    Pings, pongs and handshake lines pass.
+    """
+
+    def filter(self, record):
+        if record.levelno != logging.DEBUG or record.msg not in ("> %s", "< %s") or not record.args:
+            return True
+        opcode = getattr(record.args[0], "opcode", None)
+        return getattr(opcode, "name", "") not in ("TEXT", "BINARY")
+
+
+# ======================================================================
+#  Setup
+# ======================================================================
+def setup(level: str | None = None, fmt: str | None = None, sample: str | None = None) -> None:
+    global _listener
+    level  = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    fmt    = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+    sample = sample if sample is not None else os.getenv("LOG_SAMPLE", "")
+
+    out = logging.StreamHandler(sys.stdout)
+    out.setFormatter(
+        JsonFormatter() if fmt == "json"
+        else logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    )
+
+    q = _LazyQueueHandler(queue.SimpleQueue())
+    q.addFilter(SampleFilter(parse_sample_rates(sample)))
+    q.addFilter(_ContextFilter())
+
+    root = logging.getLogger()
+    for h in root.handlers[:]:
+        root.removeHandler(h)
+    root.addHandler(q)
+    root.setLevel(level)
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(q.queue, out, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Flush what's queued; safe to call twice."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,331 @@
+"""
+Hot-path frame codec for the Twilio <-> OpenAI Realtime media relay.
+
+Twilio sends ~50 `media` frames per second per call and OpenAI answers
+with a similar stream of `response.audio.delta` frames.  Both carry one
+base64 string we only have to *move*, so instead of json.loads → dict →
+json.dumps we recognise those frames by their fixed prefix and splice
+the payload into a prebuilt template.  Anything that doesn't match the
+fast path (start/stop/marks, tool calls, transcripts …) falls back to a
+real JSON parse, using orjson when it is installed.
+"""
+
+import asyncio
+import base64
+import json
+from collections import deque
+
+try:                                    # optional: ~3-5× faster parse of the slow-path frames
+    import orjson as _orjson
+except ImportError:                     # pragma: no cover - depends on the deploy image
+    _orjson = None
+
+
+if _orjson is not None:
+    json_loads = _orjson.loads
+
+    def json_dumps(obj) -> str:
+        return _orjson.dumps(obj).decode()
+else:
+    json_loads = json.loads
+
+    def json_dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+
+# ── frame prefixes as the two peers actually serialise them ───────────
+_TWILIO_MEDIA_PREFIX = '{"event":"media"'
+_OPENAI_DELTA_PREFIX = '{"type":"response.audio.delta"'
+_PAYLOAD_KEY = '"payload":"'
+_DELTA_KEY   = '"delta":"'
+
+_APPEND_HEAD = '{"type":"input_audio_buffer.append","audio":"'
+_APPEND_TAIL = '"}'
+_MEDIA_TAIL  = '"}}'
+
+
+def str_field(raw: str, key: str, start: int = 0) -> str | None:
+    """
+    Cheap extraction of a flat string field (`"key":"value"`) from a raw
+    JSON frame.  Returns None when the key is missing or the value holds
+    an escape sequence – callers then fall back to a full parse.
+    """
+    i = raw.find(key, start)
+    if i < 0:
+        return None
+    i += len(key)
+    j = raw.find('"', i)
+    if j < 0:
+        return None
+    value = raw[i:j]
+    return None if "\\" in value else value
+
+
+def twilio_media_payload(raw: str) -> str | None:
+    """base64 µ-law of a Twilio `media` frame, or None if `raw` is anything else"""
+    if not raw.startswith(_TWILIO_MEDIA_PREFIX):
+        return None
+    return str_field(raw, _PAYLOAD_KEY, len(_TWILIO_MEDIA_PREFIX))
+
+
+def openai_audio_delta(raw: str) -> str | None:
+    """base64 audio of a `response.audio.delta` frame, or None if `raw` is anything else"""
+    if not raw.startswith(_OPENAI_DELTA_PREFIX):
+        return None
+    return str_field(raw, _DELTA_KEY, len(_OPENAI_DELTA_PREFIX))
+
+
+def append_frame(payload: str) -> str:
+    """`input_audio_buffer.append` message for the Realtime socket"""
+    return _APPEND_HEAD + payload + _APPEND_TAIL
+
+
+def media_frame_prefix(stream_sid: str) -> str:
+    """Everything of a Twilio outbound `media` frame up to the payload; build once per stream."""
+    return '{"event":"media","streamSid":' + json.dumps(stream_sid) + ',"media":{"payload":"'
+
+
+def media_frame(prefix: str, payload: str) -> str:
+    """Twilio outbound `media` frame from a media_frame_prefix() and a base64 payload"""
+    return prefix + payload + _MEDIA_TAIL
+
+
+# ======================================================================
+#  Uplink batching: N × 20 ms Twilio frames → one input_audio_buffer.append
+# ======================================================================
+def _ulaw_level_table() -> bytes:
+    """µ-law byte → |linear sample| >> 8  (0 = silence … 125 = full scale)"""
+    out = bytearray(256)
+    for b in range(256):
+        u = ~b & 0xFF
+        exp, mant = (u >> 4) & 0x07, u & 0x0F
+        out[b] = ((((mant << 3) + 0x84) << exp) - 0x84) >> 8
+    return bytes(out)
+
+
+_ULAW_LEVEL = _ulaw_level_table()
+
+
+def ulaw_peak(chunk: bytes) -> int:
+    """Peak level of a µ-law chunk on the _ULAW_LEVEL scale; translate() keeps it in C."""
+    return max(chunk.translate(_ULAW_LEVEL), default=0)
+
+
+class UplinkBatcher:
+    """
+    Coalesces Twilio's 20 ms µ-law frames into fewer, larger appends.
+
+    push() buffers a frame and returns a ready-to-send append message once
+    `batch_ms` of audio is queued or the oldest queued frame is
+    `max_latency_ms` old (Twilio streams continuously, so checking on
+    arrival is enough).  When the caller starts talking after a quiet
+    spell the buffer is flushed at once and the next `onset_ms` go out
+    unbatched, so server VAD / barge-in see the first syllables with no
+    added delay.  flush() drains whatever is left (e.g. on `stop`).
+    """
+
+    BYTES_PER_MS = 8                       # 8 kHz, 1 byte per sample
+
+    def __init__(self, *, batch_ms: int = 80, max_latency_ms: int = 100,
+                 speech_level: int = 6, onset_ms: int = 200, quiet_ms: int = 300):
+        self.batch_bytes    = batch_ms * self.BYTES_PER_MS
+        self.max_latency    = max_latency_ms / 1000
+        self.speech_level   = speech_level
+        self.onset          = onset_ms / 1000
+        self.quiet          = quiet_ms / 1000
+        self._buf           = bytearray()
+        self._first_at      = 0.0
+        self._last_loud     = float("-inf")
+        self._passthrough_until = float("-inf")
+        # per-call counters
+        self.frames_in = 0
+        self.sends     = 0
+        self.bytes_in  = 0
+        self.bytes_out = 0
+
+    def push(self, payload_b64: str, now: float) -> str | None:
+        chunk = base64.b64decode(payload_b64)
+        self.frames_in += 1
+        self.bytes_in  += len(chunk)
+        if not self._buf:
+            self._first_at = now
+        self._buf += chunk
+
+        if ulaw_peak(chunk) >= self.speech_level:
+            if now - self._last_loud > self.quiet:        # speech onset
+                self._passthrough_until = now + self.onset
+            self._last_loud = now
+
+        if (now < self._passthrough_until
+                or len(self._buf) >= self.batch_bytes
+                or now - self._first_at >= self.max_latency):
+            return self.flush()
+        return None
+
+    def flush(self) -> str | None:
+        if not self._buf:
+            return None
+        self.sends     += 1
+        self.bytes_out += len(self._buf)
+        frame = append_frame(base64.b64encode(self._buf).decode())
+        self._buf.clear()
+        return frame
+
+    def stats(self) -> dict:
+        return {
+            "frames_in": self.frames_in,
+            "sends":     self.sends,
+            "bytes_in":  self.bytes_in,
+            "bytes_out": self.bytes_out,
+        }
+
+
+# ======================================================================
+#  Downlink playout: paced AI audio, Twilio marks, precise barge-in
+# ======================================================================
+def b64_ms(payload_b64: str) -> float:
+    """Duration of a base64 µ-law payload (8 bytes per ms) without decoding it."""
+    n = len(payload_b64)
+    pad = payload_b64.endswith("==") + payload_b64.endswith("=") if n else 0
+    return (n * 3 // 4 - pad) / UplinkBatcher.BYTES_PER_MS
+
+
+class Playout:
+    """
+    Per-call queue between OpenAI audio deltas and the Twilio socket.
+
+    The pacer keeps at most `lead_ms` of audio buffered on Twilio's side
+    (so a barge-in has little to throw away) and follows every chunk with
+    a Twilio `mark`.  Marks coming back tell us exactly which chunk the
+    caller has heard; together with the send clock that gives the played
+    offset inside the current item, which is what
+    `conversation.item.truncate` needs.
+
+        playout = Playout(websocket.send_text)
+        playout.bind(stream_sid)               # on Twilio `start`
+        task = asyncio.create_task(playout.run())
+        playout.enqueue(item_id, delta)        # per response.audio.delta
+        playout.on_mark(name)                  # per Twilio `mark`
+        cut = await playout.interrupt()        # on speech_started → (item_id, audio_end_ms) | None
+    """
+
+    def __init__(self, send, *, lead_ms: int = 200, on_first_send=None):
+        self._send      = send
+        self._on_first_send = on_first_send     # e.g. a metrics hook for time-to-first-audio
+        self.lead       = lead_ms / 1000
+        self._prefix    = ""
+        self._mark_head = ""
+        self._clear     = ""
+        self._queue: deque = deque()            # (item_id, payload, ms)
+        self._inflight: deque = deque()         # (seq, item_id, item_end_ms, ms) sent, not yet heard
+        self._item_sent: dict[str, float] = {}  # item_id → ms handed to Twilio
+        self._dropped: set[str] = set()         # items cut by a barge-in (never None)
+        self._deadline  = 0.0                   # loop time Twilio finishes what we sent
+        self._seq       = 0
+        self._wake      = asyncio.Event()
+        self.chunks_sent = 0
+        self.marks_heard = 0
+
+    def bind(self, stream_sid: str) -> None:
+        self._prefix    = media_frame_prefix(stream_sid)
+        sid = json.dumps(stream_sid)
+        self._mark_head = '{"event":"mark","streamSid":' + sid + ',"mark":{"name":"'
+        self._clear     = '{"event":"clear","streamSid":' + sid + '}'
+
+    # ── producer side ────────────────────────────────────────────────
+    def enqueue(self, item_id: str | None, payload_b64: str) -> bool:
+        """Queue a delta; False when it belongs to an item the caller interrupted."""
+        if item_id in self._dropped:
+            return False
+        self._queue.append((item_id, payload_b64, b64_ms(payload_b64)))
+        self._wake.set()
+        return True
+
+    @property
+    def active(self) -> bool:
+        """True while AI audio is queued here or still playing on Twilio's side."""
+        return bool(self._queue) or self._buffered() > 0
+
+    def _buffered(self) -> float:
+        return max(0.0, self._deadline - asyncio.get_event_loop().time())
+
+    # ── pacer ────────────────────────────────────────────────────────
+    async def run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            if not self._queue:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            ahead = self._deadline - loop.time()
+            if ahead > self.lead:
+                await asyncio.sleep(ahead - self.lead)
+                continue
+
+            item_id, payload, ms = self._queue.popleft()
+            end = self._item_sent.get(item_id, 0.0) + ms
+            self._item_sent[item_id] = end
+            self._seq += 1
+            self._inflight.append((self._seq, item_id, end, ms))
+            self._deadline = max(loop.time(), self._deadline) + ms / 1000
+
+            await self._send(media_frame(self._prefix, payload))
+            await self._send(self._mark_head + str(self._seq) + '"}}')
+            self.chunks_sent += 1
+            if self.chunks_sent == 1 and self._on_first_send is not None:
+                self._on_first_send()
+
+    def on_mark(self, name: str) -> None:
+        """
+        Twilio finished playing everything up to mark `name`.  Marks are
+        sequence numbers; one older than the oldest chunk in flight was
+        sent before a `clear` (Twilio still echoes those) and is ignored.
+        """
+        self.marks_heard += 1
+        try:
+            seq = int(name)
+        except ValueError:
+            return                              # not one of ours
+        while self._inflight and self._inflight[0][0] <= seq:
+            self._inflight.popleft()
+
+    # ── barge-in ─────────────────────────────────────────────────────
+    def played_offset(self) -> tuple[str, int] | None:
+        """(item_id, ms the caller has heard of it) for the item playing right now."""
+        if self._inflight:
+            # un-heard chunks minus what the clock says is still buffered = progress into them
+            into = sum(c[3] for c in self._inflight) - self._buffered() * 1000
+            for _, item_id, end, ms in self._inflight:
+                if into < ms:
+                    return item_id, int(end - ms + max(0.0, into))
+                into -= ms
+            _, item_id, end, _ = self._inflight[-1]
+            return item_id, int(end)
+        if self._queue:
+            item_id = self._queue[0][0]
+            return item_id, int(self._item_sent.get(item_id, 0.0))
+        return None
+
+    async def interrupt(self) -> tuple[str, int] | None:
+        """
+        Caller started talking: drop queued audio, tell Twilio to `clear`
+        its buffer, and return where to truncate the interrupted item.
+        None when the AI wasn't audible.
+        """
+        if not self.active:
+            return None
+        cut = self.played_offset()
+        # an unidentified delta (item_id None) can't be told apart from the
+        # next response's, so it is never dropped – response.cancel stops it
+        for item_id, _, _ in self._queue:
+            if item_id is not None:
+                self._dropped.add(item_id)
+        for _, item_id, _, _ in self._inflight:
+            if item_id is not None:
+                self._dropped.add(item_id)
+        self._item_sent.pop(None, None)
+        self._queue.clear()
+        self._inflight.clear()
+        self._deadline = 0.0
+        await self._send(self._clear)
+        return cut
@@ -0,0 +1,231 @@
+"""
+In-process metrics with Prometheus text exposition (served on /metrics).
+
+Built for the media hot path: a labelled child is resolved once and then
+observe()/inc() is a bisect plus two list/float updates – no locks (one
+event loop per process), no allocation per observation.
+
+    FRAME = Histogram("relay_frame_seconds", "…", ("direction",), buckets=LATENCY_BUCKETS)
+    up = FRAME.labels("uplink")            # once per call / at import
+    up.observe(dt)                         # per frame
+"""
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+
+# seconds; tuned for "µs … s" spans of the relay
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASE_BUCKETS   = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+_REGISTRY: list["_Metric"] = []
+
+
+def _fmt(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = ()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._children: dict[tuple, object] = {}
+        _REGISTRY.append(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._child()
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        out = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._children.items():
+            out.extend(self._render_child(values, child))
+        return out
+
+
+# ======================================================================
+#  Counter / Gauge
+# ======================================================================
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, n: float = 1.0) -> None:
+        self.value += n
+
+    def dec(self, n: float = 1.0) -> None:
+        self.value -= n
+
+    def set(self, v: float) -> None:
+        self.value = v
+
+
+class Counter(_Metric):
+    kind = "counter"
+    _child = _Value
+
+    def inc(self, n: float = 1.0) -> None:       # unlabelled shortcut
+        self.labels().inc(n)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_label_str(self.labelnames, values)} {_fmt(child.value)}"]
+
+
+class Gauge(Counter):
+    """Counter that may go down, or read `fn()` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = (), fn=None):
+        super().__init__(name, doc, labelnames)
+        self.fn = fn
+
+    def set(self, v: float) -> None:
+        self.labels().set(v)
+
+    def render(self):
+        if self.fn is not None:
+            self.labels().set(self.fn())
+        return super().render()
+
+
+# ======================================================================
+#  Histogram
+# ======================================================================
+class _Hist:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)        # last slot = +Inf
+        self.sum    = 0.0
+        self.count  = 0
+
+    def observe(self, v: float) -> None:
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.sum   += v
+        self.count += 1
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: tuple = (), *, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, doc, labelnames)
+
+    def _child(self):
+        return _Hist(self.buckets)
+
+    def observe(self, v: float) -> None:
+        self.labels().observe(v)
+
+    def _render_child(self, values, child):
+        out, acc = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), child.counts):
+            acc += n
+            le = f'le="{_fmt(bound)}"'
+            out.append(f"{self.name}_bucket{_label_str(self.labelnames, values, le)} {acc}")
+        labels = _label_str(self.labelnames, values)
+        out.append(f"{self.name}_sum{labels} {_fmt(child.sum)}")
+        out.append(f"{self.name}_count{labels} {child.count}")
+        return out
+
+
+def render() -> str:
+    """Prometheus text exposition format 0.0.4"""
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ======================================================================
+#  Relay metrics
+# ======================================================================
+LOOP_LAG = Histogram(
+    "relay_event_loop_lag_seconds",
+    "How late a periodic timer fired; > 20 ms means audio frames queue up",
+    buckets=LATENCY_BUCKETS,
+)
+CALL_PHASE = Histogram(
+    "relay_call_phase_seconds",
+    "Time from Twilio start to each milestone of a call",
+    ("phase",), buckets=PHASE_BUCKETS,
+)
+FRAME_LATENCY = Histogram(
+    "relay_frame_seconds",
+    "Time spent relaying one frame (receive → handed to the other socket / playout queue)",
+    ("direction",), buckets=LATENCY_BUCKETS,
+)
+BARGE_IN = Histogram(
+    "relay_barge_in_seconds",
+    "speech_started → Twilio clear + truncate sent",
+    buckets=LATENCY_BUCKETS,
+)
+REST_LATENCY = Histogram(
+    "relay_rest_seconds",
+    "Outbound REST call latency incl. retries",
+    ("service", "outcome"), buckets=LATENCY_BUCKETS,
+)
+CALLS_TOTAL = Counter("relay_calls_total", "Media streams handled", ())
+
+# pre-resolved children for the per-frame path
+UPLINK_FRAME   = FRAME_LATENCY.labels("uplink")
+DOWNLINK_FRAME = FRAME_LATENCY.labels("downlink")
+
+
+def rest_observe(service: str, started: float, ok: bool) -> None:
+    REST_LATENCY.labels(service, "ok" if ok else "error").observe(time.perf_counter() - started)
+
+
+class CallTimer:
+    """
+    Per-call milestones measured from Twilio `start`; each phase is
+    recorded once (first occurrence), so callers can mark() freely.
+    """
+
+    __slots__ = ("t0", "_seen")
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self._seen: set[str] = set()
+
+    def mark(self, phase: str) -> None:
+        if phase not in self._seen:
+            self._seen.add(phase)
+            CALL_PHASE.labels(phase).observe(time.perf_counter() - self.t0)
+
+
+async def watch_loop_lag(interval: float = 0.25) -> None:
+    """Sleep `interval` forever and record how late each wake-up is."""
+    loop = asyncio.get_event_loop()
+    while True:
+        t = loop.time()
+        await asyncio.sleep(interval)
+        lag = loop.time() - t - interval
+        LOOP_LAG.observe(max(0.0, lag))
+        if lag > 0.1:
+            logging.warning("[METRICS] event loop lagged %.0f ms", lag * 1000)
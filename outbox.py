@@ -0,0 +1,220 @@
+"""
+Durable outbox for call logs: SQLite (WAL) on local disk in front of a
+background flusher, so call teardown never waits on WordPress and a
+restart never loses a transcript.
+
+    box = Outbox("/tmp/kal-call-log.db", send=post_batch, batch=10)
+    await box.start()                                  # app startup
+    await box.put("call-CA123", {"transcript": [...], ...})
+    await box.close()                                  # app shutdown
+
+• put() is an INSERT OR IGNORE on the key, so enqueueing the same call
+  twice stores it once.
+• The flusher leases up to `batch` due rows, hands them to
+  `send(items) -> list[bool]` and deletes the ones that went through;
+  the rest are retried with full-jitter exponential backoff (capped, and
+  never dropped).  `items` are (key, record, tries) tuples so `send`
+  can look for an earlier, half-finished delivery before posting again;
+  `tries` counts failed attempts plus one for a lease that ran out or
+  was abandoned mid-send (leased_to > 0 on a row up for lease again).
+• Leases make it safe for several worker processes to share one file;
+  `lease` must outlast the slowest send(), or a row is sent twice.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key         TEXT PRIMARY KEY,
+    record      TEXT NOT NULL,
+    created     REAL NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    next_at     REAL NOT NULL,
+    leased_to   REAL NOT NULL DEFAULT 0,
+    last_error  TEXT
+)
+"""
+
+
+class Outbox:
+    def __init__(self, path: str, *, send, batch: int = 10, lease: float = 120,
+                 backoff_base: float = 2.0, backoff_cap: float = 600.0):
+        self.path         = path
+        self.send         = send
+        self.batch        = batch
+        self.lease        = lease
+        self.backoff_base = backoff_base
+        self.backoff_cap  = backoff_cap
+        self.sent         = 0
+        self.failed       = 0
+        self._db: sqlite3.Connection | None = None
+        self._lock  = threading.Lock()               # one connection, used from to_thread()
+        self._wake  = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    # ── storage (runs in a worker thread) ────────────────────────────
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None,
+                                 check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")      # WAL: durable across process crashes
+            db.execute(_SCHEMA)
+            self._db = db
+        return self._db
+
+    def _tx(self, fn):
+        """Run fn(db) inside BEGIN IMMEDIATE … COMMIT (the write lock is taken up-front)."""
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(db)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return out
+
+    def _put(self, key: str, record: dict) -> bool:
+        now = time.time()
+        with self._lock:
+            cur = self._conn().execute(
+                "INSERT OR IGNORE INTO outbox (key, record, created, next_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(record, ensure_ascii=False), now, now),
+            )
+        return cur.rowcount == 1
+
+    def _lease(self) -> list[tuple[str, dict, int]]:
+        now = time.time()
+
+        def lease(db):
+            rows = db.execute(
+                "SELECT key, record, attempts + (leased_to > 0) FROM outbox "
+                "WHERE next_at <= ? AND leased_to <= ? ORDER BY next_at LIMIT ?", (now, now, self.batch),
+            ).fetchall()
+            db.executemany("UPDATE outbox SET leased_to = ? WHERE key = ?",
+                           [(now + self.lease, key) for key, _, _ in rows])
+            return rows
+
+        rows = self._tx(lease)
+        return [(key, json.loads(record), attempts) for key, record, attempts in rows]
+
+    def _release(self, keys: list[str]) -> None:
+        """Give up a lease mid-send: due again now, still marked as possibly delivered."""
+        self._tx(lambda db: db.executemany("UPDATE outbox SET leased_to = 1 WHERE key = ?",
+                                           [(k,) for k in keys]))
+
+    def _settle(self, done: list[str], retry: list[tuple[str, int, str]]) -> None:
+        now = time.time()
+
+        def settle(db):
+            db.executemany("DELETE FROM outbox WHERE key = ?", [(k,) for k in done])
+            db.executemany(
+                "UPDATE outbox SET attempts = ?, next_at = ?, leased_to = 0, last_error = ? WHERE key = ?",
+                [(attempts, now + self._backoff(attempts), error, key) for key, attempts, error in retry],
+            )
+
+        self._tx(settle)
+
+    def _next_due(self) -> float | None:
+        with self._lock:
+            row = self._conn().execute("SELECT MIN(MAX(next_at, leased_to)) FROM outbox").fetchone()
+        return row[0]
+
+    def _stats(self) -> dict:
+        with self._lock:
+            pending, oldest, retrying = self._conn().execute(
+                "SELECT COUNT(*), MIN(created), SUM(attempts > 0) FROM outbox"
+            ).fetchone()
+        return {
+            "pending":    pending,
+            "retrying":   retrying or 0,
+            "oldest_age": round(time.time() - oldest, 1) if oldest else None,
+            "sent":       self.sent,
+            "failed":     self.failed,
+        }
+
+    def _backoff(self, attempts: int) -> float:
+        return random.uniform(self.backoff_base, min(self.backoff_cap, self.backoff_base * 2 ** attempts))
+
+    # ── async API ────────────────────────────────────────────────────
+    async def put(self, key: str, record: dict) -> bool:
+        """Durably queue `record`; False when `key` was already queued."""
+        added = await asyncio.to_thread(self._put, key, record)
+        self._wake.set()
+        return added
+
+    async def stats(self) -> dict:
+        return await asyncio.to_thread(self._stats)
+
+    async def flush_once(self) -> int:
+        """Send one leased batch; returns how many rows it held."""
+        items = await asyncio.to_thread(self._lease)
+        if not items:
+            return 0
+        try:
+            results = await self.send(items)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self._release, [key for key, _, _ in items])
+            raise
+        except Exception as exc:
+            logging.error("[OUTBOX] batch of %s failed: %r", len(items), exc)
+            results, error = [False] * len(items), repr(exc)
+        else:
+            error = "rejected"
+        done  = [key for (key, _, _), ok in zip(items, results) if ok]
+        retry = [(key, attempts + 1, error) for (key, _, attempts), ok in zip(items, results) if not ok]
+        self.sent   += len(done)
+        self.failed += len(retry)
+        for key, attempts, _ in retry:
+            logging.warning("[OUTBOX] %s not delivered (attempt %s) – will retry", key, attempts)
+        await asyncio.to_thread(self._settle, done, retry)
+        return len(items)
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()                       # a put() from here on wakes the wait below
+            try:
+                while await self.flush_once():
+                    pass
+                due = await asyncio.to_thread(self._next_due)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logging.error("[OUTBOX] flusher error: %r", exc)
+                due = time.time() + self.backoff_base
+            timeout = None if due is None else max(0.0, due - time.time())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self) -> None:
+        pending = (await self.stats())["pending"]
+        if pending:
+            logging.info("[OUTBOX] %s call log(s) left from a previous run", pending)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def close(self, drain_timeout: float = 5.0) -> None:
+        """Last flush attempt; whatever is left stays on disk for the next start."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)   # its send() releases its rows
+            self._task = None
+        try:
+            await asyncio.wait_for(self.flush_once(), drain_timeout)
+        except Exception as exc:
+            logging.warning("[OUTBOX] final flush incomplete: %r", exc)
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
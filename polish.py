@@ -0,0 +1,207 @@
+"""
+End-of-call CPU work – transcript polishing and call_log JSON encoding –
+and the process pool it runs in, away from the event loop that relays
+every other caller's audio.
+
+    pool = PolishPool(workers=2, max_pending=8, inline_below=200)
+    pool.start()                                         # app startup
+    bodies = await pool.run(encode_call_logs, items, size=n_lines)
+    await pool.close()                                   # app shutdown
+
+• workers=0, a job smaller than `inline_below` lines (IPC would cost
+  more than the work) or a broken pool run the function inline.
+• At most `max_pending` jobs are submitted at once; further callers wait
+  on the semaphore instead of piling pickled transcripts into the pool.
+• Workers come from a forkserver (preloaded with this module), never
+  from a fork of the app process with its logging thread, HTTP clients
+  and event loop, and log straight to stderr.  Under `python -m uvicorn`
+  / the supervisor they import nothing else; under `python app.py` each
+  worker imports app.py once as __mp_main__ at start() – the
+  `if __name__ == "__main__"` block keeps it from serving, and its
+  import-time setup is safe to repeat.
+• A job that takes longer than `timeout` is given up on: the pool is
+  torn down and the work runs inline, like with a broken pool, so a
+  hung worker can't hold the outbox flusher (and its lease) forever.
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import dedupe
+import textnorm
+
+
+# ======================================================================
+#  ULTRA-POLISH TRANSCRIPT REBUILDER
+#  Goal: perfect USER / AI turns, no stutters, no duplicates, sentences
+#        end with punctuation, and “It seems like It seems like” is gone.
+# ======================================================================
+_END     = set(".!?。！？")                     # sentence stops
+
+def _merge(lines):
+    """join consecutive chunks from same speaker & stitch until sentence end"""
+    out, buf, cur_spk = [], "", None
+    for seg in lines:
+        spk, piece = seg["speaker"], seg["text"].strip()
+        if not piece:
+            continue
+        if spk != cur_spk:
+            if buf:
+                out.append({"speaker": cur_spk, "text": buf.strip()})
+            cur_spk, buf = spk, piece
+        else:
+            buf += " " + piece
+        if buf and buf[-1] in _END:
+            out.append({"speaker": cur_spk, "text": buf.strip()})
+            buf = ""
+    if buf:
+        out.append({"speaker": cur_spk, "text": buf.strip()})
+    return out
+
+def _dedupe(lines, thresh=0.90):
+    """drop near-duplicate utterances, keep the longer copy"""
+    # MinHash/LSH candidates verified with the same ratio() ≥ thresh (see dedupe.py)
+    cleaned = dedupe.dedupe(lines, thresh, norm=textnorm.norm_transcript)
+    # ---------------------------------------------------------------
+    # 4) sanity-check the ends:
+    #    • if the very first fragment came from the AI, it was
+    #      almost certainly the answer to the *preceding* question
+    #      (the caller spoke first, it was transcribed a hair later).
+    #      In that case we drop that opening AI line so the dialog
+    #      always starts with the USER.
+    #    • if the very last fragment is from the USER (the caller
+    #      hung up before the AI could reply), drop that dangling
+    #      question so we don’t finish on an unanswered line.
+    # ---------------------------------------------------------------
+    if len(cleaned) >= 2 and cleaned[0]["speaker"] == "ai" and cleaned[1]["speaker"] == "user":
+        # rotate left: move the leading AI answer *after* its question
+        cleaned = cleaned[1:] + cleaned[:1]
+
+    # after rotation, if we *still* start with AI, it's a stray fragment
+    if cleaned and cleaned[0]["speaker"] == "ai":
+        cleaned.pop(0)
+
+    # drop trailing dangling USER with no AI reply
+    if cleaned and cleaned[-1]["speaker"] == "user":
+        cleaned.pop()
+
+    return cleaned
+
+
+
+
+def _enforce_turns(lines):
+    """guarantee perfect alternation; if AA or UU repeat, keep latest only"""
+    out=[]
+    for seg in lines:
+        seg["text"]=textnorm.collapse_stutter(seg["text"])
+        if out and out[-1]["speaker"]==seg["speaker"]:
+            out[-1]["text"]=seg["text"]          # overwrite previous
+        else:
+            out.append(seg)
+    return out
+
+def polish_transcript(raw: list[dict]) -> list[dict]:
+    """
+    Master pipeline:
+      1) merge -> 2) dedupe -> 3) enforce alternation & de-stutter
+    """
+    step1 = _merge(raw)
+    step2 = _dedupe(step1)
+    final = _enforce_turns(step2)
+    return final
+
+
+# ======================================================================
+#  call_log posts
+# ======================================================================
+def call_log_payload(key: str, record: dict) -> dict:
+    """The `call_log` post for one queued call."""
+    cleaned = record.get("turns")
+    if cleaned is None:
+        # queued by an older build as raw deltas: squash them the old way
+        cleaned = polish_transcript(record["transcript"])
+        logging.debug("[WP-SAVE] %s: %s raw → %s lines", key, len(record["transcript"]), len(cleaned))
+    return {
+        "title":   f"Call {record['started_at']}",
+        "slug":    key,
+        "status":  "publish",                # ← was  "private"
+        "content": json.dumps(cleaned, ensure_ascii=False),
+        "meta": {
+            "prompt_used": record["prompt"],
+            "call_sid":    record["call_sid"],
+            "owner_phone": record["phone"] or ""
+        }
+    }
+
+
+def encode_call_logs(items: list[tuple[str, dict]]) -> list[bytes]:
+    """(key, outbox record) → JSON body of each `call_log` post, UTF-8 encoded."""
+    return [json.dumps(call_log_payload(key, record), ensure_ascii=False).encode() for key, record in items]
+
+
+# ======================================================================
+#  Pool
+# ======================================================================
+def _worker_init() -> None:
+    # the QueueHandler app.py's import installed has no listener thread here
+    logging.basicConfig(level=logging.WARNING, force=True)
+
+
+class PolishPool:
+    def __init__(self, workers: int, *, max_pending: int = 8, inline_below: int = 200,
+                 timeout: float = 60.0):
+        self.workers      = workers
+        self.inline_below = inline_below
+        self.timeout      = timeout
+        self.submitted    = 0
+        self.inline       = 0
+        self._sem  = asyncio.Semaphore(max(1, max_pending))
+        self._pool: ProcessPoolExecutor | None = None
+
+    def start(self) -> None:
+        if self.workers > 0 and self._pool is None:
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload(["polish"])
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                             initializer=_worker_init)
+            for _ in range(self.workers):             # start every worker now, not on a hang-up
+                self._pool.submit(int)
+
+    async def run(self, fn, *args, size: int = 0):
+        """fn(*args) in a worker process; inline when the pool is off, broken, too slow or `size` is small."""
+        async with self._sem:
+            if self._pool is not None and size >= self.inline_below:
+                try:
+                    self.submitted += 1
+                    return await asyncio.wait_for(
+                        asyncio.get_running_loop().run_in_executor(self._pool, fn, *args), self.timeout)
+                except BrokenProcessPool as exc:
+                    self._discard(f"broke ({exc!r})")
+                except asyncio.TimeoutError:
+                    self._discard(f"job took over {self.timeout:.0f} s")
+            self.inline += 1
+            return fn(*args)
+
+    def _discard(self, why: str) -> None:
+        logging.error("[POLISH] worker pool %s – running inline from now on", why)
+        pool, self._pool = self._pool, None
+        if pool is not None:
+            # a hung worker never picks up the shutdown sentinel; the executor
+            # has no public kill, so end its processes directly
+            for proc in list((getattr(pool, "_processes", None) or {}).values()):
+                proc.kill()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {"workers": self.workers if self._pool is not None else 0,
+                "submitted": self.submitted, "inline": self.inline}
@@ -0,0 +1,357 @@
+"""
+Multi-process front for app.py:  one uvicorn worker per core behind a
+small CallSid-affine TCP proxy.
+
+    RELAY_WORKERS=auto python app.py          # or RELAY_WORKERS=4
+
+The relay is one event loop per process, so past a few dozen concurrent
+calls a single process starts to lag.  The supervisor listens on $PORT,
+starts N workers on 127.0.0.1:RELAY_WORKER_PORT+i and routes
+
+  • /incoming-call           by CallSid (form body), else the owner's To
+  • /media-stream/<CallSid>  by the same hash  → same worker as the webhook,
+                             which holds the parked Realtime socket
+  • any ?CallSid=…           by the same hash  (Twilio's GET callbacks)
+  • /cache/invalidate        to every worker (each keeps its own L1 cache)
+  • /health, /metrics        answered here, aggregated over all workers
+  • everything else          round-robin
+
+Plain HTTP requests are forwarded with `Connection: close`, so a reused
+client connection can't pin the next request to the wrong worker;
+websocket upgrades are spliced through untouched.  Crashed workers are
+restarted.
+
+Every media stream's bytes pass through the proxy, so one proxy loop
+would cap the whole box.  RELAY_PROXIES (default: one per four workers)
+proxy processes share $PORT through SO_REUSEPORT; routing is a pure hash
+of the request, so whichever proxy the kernel hands a connection to
+picks the same worker.  Off Linux (where SO_REUSEPORT doesn't spread
+connections across listeners) there is a single proxy.  For large deployments, put a real front proxy
+(nginx / HAProxy hashing on the CallSid in the path) in front of the
+workers' ports instead and run them without the supervisor.
+
+    python -m supervisor --proxy HOST PORT WORKERS   # one extra proxy, no workers
+"""
+
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import zlib
+from itertools import count
+from urllib.parse import parse_qs, urlsplit
+
+RELAY_WORKER_PORT = int(os.getenv("RELAY_WORKER_PORT", 9100))
+_MAX_HEAD = 64 * 1024
+_MAX_BODY = 1024 * 1024
+
+
+def worker_count(setting: str | None = None) -> int:
+    """RELAY_WORKERS: an int, or "auto" for one per core."""
+    setting = (setting if setting is not None else os.getenv("RELAY_WORKERS", "1")).strip().lower()
+    if setting == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(setting or 1))
+
+
+def proxy_count(workers: int, setting: str | None = None) -> int:
+    """RELAY_PROXIES: an int, or "auto" for one per four workers; 1 off Linux."""
+    if not (sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")):
+        return 1
+    setting = (setting if setting is not None else os.getenv("RELAY_PROXIES", "auto")).strip().lower()
+    if setting == "auto":
+        return max(1, workers // 4)
+    return max(1, int(setting or 1))
+
+
+def shard_for(key: str, n: int) -> int:
+    """Stable across processes and restarts (unlike hash())."""
+    return zlib.crc32(key.encode()) % n
+
+
+def route_key(path: str, body: bytes = b"") -> str | None:
+    """CallSid (or owner phone) a request belongs to, None when it has no affinity."""
+    parts = urlsplit(path)
+    if parts.path.startswith("/media-stream/"):
+        return parts.path.split("/")[2] or None
+    query = parse_qs(parts.query)
+    if query.get("CallSid"):
+        return query["CallSid"][0]
+    if parts.path == "/incoming-call" and body:
+        form = parse_qs(body.decode("latin-1"))
+        return (form.get("CallSid") or form.get("To") or [None])[0]
+    return None
+
+
+# ======================================================================
+#  HTTP head handling
+# ======================================================================
+def _parse_head(head: bytes) -> tuple[str, str, dict]:
+    lines = head.decode("latin-1").split("\r\n")
+    method, target, _ = lines[0].split(" ", 2)
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    return method, target, headers
+
+
+def _with_connection_close(head: bytes) -> bytes:
+    lines = [l for l in head.split(b"\r\n") if l and not l.lower().startswith(b"connection:")]
+    return b"\r\n".join(lines + [b"Connection: close", b"", b""])
+
+
+def _http_response(status: str, body: bytes, ctype: str = "application/json") -> bytes:
+    return (f"HTTP/1.1 {status}\r\nContent-Type: {ctype}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body
+
+
+# ======================================================================
+#  Supervisor
+# ======================================================================
+class Supervisor:
+    def __init__(self, app_ref: str | None, workers: int, *, host: str, port: int,
+                 base_port: int = RELAY_WORKER_PORT, proxies: int = 1):
+        self.app_ref  = app_ref              # None: proxy only, the workers belong to another process
+        self.n        = workers
+        self.proxies  = proxies
+        self.host     = host
+        self.port     = port
+        self.ports    = [base_port + i for i in range(workers)]
+        self.procs: list[asyncio.subprocess.Process | None] = [None] * workers
+        self.restarts = [0] * workers
+        self.proxy_procs: list[asyncio.subprocess.Process | None] = [None] * (proxies - 1)
+        self._rr      = count()
+        self._stopping = False
+
+    # ── workers ──────────────────────────────────────────────────────
+    async def _spawn(self, i: int) -> None:
+        env = {**os.environ, "RELAY_WORKER_INDEX": str(i), "RELAY_WORKERS": "1"}
+        self.procs[i] = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", self.app_ref,
+            "--host", "127.0.0.1", "--port", str(self.ports[i]),
+            env=env,
+        )
+        logging.info("[SUPERVISOR] worker %s pid=%s on :%s", i, self.procs[i].pid, self.ports[i])
+
+    async def _watch(self, i: int) -> None:
+        while not self._stopping:
+            await self._spawn(i)
+            code = await self.procs[i].wait()
+            if self._stopping:
+                return
+            self.restarts[i] += 1
+            logging.error("[SUPERVISOR] worker %s exited (%s) – restarting", i, code)
+            await asyncio.sleep(min(30, self.restarts[i]))
+
+    async def _watch_proxy(self, j: int) -> None:
+        restarts = 0
+        while not self._stopping:
+            proc = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "supervisor", "--proxy", self.host, str(self.port), str(self.n),
+            )
+            self.proxy_procs[j] = proc
+            code = await proc.wait()
+            if self._stopping:
+                return
+            restarts += 1
+            logging.error("[SUPERVISOR] proxy %s exited (%s) – restarting", j + 1, code)
+            await asyncio.sleep(min(30, restarts))
+
+    async def _wait_ready(self, i: int, timeout: float = 60) -> None:
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            try:
+                _, w = await asyncio.open_connection("127.0.0.1", self.ports[i])
+                w.close()
+                return
+            except OSError:
+                await asyncio.sleep(0.2)
+        logging.error("[SUPERVISOR] worker %s not listening after %ss", i, timeout)
+
+    # ── proxy ────────────────────────────────────────────────────────
+    def pick(self, path: str, body: bytes = b"") -> int:
+        key = route_key(path, body)
+        return shard_for(key, self.n) if key else next(self._rr) % self.n
+
+    async def _handle(self, creader: asyncio.StreamReader, cwriter: asyncio.StreamWriter) -> None:
+        try:
+            head = await creader.readuntil(b"\r\n\r\n")          # bounded by limit=_MAX_HEAD
+            method, target, headers = _parse_head(head)
+
+            path = urlsplit(target).path
+            body = b""
+            length = int(headers.get("content-length") or 0)
+            if length and path in ("/incoming-call", "/cache/invalidate"):
+                if length > _MAX_BODY:                   # a truncated body would stall the worker
+                    cwriter.write(_http_response("413 Payload Too Large", b'{"detail":"body too large"}'))
+                    await cwriter.drain()
+                    return
+                body = await creader.readexactly(length)
+
+            if path == "/health":
+                cwriter.write(_http_response("200 OK", json.dumps(await self.health()).encode()))
+                await cwriter.drain()
+                return
+            if path == "/metrics":
+                cwriter.write(_http_response("200 OK", await self.metrics(),
+                                             "text/plain; version=0.0.4; charset=utf-8"))
+                await cwriter.drain()
+                return
+            if path == "/cache/invalidate":
+                cwriter.write(await self._broadcast(_with_connection_close(head) + body))
+                await cwriter.drain()
+                return
+
+            upgrade = headers.get("upgrade", "").lower() == "websocket"
+            i = self.pick(target, body)
+            wreader, wwriter = await asyncio.open_connection("127.0.0.1", self.ports[i])
+            wwriter.write((head if upgrade else _with_connection_close(head)) + body)
+            await self._splice(creader, cwriter, wreader, wwriter)
+        except ConnectionRefusedError as exc:
+            logging.error("[SUPERVISOR] worker unreachable: %r", exc)
+            cwriter.write(_http_response("502 Bad Gateway", b'{"detail":"worker unavailable"}'))
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        except OSError as exc:
+            logging.error("[SUPERVISOR] worker unreachable: %r", exc)
+            cwriter.write(_http_response("502 Bad Gateway", b'{"detail":"worker unavailable"}'))
+        finally:
+            cwriter.close()
+
+    async def _splice(self, creader, cwriter, wreader, wwriter) -> None:
+        async def pipe(reader, writer):
+            try:
+                while data := await reader.read(65536):
+                    writer.write(data)
+                    await writer.drain()
+                if writer.can_write_eof():
+                    writer.write_eof()
+            except (ConnectionError, OSError):
+                pass
+
+        up = asyncio.ensure_future(pipe(creader, wwriter))
+        try:
+            await pipe(wreader, cwriter)       # the worker decides when the exchange is over
+        finally:
+            up.cancel()
+            wwriter.close()
+
+    async def _ask(self, i: int, request: bytes, timeout: float = 10) -> bytes:
+        r, w = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", self.ports[i]), timeout)
+        try:
+            w.write(request)
+            await w.drain()
+            return await asyncio.wait_for(r.read(), timeout)
+        finally:
+            w.close()
+
+    async def _broadcast(self, request: bytes) -> bytes:
+        replies = await asyncio.gather(*(self._ask(i, request) for i in range(self.n)),
+                                       return_exceptions=True)
+        ok = [r for r in replies if isinstance(r, bytes) and r]
+        return ok[0] if ok else _http_response("502 Bad Gateway", b'{"detail":"no worker answered"}')
+
+    async def health(self) -> dict:
+        async def one(i: int) -> dict:
+            info = {"worker": i, "port": self.ports[i]}
+            if self.app_ref is not None:                 # only the owner knows pids / restarts
+                info.update(restarts=self.restarts[i], pid=self.procs[i].pid if self.procs[i] else None)
+            try:
+                raw = await self._ask(i, b"GET /health HTTP/1.1\r\nHost: supervisor\r\n"
+                                         b"Connection: close\r\n\r\n", timeout=2)
+                info.update(json.loads(raw.split(b"\r\n\r\n", 1)[1]))
+            except Exception as exc:
+                info["status"] = f"down: {exc!r}"
+            return info
+
+        workers = await asyncio.gather(*(one(i) for i in range(self.n)))
+        up = [w for w in workers if w.get("status") == "ok"]
+        return {
+            "status":     "ok" if len(up) == self.n else ("degraded" if up else "down"),
+            "workers_up": len(up),
+            "workers":    workers,
+            "live_calls": sum(w.get("live_calls", 0) for w in up),
+        }
+
+    async def metrics(self) -> bytes:
+        """Every worker's /metrics, series labelled worker="i" and grouped per family."""
+        req = b"GET /metrics HTTP/1.1\r\nHost: supervisor\r\nConnection: close\r\n\r\n"
+        replies = await asyncio.gather(*(self._ask(i, req, timeout=5) for i in range(self.n)),
+                                       return_exceptions=True)
+        families: dict[str, list[str]] = {}          # "# HELP …" → [header lines…, series…]
+        for i, raw in enumerate(replies):
+            if not isinstance(raw, bytes) or b"\r\n\r\n" not in raw:
+                continue
+            family = None
+            for line in raw.split(b"\r\n\r\n", 1)[1].decode().splitlines():
+                if line.startswith("# HELP"):
+                    family = families.setdefault(line, [line])
+                elif line.startswith("#"):
+                    if family is not None and line not in family:
+                        family.append(line)
+                elif line and family is not None:
+                    series, value = line.rsplit(" ", 1)
+                    if series.endswith("}"):
+                        series = f'{series[:-1]},worker="{i}"}}'
+                    else:
+                        series = f'{series}{{worker="{i}"}}'
+                    family.append(f"{series} {value}")
+        return ("\n".join(l for lines in families.values() for l in lines) + "\n").encode()
+
+    # ── lifecycle ────────────────────────────────────────────────────
+    async def _listen(self) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._handle, self.host, self.port, limit=_MAX_HEAD,
+                                          reuse_port=self.proxies > 1 or None)
+
+    async def serve(self) -> None:
+        watchers = [asyncio.ensure_future(self._watch(i)) for i in range(self.n)]
+        await asyncio.gather(*(self._wait_ready(i) for i in range(self.n)))
+
+        server = await self._listen()
+        watchers += [asyncio.ensure_future(self._watch_proxy(j)) for j in range(self.proxies - 1)]
+        logging.info("[SUPERVISOR] %s workers behind %s:%s (%s proxies)",
+                     self.n, self.host, self.port, self.proxies)
+
+        async with server:
+            await _until_signalled()
+
+        self._stopping = True
+        children = [p for p in self.procs + self.proxy_procs if p]
+        for proc in children:
+            if proc.returncode is None:
+                proc.terminate()
+        await asyncio.gather(*(p.wait() for p in children), return_exceptions=True)
+        for w in watchers:
+            w.cancel()
+
+    async def serve_proxy(self) -> None:
+        """One more listener on the shared port; the workers are the parent's."""
+        async with await self._listen():
+            await _until_signalled()
+
+
+async def _until_signalled() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+
+def run(app_ref: str, *, host: str, port: int, workers: int) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    asyncio.run(Supervisor(app_ref, workers, host=host, port=port,
+                           proxies=proxy_count(workers)).serve())
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ["--proxy"]:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    _host, _port, _workers = sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+    # proxies=2: only "the port is shared" matters here
+    asyncio.run(Supervisor(None, _workers, host=_host, port=_port, proxies=2).serve_proxy())
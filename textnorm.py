@@ -0,0 +1,51 @@
+"""
+Text normalisation for transcripts and destination labels.
+
+Two different jobs, two named normalisers (app.py used to define `_norm`
+twice, and the transcript one silently replaced the label one):
+
+    norm_transcript("It's  Café-time!")   → "its cafetime"     # utterance compare / dedupe
+    norm_label(" Front-Desk ")            → "frontdesk"        # destination lookup, None → ""
+    collapse_stutter("the the way it seems like it seems like")
+                                          → "the way it seems like"
+
+Every pattern is compiled once at import, and the functions are
+lru_cache'd: a call's transcript is normalised over and over (dedupe
+candidates, repeat checks), and the same few labels on every redirect.
+ASCII input, the common case, skips the NFKD fold.
+"""
+
+import re
+import string
+import unicodedata
+from functools import lru_cache
+
+_PUNCT          = str.maketrans("", "", string.punctuation + "。、「」、．，！？」’“”’")
+_RE_SPC         = re.compile(r"\s+")
+_RE_NON_WORD    = re.compile(r"[^\w]")
+_STUTTER        = re.compile(r"\b(\w{1,4})( \1\b)+", flags=re.I)                # he he he
+_PHRASE_STUTTER = re.compile(r"\b((?:\w+\s+){1,3}\w+)(?:\s+\1\b)+", flags=re.I)  # it seems like it seems like
+
+
+@lru_cache(maxsize=65536)
+def norm_transcript(txt: str) -> str:
+    """accent-folded, punctuation-free, lower-case, single-spaced"""
+    if not txt.isascii():
+        txt = unicodedata.normalize("NFKD", txt).encode("ascii", "ignore").decode()
+    return _RE_SPC.sub(" ", txt.translate(_PUNCT).lower()).strip()
+
+
+@lru_cache(maxsize=4096)
+def norm_label(text: str | None) -> str:
+    """lower-case, spaces and punctuation removed → for fuzzy compare of labels"""
+    return _RE_NON_WORD.sub("", text or "").lower()
+
+
+@lru_cache(maxsize=65536)
+def collapse_stutter(txt: str) -> str:
+    """
+    Remove single-word or 2–3-word stutters inside one sentence:
+       'It seems like it seems like' → 'It seems like'
+    """
+    # once for 1-word loops (‘the the’), again for 2–3-word loops
+    return _PHRASE_STUTTER.sub(r"\1", _STUTTER.sub(r"\1", txt))
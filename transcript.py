@@ -0,0 +1,110 @@
+"""
+Streaming transcript assembly for one call.
+
+The Realtime API already says which words belong together: every caller
+utterance and every AI reply is a conversation item, its text arrives as
+`*.delta` events tagged with the item_id and is closed by one final
+event (`…transcription.completed`, `response.audio_transcript.done`,
+`response.text.done`, `response.content_part.done`) carrying the full
+text.  So instead of collecting loose fragments and fuzzy-deduping them
+after hang-up, the builder files each fragment under its item:
+
+    tb = TranscriptBuilder(clean=textnorm.collapse_stutter, norm=textnorm.norm_transcript)
+    tb.reserve(item_id, "user")                 # input_audio_buffer.committed – fixes the order
+    tb.delta("ai", "Hel", item_id=…)            # per delta, O(1)
+    tb.final("ai", "Hello there.", item_id=…)   # supersedes the deltas
+    tb.turns()                                  # [{"speaker", "text"}, …]  O(total text)
+
+An item's text is the final text when one arrived, else its deltas
+joined (a reply cut short by barge-in never gets a final).  Finished
+items are cleaned and normalised once, when their final arrives, so
+turns() at teardown only walks the list.
+"""
+
+
+class _Item:
+    __slots__ = ("speaker", "deltas", "text", "canon")
+
+    def __init__(self, speaker: str):
+        self.speaker = speaker
+        self.deltas: list[str] = []
+        self.text:  str | None = None          # cleaned text, set once finished
+        self.canon: str | None = None          # norm(text), cached for the repeat check
+
+
+class TranscriptBuilder:
+    def __init__(self, *, clean=lambda s: s, norm=lambda s: s.lower()):
+        self.clean  = clean
+        self.norm   = norm
+        self.pieces = 0                                # fragments with text, for logs / truthiness
+        self._items: dict[str, _Item] = {}
+        self._order: list[_Item] = []
+        self._anon  = 0
+
+    def __bool__(self) -> bool:
+        return self.pieces > 0
+
+    def _item(self, speaker: str, item_id: str | None) -> _Item:
+        if item_id is None:
+            # no id (older event shapes): one running item per speaker stretch
+            last = self._order[-1] if self._order else None
+            if last is not None and last.speaker == speaker and last.text is None:
+                return last
+            self._anon += 1
+            item_id = f"~{self._anon}"
+        item = self._items.get(item_id)
+        if item is None:
+            item = self._items[item_id] = _Item(speaker)
+            self._order.append(item)
+        return item
+
+    def reserve(self, item_id: str, speaker: str) -> None:
+        """Claim the item's place in the conversation before its text exists."""
+        self._item(speaker, item_id)
+
+    def delta(self, speaker: str, text: str, item_id: str | None = None) -> None:
+        if text:
+            item = self._item(speaker, item_id)
+            if item.text is None:                      # late deltas after the final are noise
+                item.deltas.append(text)
+                self.pieces += 1
+
+    def final(self, speaker: str, text: str, item_id: str | None = None) -> None:
+        item = self._item(speaker, item_id)
+        if text.strip():
+            self.pieces += 1
+            self._finish(item, text)
+
+    def _finish(self, item: _Item, text: str) -> None:
+        item.text  = self.clean(text.strip())
+        item.canon = self.norm(item.text)
+        item.deltas.clear()
+
+    def turns(self) -> list[dict]:
+        """
+        USER / AI turns: consecutive items of one speaker are joined, an
+        item repeating the speaker's previous one verbatim (after
+        normalisation) is dropped, and the dialog starts with the caller
+        and never ends on an unanswered caller line.
+        """
+        out: list[dict] = []
+        last: dict[str, str] = {}                      # speaker → canon of their last item
+        for item in self._order:
+            if item.text is None:
+                joined = "".join(item.deltas).strip()
+                if not joined:
+                    continue
+                self._finish(item, joined)
+            if not item.text or last.get(item.speaker) == item.canon:
+                continue
+            last[item.speaker] = item.canon
+            if out and out[-1]["speaker"] == item.speaker:
+                out[-1]["text"] += " " + item.text
+            else:
+                out.append({"speaker": item.speaker, "text": item.text})
+
+        if out and out[0]["speaker"] == "ai":
+            out.pop(0)
+        if out and out[-1]["speaker"] == "user":
+            out.pop()
+        return out
@@ -0,0 +1,203 @@
+"""
+Disk-backed LRU for /preview-tts audio.
+
+Owners press "preview" over and over on the same (model, voice, text),
+so each distinct request is rendered by OpenAI once and afterwards
+served straight from a file:
+
+    cache = DiskLRU("/tmp/kal-tts", max_bytes=256 << 20)
+    key   = DiskLRU.key("tts-1", "alloy", "Hello!")
+    hit   = await cache.get(key)               # (path, media_type) | None
+    path  = cache.put(key, audio, "audio/mpeg")
+
+A miss is streamed rather than rendered whole: the producer feeds the
+upstream body into a Tee, every browser asking for the same key reads
+from it as chunks arrive, and the bytes are written to tmp_path() on
+the way and commit()ed once the body is complete.
+
+Files are named <sha256>.<ext>; the in-memory index (rebuilt from the
+directory, oldest mtime first, on start) keeps LRU order and the byte
+total, and put() evicts from the cold end until the budget fits.  Temp
+files carry the writer's pid, so a starting worker only sweeps its own
+and those of processes that are gone, never another live worker's.
+"""
+
+import asyncio
+import hashlib
+import json
+import mimetypes
+import os
+from collections import OrderedDict
+
+_EXT = {"audio/mpeg": "mp3", "audio/wav": "wav", "audio/ogg": "ogg", "audio/opus": "opus",
+        "audio/aac": "aac", "audio/flac": "flac", "audio/pcm": "pcm"}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:                             # exists, someone else's
+        return True
+    return True
+
+
+def _touch(path: str) -> bool:
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+class DiskLRU:
+    def __init__(self, directory: str, *, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.bytes  = 0
+        self.hits   = 0
+        self.misses = 0
+        self._index: OrderedDict = OrderedDict()        # key → (path, size, media_type)
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode()).hexdigest()
+
+    def _load(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                # <key>.<ext>.<pid>.tmp – a write that never finished, unless its writer is alive
+                pid = name[:-4].rsplit(".", 1)[-1]
+                if not pid.isdigit() or int(pid) == os.getpid() or not _pid_alive(int(pid)):
+                    os.remove(path)
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, name.split(".", 1)[0], path, st.st_size))
+        for _, key, path, size in sorted(entries):
+            media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            self._index[key] = (path, size, media_type)
+            self.bytes += size
+        self._evict()
+
+    async def get(self, key: str) -> tuple[str, str] | None:
+        entry = self._index.get(key)
+        # the touch (keeps LRU order across restarts) doubles as the existence
+        # check – another worker sharing the directory may have evicted it
+        if entry is None or not await asyncio.to_thread(_touch, entry[0]):
+            if entry is not None and self._index.get(key) is entry:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._index.move_to_end(key)
+        self.hits += 1
+        return entry[0], entry[2]
+
+    def path_for(self, key: str, media_type: str) -> str:
+        return os.path.join(self.directory, f"{key}.{_EXT.get(media_type.split(';')[0], 'bin')}")
+
+    def tmp_path(self, key: str, media_type: str) -> str:
+        """Where to write an entry before commit(); swept on the next start if abandoned."""
+        return f"{self.path_for(key, media_type)}.{os.getpid()}.tmp"
+
+    def put(self, key: str, data: bytes, media_type: str) -> str:
+        tmp = self.tmp_path(key, media_type)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        return self.commit(key, tmp, media_type)
+
+    def commit(self, key: str, tmp: str, media_type: str) -> str:
+        """Move a fully written temp file into place and index it."""
+        path = self.path_for(key, media_type)
+        os.replace(tmp, path)
+        if key in self._index:
+            self._drop(key, unlink=False)
+        size = os.path.getsize(path)
+        self._index[key] = (path, size, media_type)
+        self.bytes += size
+        self._evict()
+        return path
+
+    def _drop(self, key: str, unlink: bool = True) -> None:
+        path, size, _ = self._index.pop(key)
+        self.bytes -= size
+        if unlink:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and len(self._index) > 1:
+            self._drop(next(iter(self._index)))
+
+    def stats(self) -> dict:
+        return {"entries": len(self._index), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+
+# ======================================================================
+#  Tee  –  one upstream body, any number of readers
+# ======================================================================
+class Tee:
+    """
+    Chunks of an in-flight upstream response.  The producer calls
+    start(media_type) once the headers are in, feed() per chunk and
+    finish() at the end (with the exception, if any); readers await
+    head() and then iterate read(), which replays what already arrived
+    and then follows live.  `readers` lets the owner cancel the producer
+    once nobody is listening anymore.
+    """
+
+    def __init__(self, key: str):
+        self.key        = key
+        self.media_type = ""
+        self.chunks: list[bytes] = []
+        self.done       = False
+        self.error: BaseException | None = None
+        self.readers    = 0
+        self.task: asyncio.Task | None = None
+        self._head = asyncio.get_running_loop().create_future()
+        self._more = asyncio.Event()
+
+    def start(self, media_type: str) -> None:
+        self.media_type = media_type
+        if not self._head.done():
+            self._head.set_result(media_type)
+
+    def feed(self, chunk: bytes) -> None:
+        self.chunks.append(chunk)
+        self._wake()
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.done, self.error = True, error
+        if not self._head.done():
+            if error is None:
+                self._head.set_result(self.media_type)
+            else:
+                self._head.set_exception(error)
+                self._head.exception()               # retrieved: nobody may be waiting
+        self._wake()
+
+    def _wake(self) -> None:
+        more, self._more = self._more, asyncio.Event()
+        more.set()
+
+    async def head(self) -> str:
+        """media_type once the upstream answered; raises the producer's error."""
+        return await asyncio.shield(self._head)
+
+    async def read(self):
+        i = 0
+        while True:
+            while i < len(self.chunks):
+                yield self.chunks[i]
+                i += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._more.wait()